@@ -0,0 +1,65 @@
+'''
+Batch file opening and option reading shared by SeaTurtle (myshell.py) and
+MyShell (myshell2.py)
+'''
+import sys
+from types import SimpleNamespace
+
+
+def open_batch(filename):
+
+    '''\nOpens a batch file for reading, "-" reads from standard input\n'''
+    if filename == '-':
+        # a producer process can pipe commands straight into the shell
+        return sys.stdin
+    return open(filename, 'r')
+
+
+def quick_options(argv):
+
+    '''\nReads the usual command lines, "[-j N] [-E] [--check] [file]", \
+without argparse, which takes longer to import than a short batch file \
+takes to run. Returns None for anything else so argparse can handle it\n'''
+    options = SimpleNamespace(file=None, jobs=1, external=False,
+                              check=False, asynchronous=False, command=None,
+                              serve=None, parallel=None)
+    args = iter(argv)
+    for arg in args:
+        if arg in ('-E', '--external'):
+            options.external = True
+            continue
+        elif arg == '--check':
+            options.check = True
+            continue
+        elif arg in ('-j', '--jobs'):
+            arg = next(args, '')
+        elif arg.startswith('-j'):
+            arg = arg[2:]
+        elif arg.startswith('--jobs='):
+            arg = arg[7:]
+        elif options.file is None and (arg == '-' or not arg.startswith('-')):
+            options.file = arg
+            continue
+        else:
+            return None
+        if not arg.isdigit():
+            return None
+        options.jobs = int(arg)
+    return options
+
+
+def read_files(parser, options):
+
+    '''\nSets options.file from the batch files argparse read and checks \
+-P, several files without -P run one at a time as with -P 1\n'''
+    options.file = options.files[0] if options.files else None
+    if len(options.files) > 1 and options.parallel is None:
+        options.parallel = 1
+    if options.parallel is None:
+        return
+    if not options.files:
+        parser.error('-P needs the batch files to run')
+    if '-' in options.files:
+        parser.error("-P can't read a batch file from standard input")
+    if options.parallel < 1:
+        parser.error('-P needs at least one file at a time')
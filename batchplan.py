@@ -0,0 +1,330 @@
+'''
+Compiled batch files for SeaTurtle (myshell.py) and MyShell (myshell2.py).
+A batch file is parsed once into a plan, kept in a cache directory under the
+file's device, inode, size and modification time, so running the same file
+again reads its parsed commands back instead of parsing every line. The
+file's bytes are still checked against the plan a chunk at a time as they
+are run, and --check reports the lines that can't run without running any
+of them
+'''
+import hashlib
+import marshal
+import os
+import sys
+
+from cmdparse import ParseError, link, parse
+from environment import child_env
+from pathcache import command_hash
+from timing import split_time
+
+# Changed whenever the parser or the layout of a plan changes,
+# so plans written before are no longer used
+PLAN_VERSION = 2
+
+# The first record of every plan
+HEADER = ('SeaTurtle plan', PLAN_VERSION)
+
+# Lines in each marshalled record of a plan
+CHUNK_SIZE = 1024
+
+# Bytes in front of each record that give its length
+LENGTH_SIZE = 4
+
+# Number of plans kept, the least recently used are removed
+PLAN_LIMIT = 256
+
+# Bytes a single plan may take, a larger batch file is only parsed
+PLAN_SIZE_LIMIT = 8 * 1024 * 1024
+
+# Bytes every plan together may take
+CACHE_SIZE_LIMIT = 64 * 1024 * 1024
+
+
+def cache_dir():
+
+    '''\nReturns the directory plans are kept in\n'''
+    base = os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'seaturtle', 'plans')
+
+
+def chunk_hash(data=b''):
+    # what a plan records of the bytes each chunk was parsed from
+    return hashlib.blake2b(data, digest_size=16)
+
+
+def plan_key(f):
+
+    '''\nReturns the key a batch file's plan is kept under and the file's \
+size, from its stat alone so none of the file is read to find the plan\n'''
+    st = os.fstat(f.fileno())
+    identity = f'{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}'
+    key = hashlib.blake2b(identity.encode(), digest_size=20).hexdigest()
+    return key, st.st_size
+
+
+def plan_path(key):
+
+    '''\nReturns where the plan of a batch file with the given key is kept, \
+marshal's format depends on the interpreter's version so it is part of \
+the name too\n'''
+    interpreter = f'{sys.implementation.name}{sys.version_info[0]}' \
+        f'{sys.version_info[1]}'
+    return os.path.join(cache_dir(),
+                        f'{key}-{interpreter}-{PLAN_VERSION}.plan')
+
+
+def write_record(f, value):
+
+    '''\nWrites a value to a plan with marshal, after its length\n'''
+    data = marshal.dumps(value)
+    f.write(len(data).to_bytes(LENGTH_SIZE, 'little'))
+    f.write(data)
+
+
+def read_record(f):
+
+    '''\nReads the next value of a plan, raises EOFError if it is cut short. \
+marshal.load would read a file a few bytes at a time\n'''
+    length = int.from_bytes(f.read(LENGTH_SIZE), 'little')
+    data = f.read(length)
+    if len(data) < length or not length:
+        raise EOFError('plan cut short')
+    return marshal.loads(data)
+
+
+def record(number, text, command):
+
+    '''\nReturns a parsed line as marshal can store it\n'''
+    if isinstance(command, ParseError):
+        return (number, text, None, str(command))
+    stages = tuple((stage.argv, stage.redirects)
+                   for stage in command.stages())
+    return (number, text, stages, command.background)
+
+
+def entry(record):
+
+    '''\nTurns a record back into (line number, text, Command or ParseError)\n'''
+    number, text, stages, extra = record
+    if stages is None:
+        return number, text, ParseError(extra)
+    return number, text, link(stages, extra)
+
+
+def parse_line(line):
+
+    '''\nReturns a line's text and its Command or ParseError, None for a \
+blank line or a comment\n'''
+    text = line.strip()
+    # blank lines are skipped
+    if not text:
+        return text, None
+    try:
+        # so are comments, which parse to None
+        return text, parse(text)
+    except ParseError as e:
+        return text, e
+
+
+def parse_lines(lines):
+
+    '''\nYields (line number, text, Command or ParseError) for each line \
+that has something to run, parsing them as they are read\n'''
+    for number, line in enumerate(lines, 1):
+        text, command = parse_line(line)
+        if command is not None:
+            yield number, text, command
+
+
+def read_plan(f):
+
+    '''\nYields the lines of a batch file opened with open_batch as \
+parse_lines does. A file is read back from its plan when it has one, \
+otherwise the plan is written as the file is parsed. Standard input and \
+files too large for a plan are only parsed\n'''
+    if f is sys.stdin or not f.seekable():
+        # a pipe can only be read once
+        yield from parse_lines(f)
+        return
+    key, size = plan_key(f)
+    if size > PLAN_SIZE_LIMIT:
+        # its plan would be larger still
+        yield from parse_lines(f)
+        return
+    path = plan_path(key)
+    # the lines and bytes of the file checked against the plan so far
+    number = offset = 0
+    try:
+        with open(path, 'rb') as plan:
+            if read_record(plan) != HEADER:
+                raise ValueError('not a plan')
+            # marks the plan as recently used
+            os.utime(plan.fileno())
+            for chunk in iter(lambda: read_record(plan), None):
+                lines, length, digest, records = chunk
+                # the file may have changed without its size or time
+                # changing, so each chunk is only run once its bytes match
+                if chunk_hash(f.buffer.read(length)).digest() != digest:
+                    raise ValueError('changed since the plan was written')
+                for line in records:
+                    yield entry(line)
+                number += lines
+                offset += length
+            if not f.buffer.read(1):
+                f.close()
+                return
+            raise ValueError('longer than its plan')
+    except FileNotFoundError:
+        pass
+    except (OSError, EOFError, ValueError, TypeError):
+        # the rest of the file is parsed, and the next run writes a new plan
+        remove(path)
+    f.buffer.seek(offset)
+    yield from compile_lines(f, path, number)
+
+
+def compile_lines(f, path, number=0):
+
+    '''\nParses a batch file as it is read, yielding the lines after line \
+number. A file read from its start is saved as a plan once its last line \
+has been read, one that stops early, e.g. at quit or Ctrl-C, leaves no \
+plan and the rest of it is never read\n'''
+    temp = open_plan(path) if number == 0 else None
+    # the chunk being built: lines, bytes, their hash and the parsed lines
+    lines = length = 0
+    digest = chunk_hash()
+    chunk = []
+    try:
+        for number, line in enumerate(f.buffer, number + 1):
+            text, command = parse_line(line.decode(f.encoding, f.errors))
+            if temp is not None:
+                lines += 1
+                length += len(line)
+                digest.update(line)
+                if command is not None:
+                    chunk.append(record(number, text, command))
+                if len(chunk) == CHUNK_SIZE:
+                    temp = write_chunk(temp, (lines, length, digest.digest(),
+                                              chunk))
+                    lines = length = 0
+                    digest = chunk_hash()
+                    chunk = []
+            if command is not None:
+                yield number, text, command
+        if temp is not None:
+            if lines:
+                temp = write_chunk(temp, (lines, length, digest.digest(),
+                                          chunk))
+            if temp is not None:
+                save_plan(temp, path)
+                temp = None
+    finally:
+        if temp is not None:
+            # a plan of part of the file is no use
+            temp.close()
+            remove(temp.name)
+        f.close()
+
+
+def open_plan(path):
+
+    '''\nOpens a temporary file for a new plan, None if it can't be written\n'''
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp = open(f'{path}.{os.getpid()}', 'wb')
+        write_record(temp, HEADER)
+        return temp
+    except OSError:
+        # plans are only a shortcut, the file is parsed as it is read
+        return None
+
+
+def write_chunk(temp, chunk):
+
+    '''\nAdds a chunk to a new plan, returns None once the plan has been \
+given up because it grew too large or couldn't be written\n'''
+    try:
+        write_record(temp, chunk)
+        if temp.tell() <= PLAN_SIZE_LIMIT:
+            return temp
+    except OSError:
+        pass
+    temp.close()
+    remove(temp.name)
+    return None
+
+
+def save_plan(temp, path):
+    # puts a finished plan in place of any older one
+    try:
+        write_record(temp, None)
+        temp.close()
+        os.replace(temp.name, path)
+    except OSError:
+        temp.close()
+        remove(temp.name)
+        return
+    prune(os.path.dirname(path))
+
+
+def prune(directory):
+
+    '''\nRemoves the least recently used plans past PLAN_LIMIT, or past \
+CACHE_SIZE_LIMIT bytes in all\n'''
+    plans = []
+    with os.scandir(directory) as entries:
+        for item in entries:
+            if item.name.endswith('.plan'):
+                try:
+                    info = item.stat()
+                except OSError:
+                    continue
+                plans.append((info.st_mtime, info.st_size, item.path))
+    # the most recently used are kept
+    plans.sort(reverse=True)
+    total = 0
+    for count, (mtime, size, path) in enumerate(plans):
+        total += size
+        if count >= PLAN_LIMIT or total > CACHE_SIZE_LIMIT:
+            remove(path)
+
+
+def remove(path):
+    # a plan another shell has already removed is fine
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def check(f, builtins):
+
+    '''\nReports each line of a batch file that can't run, without running \
+any: lines that don't parse, and commands that are neither in builtins \
+nor on $PATH, which only warns since the script may create them. Returns \
+2 if a line doesn't parse, otherwise 0\n'''
+    name = '-' if f is sys.stdin else f.name
+    status = 0
+    # commands already looked up, by name and environment
+    found = {}
+    for number, text, command in read_plan(f):
+        if isinstance(command, ParseError):
+            print(f'{name}:{number}: Error: {command}')
+            status = 2
+            continue
+        command, timed = split_time(command)
+        if command is None:
+            continue
+        for stage in command.stages():
+            # NAME=value words in front of the command can change $PATH
+            env, argv = child_env(stage.argv)
+            if not argv or argv[0] in builtins:
+                continue
+            key = (argv[0], env.get(b'PATH'))
+            if key not in found:
+                found[key] = command_hash.lookup(argv[0], env)
+            if found[key] is None:
+                print(f'{name}:{number}: Warning: '
+                      f'"{argv[0]}" is not a valid command')
+    return status
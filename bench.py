@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+'''
+Batch throughput benchmarks for SeaTurtle (myshell.py) and MyShell
+(myshell2.py): generates batch files for a few kinds of workload, runs each
+shell on them and reports commands per second, peak memory and start-up
+time, saved as JSON so two runs can be compared
+'''
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from launcher import exit_code, spawn
+from startup import wall_time
+
+# The shells benchmarked, relative to this file
+SHELLS = {
+          'SeaTurtle': 'myshell.py',
+          'MyShell': 'myshell2.py',
+         }
+
+# Files in the directory the large-output workload lists
+LISTED_FILES = 2000
+
+# Seconds between readings of a running shell's peak memory
+POLL_INTERVAL = 0.005
+
+
+def builtin_script(count):
+
+    '''\nYields the lines of a script of builtins with redirections\n'''
+    lines = (
+             'echo line {i} of the builtin workload >> builtin.log',
+             'echo {i} > last.txt',
+             'dir data > listing.txt',
+             'cd data',
+             'cd ..',
+             'environ >> env.log',
+            )
+    for i in range(count):
+        yield lines[i % len(lines)].format(i=i)
+
+
+def external_script(count):
+
+    '''\nYields the lines of a script that starts a process every line\n'''
+    lines = (
+             'true',
+             'echo {i} >> external.log',
+             'ls data > ls.txt',
+             'cat last.txt | wc -c >> external.log',
+            )
+    for i in range(count):
+        yield lines[i % len(lines)].format(i=i)
+
+
+def output_script(count):
+
+    '''\nYields the lines of a script whose builtins write a lot\n'''
+    lines = (
+             'dir -l data',
+             'environ',
+             'more big.txt',
+             'dir data',
+            )
+    for i in range(count):
+        yield lines[i % len(lines)]
+
+
+def coreutils_script(count):
+
+    '''\nYields the lines of a script of the small commands batch mode \
+runs in the shell unless given -E\n'''
+    lines = (
+             'mkdir -p tmp/made',
+             'cat last.txt >> cat.log',
+             'head -n 5 big.txt > head.txt',
+             'wc -l big.txt >> wc.log',
+             'true',
+             'rm -r tmp/made',
+            )
+    for i in range(count):
+        yield lines[i % len(lines)]
+
+
+# Workload name -> generator of its batch file's lines
+WORKLOADS = {
+             'builtin': builtin_script,
+             'external': external_script,
+             'output': output_script,
+             'coreutils': coreutils_script,
+            }
+
+
+def prepare(directory):
+
+    '''\nCreates the files the workloads use in directory\n'''
+    os.mkdir(os.path.join(directory, 'data'))
+    for i in range(LISTED_FILES):
+        open(os.path.join(directory, 'data', f'file{i:05}.txt'), 'w').close()
+    with open(os.path.join(directory, 'big.txt'), 'w') as f:
+        f.writelines(f'line {i} of the output workload\n' for i in range(2000))
+    with open(os.path.join(directory, 'last.txt'), 'w') as f:
+        f.write('0\n')
+
+
+def environment(directory):
+
+    '''\nReturns the environment the shells are run with\n'''
+    env = os.environ.copy()
+    # the shells build their prompt from these even in batch mode
+    env.setdefault('USER', 'bench')
+    env.setdefault('HOME', directory)
+    env['PWD'] = directory
+    return env
+
+
+def peak_memory(pid):
+
+    '''\nReturns the peak resident memory in KB a running process has used \
+so far, or 0 once it has exited or without /proc\n'''
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return 0
+
+
+def run(shell, script, directory, env, flags=()):
+
+    '''\nRuns a shell on a batch file, returns (seconds, peak RSS in KB)\n'''
+    start = time.perf_counter()
+    process = subprocess.Popen(
+                               [sys.executable, shell, *flags, script],
+                               cwd=directory,
+                               env=env,
+                               stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL
+                              )
+    # the child's ru_maxrss counts this process's memory too, as it shared
+    # it until exec, so the shell's own high water mark is read while it
+    # runs. It only grows, so at most the last interval's growth is missed
+    peaks = []
+    finished = threading.Event()
+
+    def watch():
+        while True:
+            peaks.append(peak_memory(process.pid))
+            if finished.wait(POLL_INTERVAL):
+                return
+
+    watcher = threading.Thread(target=watch, daemon=True)
+    watcher.start()
+    pid, status, usage = os.wait4(process.pid, 0)
+    seconds = time.perf_counter() - start
+    finished.set()
+    watcher.join()
+    process.returncode = exit_code(status)
+    if process.returncode:
+        print(f'Error: {os.path.basename(shell)} {os.path.basename(script)} '
+              f'exited with status {process.returncode}')
+    # without /proc the child's own figure is all there is
+    return seconds, max(peaks) or usage.ru_maxrss
+
+
+def benchmark(options):
+
+    '''\nRuns every chosen workload on every chosen shell, \
+returns the results\n'''
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = {
+               'python': platform.python_version(),
+               'platform': platform.platform(),
+               'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'commands': options.commands,
+               'external': options.external,
+               'shells': {},
+              }
+    with tempfile.TemporaryDirectory() as directory:
+        prepare(directory)
+        env = environment(directory)
+        empty = os.path.join(directory, 'empty.txt')
+        open(empty, 'w').close()
+        for name in options.shells:
+            shell = os.path.join(here, SHELLS[name])
+            shell_results = results['shells'][name] = {
+                'startup_ms': round(wall_time([shell, empty], env), 2),
+            }
+            for workload in options.workloads:
+                script = os.path.join(directory, workload + '.txt')
+                with open(script, 'w') as f:
+                    f.writelines(line + '\n' for line in
+                                 WORKLOADS[workload](options.commands))
+                # the fastest of the repeats is the least disturbed
+                flags = ['-E'] if options.external else []
+                runs = [run(shell, script, directory, env, flags)
+                        for _ in range(options.repeat)]
+                seconds = min(seconds for seconds, rss in runs)
+                shell_results[workload] = {
+                    'seconds': round(seconds, 4),
+                    'commands_per_sec': round(options.commands / seconds, 1),
+                    'peak_rss_kb': max(rss for seconds, rss in runs),
+                }
+                print(f'{name:10} {workload:10} '
+                      f'{shell_results[workload]["commands_per_sec"]:>10} '
+                      f'commands/s {shell_results[workload]["peak_rss_kb"]:>8} '
+                      f'KB', flush=True)
+            print(f'{name:10} {"startup":10} '
+                  f'{shell_results["startup_ms"]:>10} ms', flush=True)
+    return results
+
+
+def spawn_benchmark(count, grow):
+
+    '''\nStarts "true" count times with the shells' launcher and with \
+subprocess.Popen, after growing this process by grow MB the way a long \
+session's shell grows, returns the spawns per second of each\n'''
+    # written to, so the pages are really there for fork to copy
+    ballast = b'\1' * (grow * 1024 * 1024)
+    true = shutil.which('true')
+    starters = {
+                'subprocess': lambda: subprocess.Popen([true]),
+                'posix_spawn': lambda: spawn([true], true),
+               }
+    results = {'grow_mb': grow, 'count': count}
+    for name, start in starters.items():
+        begin = time.perf_counter()
+        for _ in range(count):
+            start().wait()
+        results[name] = round(count / (time.perf_counter() - begin), 1)
+        print(f'{name:12} {results[name]:>10} spawns/s with {grow} MB '
+              f'more memory', flush=True)
+    del ballast
+    return results
+
+
+def compare(old, new):
+
+    '''\nPrints each result of new next to the same one in old\n'''
+    print(f'{"":36}{"before":>12}{"after":>12}{"change":>9}')
+    for name, shell in new['shells'].items():
+        before = old['shells'].get(name, {})
+        rows = [('startup_ms', shell['startup_ms'], before.get('startup_ms'))]
+        for workload, result in shell.items():
+            if isinstance(result, dict):
+                for metric in ('commands_per_sec', 'peak_rss_kb'):
+                    was = before.get(workload, {}).get(metric)
+                    rows.append((f'{workload} {metric}', result[metric], was))
+        for label, now, was in rows:
+            change = f'{(now - was) / was:+.0%}' if was else ''
+            print(f'{name + " " + label:36}{"-" if was is None else was:>12}'
+                  f'{now:>12}{change:>9}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('-n', '--commands', type=int, default=2000,
+                        help='lines in each generated batch file')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='runs of each workload, the fastest is kept')
+    parser.add_argument('-s', '--shell', dest='shells', action='append',
+                        choices=SHELLS, help='shell to run, default both')
+    parser.add_argument('-w', '--workload', dest='workloads',
+                        action='append', choices=WORKLOADS,
+                        help='workload to run, default all of them')
+    parser.add_argument('-E', '--external', action='store_true',
+                        help='run the shells with -E, so cat, head, wc, '
+                             'true, mkdir and rm start processes')
+    parser.add_argument('-p', '--spawn', type=int, metavar='N',
+                        help='only time N spawns with each launcher')
+    parser.add_argument('-g', '--grow', type=int, default=0, metavar='MB',
+                        help='memory to add to the process before -p')
+    parser.add_argument('-o', '--output', metavar='FILE',
+                        help='save the results as JSON')
+    parser.add_argument('-c', '--compare', metavar='FILE',
+                        help='compare with the results saved in FILE')
+    options = parser.parse_args()
+    options.shells = options.shells or list(SHELLS)
+    options.workloads = options.workloads or list(WORKLOADS)
+    if options.spawn:
+        results = spawn_benchmark(options.spawn, options.grow)
+        if options.output:
+            with open(options.output, 'w') as f:
+                json.dump(results, f, indent=2)
+        return 0
+    results = benchmark(options)
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if options.compare:
+        with open(options.compare) as f:
+            compare(json.load(f), results)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+'''
+Runs a batch file or command on a SeaTurtle server started with
+"python3 myshell.py --serve PATH", as "python3 myshell.py" would run it
+here but without starting the shell again:
+
+    python3 client.py PATH [-j N] [-E] [--check] file|-|-c command
+
+Its output goes straight to this client's standard output and error, Ctrl-C
+interrupts it, and the client exits with its exit status
+'''
+import marshal
+import os
+import sys
+
+# socket imports selectors and the rest of the standard library's
+# networking, which takes longer than a short request takes to run
+import _socket
+
+# Bytes in front of a request that give its length, and the size of the
+# exit status sent back
+LENGTH_SIZE = 4
+
+# Bytes of each file descriptor passed with a request
+FD_SIZE = 4
+
+# Sent to the server for each Ctrl-C
+INTERRUPT = b'\x03'
+
+# The standard input, output and error passed to the server with a request
+STREAMS = (0, 1, 2)
+
+
+def send_request(sock, argv):
+
+    '''\nSends the shell's options, the current directory and environment \
+and the standard streams to a server\n'''
+    data = marshal.dumps({
+                          'argv': argv,
+                          'cwd': os.getcwd(),
+                          'env': dict(os.environ),
+                         })
+    message = len(data).to_bytes(LENGTH_SIZE, 'little') + data
+    fds = b''.join(fd.to_bytes(FD_SIZE, sys.byteorder) for fd in STREAMS)
+    # the descriptors go with the first bytes, a large environment may
+    # need more than one send
+    sent = sock.sendmsg([message], [(_socket.SOL_SOCKET, _socket.SCM_RIGHTS,
+                                     fds)])
+    sock.sendall(message[sent:])
+
+
+def read_status(sock):
+
+    '''\nWaits for the exit status of a request. Raises EOFError if the \
+server hung up first\n'''
+    data = sock.recv(LENGTH_SIZE, _socket.MSG_WAITALL)
+    if len(data) < LENGTH_SIZE:
+        raise EOFError('no exit status')
+    return int.from_bytes(data, 'little')
+
+
+def main(argv):
+    if len(argv) < 2:
+        print('usage: client.py PATH [-j N] [-E] [--check] file|-|-c command')
+        return 2
+    path, args = argv[0], argv[1:]
+    for fd in STREAMS:
+        try:
+            os.fstat(fd)
+        except OSError:
+            # a closed stream can't be passed on, /dev/null takes its place
+            os.open(os.devnull, os.O_RDWR)
+    sock = _socket.socket(_socket.AF_UNIX, _socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        send_request(sock, args)
+    except OSError as e:
+        print(f'Error: "{path}" {e.strerror.lower()}')
+        return 1
+    while True:
+        try:
+            return read_status(sock)
+        except KeyboardInterrupt:
+            # the server interrupts the request instead
+            sock.sendall(INTERRUPT)
+        except (OSError, EOFError):
+            print('Error: the server stopped before the request finished')
+            return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,171 @@
+'''
+Tokenizer and parser for command lines, shared by SeaTurtle (myshell.py)
+and MyShell (myshell2.py)
+'''
+from functools import lru_cache
+
+from redirect import OPERATORS
+
+# Characters that end an unquoted word
+METACHARACTERS = ' \t\n|&<>'
+
+# Number of distinct lines whose parse is remembered,
+# batch files tend to repeat the same few lines many times
+CACHE_SIZE = 4096
+
+
+class ParseError(ValueError):
+
+    '''\nRaised for a line that can't be parsed, the message says why\n'''
+
+
+class Command():
+
+    '''\nOne command of a parsed line: its arguments, its redirections as \
+(fd, flags, filename) and whether the line runs in the background. \
+Commands piped into another one point at it through pipe\n'''
+
+    __slots__ = ('argv', 'redirects', 'background', 'pipe')
+
+    def __init__(self, argv, redirects, background=False, pipe=None):
+        self.argv = argv
+        self.redirects = redirects
+        self.background = background
+        self.pipe = pipe
+
+    def stages(self):
+
+        '''\nYields this command and every command it is piped into\n'''
+        command = self
+        while command is not None:
+            yield command
+            command = command.pipe
+
+    def __str__(self):
+        # rebuilds the line, used when listing jobs
+        words = []
+        for stage in self.stages():
+            if words:
+                words.append('|')
+            words.extend(stage.argv)
+            for fd, flags, filename in stage.redirects:
+                words.extend((operator(fd, flags), filename))
+        return ' '.join(words)
+
+
+def operator(fd, flags):
+
+    '''\nReturns the redirection operator for a file descriptor and flags\n'''
+    for op, value in OPERATORS.items():
+        if value == (fd, flags):
+            return op
+
+
+def tokenize(line):
+
+    '''\nYields (word, is_operator) for each token of a line, \
+handling quotes, backslash escapes and comments\n'''
+    i = 0
+    n = len(line)
+    while i < n:
+        c = line[i]
+        if c in ' \t\n':
+            i += 1
+        elif c == '#':
+            # the rest of the line is a comment
+            return
+        elif line.startswith('2>>', i) or line.startswith('>>', i):
+            op = '2>>' if c == '2' else '>>'
+            yield op, True
+            i += len(op)
+        elif line.startswith('2>', i) or c in '|&<>':
+            op = '2>' if c == '2' else c
+            yield op, True
+            i += len(op)
+        else:
+            word, i = read_word(line, i)
+            yield word, False
+
+
+def read_word(line, i):
+
+    '''\nReads one word starting at line[i], returns it and the index after it\n'''
+    n = len(line)
+    word = []
+    while i < n and line[i] not in METACHARACTERS:
+        c = line[i]
+        if c == '\\':
+            # a backslash keeps the next character as it is
+            word.append(line[i+1:i+2])
+            i += 2
+        elif c == "'":
+            # nothing is special between single quotes
+            end = line.find("'", i + 1)
+            if end < 0:
+                raise ParseError('Unterminated quote')
+            word.append(line[i+1:end])
+            i = end + 1
+        elif c == '"':
+            # only \\ and \" are escapes between double quotes
+            i += 1
+            while i < n and line[i] != '"':
+                if line[i] == '\\' and line[i+1:i+2] in ('\\', '"'):
+                    i += 1
+                word.append(line[i])
+                i += 1
+            if i >= n:
+                raise ParseError('Unterminated quote')
+            i += 1
+        else:
+            word.append(c)
+            i += 1
+    return ''.join(word), i
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse(line):
+
+    '''\nParses a line into a Command, or None if there is nothing to run. \
+Results are cached, so the returned Command must not be changed\n'''
+    stages = []
+    argv = []
+    redirects = []
+    background = False
+    tokens = tokenize(line)
+    for token, is_operator in tokens:
+        if background:
+            raise ParseError('"&" must be at the end of the line')
+        if not is_operator:
+            argv.append(token)
+        elif token == '|':
+            if not argv:
+                raise ParseError('No command given')
+            stages.append((tuple(argv), tuple(redirects)))
+            argv = []
+            redirects = []
+        elif token == '&':
+            background = True
+        else:
+            # a redirection is always followed by its filename
+            filename, is_operator = next(tokens, (None, True))
+            if is_operator:
+                raise ParseError('No filename given')
+            fd, flags = OPERATORS[token]
+            redirects.append((fd, flags, filename))
+    if not argv and (stages or background):
+        raise ParseError('No command given')
+    if not argv and not redirects:
+        # blank lines and comments
+        return None
+    stages.append((tuple(argv), tuple(redirects)))
+    return link(stages, background)
+
+
+def link(stages, background):
+
+    '''\nBuilds a Command from (argv, redirects) for each stage of a pipeline\n'''
+    # links the stages from the last one back to the first
+    command = None
+    for argv, redirects in reversed(stages):
+        command = Command(argv, redirects, background, command)
+    return command
@@ -0,0 +1,146 @@
+'''
+Indexed tab completion for builtins, $PATH executables and filenames
+'''
+import os
+from bisect import bisect_left, bisect_right
+
+from pathcache import mtime
+
+# Characters that separate the word being completed, "/" and "." are
+# left out so a whole path is completed at once
+DELIMS = ' \t\n;|&<>'
+
+# Number of directory listings kept for filename completion
+DIR_CACHE_SIZE = 32
+
+
+class PrefixIndex():
+
+    '''\nA sorted list of words that finds every word \
+starting with a prefix with two binary searches\n'''
+
+    def __init__(self, words):
+        self.words = sorted(set(words))
+
+    def match(self, prefix):
+        # every word with the prefix sorts between the prefix itself
+        # and the prefix followed by the highest code point
+        low = bisect_left(self.words, prefix)
+        high = bisect_right(self.words, prefix + '\U0010ffff', low)
+        return self.words[low:high]
+
+
+class Completer():
+
+    '''\nCompletes the first word of a line from the builtins and the \
+executables on $PATH, and any other word as a filename\n'''
+
+    def __init__(self, builtins):
+        self.builtins = PrefixIndex(builtins)
+        # index of the executables on $PATH, built on first use
+        self.executables = None
+        self.path = None
+        self.mtimes = {}
+        # directory -> (mtime, index of its entries)
+        self.listings = {}
+        # matches for the word readline is currently asking about
+        self.matches = []
+
+    def complete(self, text, state):
+
+        '''\nreadline completer, returns the match number state or None\n'''
+        # imported here since only an interactive session completes anything
+        import readline
+        if state == 0:
+            line = readline.get_line_buffer()
+            begidx = readline.get_begidx()
+            if line[:begidx].strip():
+                self.matches = self.filenames(text)
+            else:
+                self.matches = self.commands(text)
+        if state < len(self.matches):
+            return self.matches[state]
+        return None
+
+    def commands(self, text):
+
+        '''\nReturns the builtins and $PATH executables starting with text\n'''
+        if '/' in text:
+            # a path to a program rather than a command name
+            return self.filenames(text)
+        found = self.builtins.match(text) + self.path_index().match(text)
+        # a builtin may share its name with an executable
+        return sorted(set(found))
+
+    def filenames(self, text):
+
+        '''\nReturns the paths starting with text, directories end in "/"\n'''
+        head, tail = os.path.split(text)
+        directory = os.path.expanduser(head) or '.'
+        names = self.listing(directory).match(tail)
+        if not tail.startswith('.'):
+            # hidden files are only offered when asked for, like bash
+            names = [name for name in names if not name.startswith('.')]
+        return [os.path.join(head, name) for name in names]
+
+    def path_index(self):
+        # rebuilds the executable index when $PATH or one of its
+        # directories has changed since it was built
+        path = os.environ.get('PATH', os.defpath)
+        dirs = [d or '.' for d in path.split(os.pathsep)]
+        mtimes = {d: mtime(d) for d in dirs}
+        if self.executables is None or path != self.path \
+                or mtimes != self.mtimes:
+            self.path = path
+            self.mtimes = mtimes
+            self.executables = PrefixIndex(
+                name for d in dirs for name in executables(d)
+            )
+        return self.executables
+
+    def listing(self, directory):
+        # returns the cached index of a directory's entries, listing it
+        # again only when its mtime has changed
+        modified = mtime(directory)
+        cached = self.listings.pop(directory, None)
+        if cached is None or cached[0] != modified:
+            cached = (modified, PrefixIndex(entries(directory)))
+        # the most recently used directory goes to the end,
+        # and the oldest is dropped once the cache is full
+        self.listings[directory] = cached
+        if len(self.listings) > DIR_CACHE_SIZE:
+            del self.listings[next(iter(self.listings))]
+        return cached[1]
+
+
+def entries(directory):
+
+    '''\nYields the names in a directory, with "/" after subdirectories\n'''
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                try:
+                    # is_dir() uses the type scandir already read
+                    if entry.is_dir():
+                        yield entry.name + '/'
+                    else:
+                        yield entry.name
+                except OSError:
+                    yield entry.name
+    except OSError:
+        return
+
+
+def executables(directory):
+
+    '''\nYields the names of the executable files in a directory\n'''
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                try:
+                    if entry.is_file() and os.access(entry.path, os.X_OK):
+                        yield entry.name
+                except OSError:
+                    continue
+    except OSError:
+        return
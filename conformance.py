@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+'''
+Conformance check for the in-process commands batch mode runs (coreutils.py):
+runs each command line once with the real program and once in the shell, on
+two copies of the same files, and fails if the output, the exit status or
+the files left behind differ in any byte
+'''
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from cmdparse import parse
+from coreutils import FAST_BUILTINS, run_fast
+from redirect import close_redirects, open_redirects
+
+# Command lines checked, run in a directory made by make_files
+CASES = (
+         'true',
+         'true anything at all',
+         'cat a.txt',
+         'cat a.txt b.txt nonl.txt',
+         'cat -u nonl.txt',
+         'cat -- a.txt',
+         'cat empty.txt',
+         'cat bin.dat',
+         'cat big.txt',
+         'cat missing a.txt',
+         'cat sub',
+         'cat < a.txt',
+         'cat a.txt - b.txt < nonl.txt',
+         'cat a.txt > copy.txt',
+         'cat a.txt b.txt >> a.txt',
+         'cat empty.txt >> empty.txt',
+         'cat a.txt > a.txt',
+         'cat a.txt 2> errors.txt missing',
+         'head a.txt',
+         'head big.txt',
+         'head -n 3 big.txt',
+         'head -n3 a.txt',
+         'head -3 big.txt',
+         'head -n 0 a.txt',
+         'head -n 100000 big.txt',
+         'head -c 5 bin.dat',
+         'head -c5 big.txt',
+         'head -c 300000 big.txt',
+         'head -n 2 -c 3 bin.dat',
+         'head nonl.txt',
+         'head a.txt b.txt',
+         'head -n 2 a.txt missing b.txt',
+         'head < a.txt',
+         'head - a.txt < b.txt',
+         'head sub',
+         'head -n 2 a.txt > first.txt',
+         'wc a.txt',
+         'wc -l a.txt',
+         'wc -l big.txt',
+         'wc -c bin.dat',
+         'wc -w bin.dat',
+         'wc -w big.txt',
+         'wc big.txt',
+         'wc -lc nonl.txt',
+         'wc empty.txt',
+         'wc a.txt b.txt',
+         'wc -l a.txt b.txt',
+         'wc -cl a.txt b.txt nonl.txt big.txt',
+         'wc missing a.txt',
+         'wc missing',
+         'wc sub',
+         'wc < a.txt',
+         'wc -l < big.txt',
+         'wc -w - a.txt < b.txt',
+         'wc a.txt >> counts.txt',
+         'mkdir new',
+         'mkdir one two',
+         'mkdir -p x/y/z',
+         'mkdir -p sub sub/deeper',
+         'mkdir sub',
+         'mkdir a.txt',
+         'mkdir -p a.txt/x',
+         'mkdir missing/x',
+         'rm a.txt',
+         'rm a.txt b.txt',
+         'rm missing',
+         'rm missing a.txt',
+         'rm -f missing',
+         'rm -f',
+         'rm sub',
+         'rm -r sub',
+         'rm -R sub',
+         'rm -rf sub missing',
+         'rm -f link',
+         'rm -r link',
+         'rm -- -dash.txt',
+        )
+
+
+def make_files(directory):
+
+    '''\nCreates the files the cases work on\n'''
+    def write(name, data):
+        with open(os.path.join(directory, name), 'wb') as f:
+            f.write(data)
+
+    os.mkdir(directory)
+    write('a.txt', b'first line\nsecond line\n\nfourth  line\twith tab\n')
+    write('b.txt', b''.join(b'line %d of b\n' % i for i in range(25)))
+    write('nonl.txt', b'no newline at the end')
+    write('empty.txt', b'')
+    write('bin.dat', bytes(range(256)) * 40 + b'a\x01b c\xc2\xa0d\x00e')
+    # words and lines that run across the blocks the commands read
+    write('big.txt', b''.join(b'word%d %s\n' % (i, b'x' * (i % 97))
+                              for i in range(60000)))
+    write('-dash.txt', b'dash\n')
+    os.makedirs(os.path.join(directory, 'sub', 'inner'))
+    write(os.path.join('sub', 'one.txt'), b'one\n')
+    write(os.path.join('sub', 'inner', 'two.txt'), b'two\n')
+    os.symlink('sub', os.path.join(directory, 'link'))
+
+
+def snapshot(directory):
+
+    '''\nReturns every path under directory with its type and contents\n'''
+    tree = {}
+    for top, dirs, files in os.walk(directory):
+        for name in dirs + files:
+            path = os.path.join(top, name)
+            key = os.path.relpath(path, directory)
+            if os.path.islink(path):
+                tree[key] = ('link', os.readlink(path))
+            elif os.path.isdir(path):
+                tree[key] = ('dir', None)
+            else:
+                with open(path, 'rb') as f:
+                    tree[key] = ('file', f.read())
+    return tree
+
+
+def external(command, directory, out, err):
+
+    '''\nRuns the real program, returns its exit status\n'''
+    streams = {'stdin': subprocess.DEVNULL, 'stdout': out, 'stderr': err}
+    redirected = open_redirects(command.redirects, directory)
+    streams.update(redirected)
+    try:
+        return subprocess.run(command.argv, cwd=directory, **streams).returncode
+    finally:
+        close_redirects(redirected)
+
+
+def in_process(command, directory, out, err):
+
+    '''\nRuns the shell's version with out and err as its standard output \
+and error, returns its exit status or None if it left it to the real one\n'''
+    saved = os.dup(1), os.dup(2)
+    sys.stdout.flush()
+    os.dup2(out, 1)
+    os.dup2(err, 2)
+    try:
+        return run_fast(FAST_BUILTINS[command.argv[0]], command, directory)
+    finally:
+        os.dup2(saved[0], 1)
+        os.dup2(saved[1], 2)
+        os.close(saved[0])
+        os.close(saved[1])
+
+
+def check(line, base):
+
+    '''\nRuns one case both ways, returns a list of the differences, \
+or None if the shell left it to the real program\n'''
+    command = parse(line)
+    results = []
+    for run in (external, in_process):
+        directory = os.path.join(base, run.__name__)
+        make_files(directory)
+        with tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+            status = run(command, directory, out.fileno(), err.fileno())
+            out.seek(0)
+            err.seek(0)
+            results.append((status, out.read(), err.read(),
+                            snapshot(directory)))
+        shutil.rmtree(directory)
+    (status, out, err, tree), (fast_status, fast_out, fast_err, fast_tree) = \
+        results
+    if fast_status is None:
+        return None
+    differences = []
+    if status != fast_status:
+        differences.append(f'exit status {status}, shell gave {fast_status}')
+    if out != fast_out:
+        differences.append(f'output {out[:60]!r}, shell gave {fast_out[:60]!r}')
+    # messages are worded by the locale, so only whether there was one counts
+    if bool(err) != bool(fast_err):
+        differences.append(f'errors {err!r}, shell gave {fast_err!r}')
+    for path in sorted(set(tree) | set(fast_tree)):
+        if tree.get(path) != fast_tree.get(path):
+            differences.append(f'{path} differs')
+    return differences
+
+
+def main():
+    failed = 0
+    with tempfile.TemporaryDirectory() as base:
+        for line in CASES:
+            differences = check(line, base)
+            if differences is None:
+                print(f'real  {line}')
+                continue
+            print(f'{"ok" if not differences else "FAIL":5} {line}')
+            for difference in differences:
+                print(f'    {difference}')
+            failed += bool(differences)
+    print(f'{len(CASES) - failed} of {len(CASES)} command lines conform')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
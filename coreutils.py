@@ -0,0 +1,479 @@
+'''
+In-process versions of the commands batch scripts run most, cat, head, wc,
+true, mkdir and rm, shared by SeaTurtle (myshell.py) and MyShell
+(myshell2.py). A line that runs one of them is spared a fork and exec,
+which cost far more than copying a small file. Only the options POSIX gives
+them are understood, anything else is left to the real program, and the
+output is byte for byte what the real program writes (see conformance.py)
+'''
+import errno
+import os
+import stat
+import sys
+
+from redirect import close_redirects, open_redirects
+
+# Bytes copied or counted at a time
+BLOCK_SIZE = 256 * 1024
+
+# Bytes wc treats as separating words, the C locale's spaces
+SPACES = b' \t\n\v\f\r'
+
+# Bytes wc neither counts as part of a word nor as separating words,
+# the C locale's other unprintable characters
+UNPRINTABLE = bytes(
+                    c for c in range(256)
+                    if not 32 <= c < 127 and c not in SPACES
+                   )
+
+
+class Unsupported(Exception):
+
+    '''\nRaised, before anything has been done, for a command line \
+only the real program understands\n'''
+
+
+class Streams():
+
+    '''\nThe file descriptors an in-process command reads and writes, \
+the directory its names are relative to and its exit status\n'''
+
+    def __init__(self, name, stdin, stdout, stderr, cwd=None):
+        self.name = name
+        # None unless "<" was given, the shell's own input isn't read
+        self.stdin = stdin
+        self.stdout = stdout
+        self.stderr = stderr
+        self.cwd = cwd
+        self.status = 0
+
+    def path(self, name):
+        # names are relative to the directory a queued job was started in
+        return name if self.cwd is None else os.path.join(self.cwd, name)
+
+    def write(self, data):
+        # writes to the command's standard output
+        write_all(self.stdout, data)
+
+    def error(self, message):
+        # reports a failure the way the real program does and carries on
+        write_all(self.stderr, os.fsencode(f'{self.name}: {message}\n'))
+        self.status = 1
+
+
+def write_all(fd, data):
+
+    '''\nWrites all of data to a file descriptor, \
+which os.write may not do in one go\n'''
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+def run_fast(func, command, cwd=None):
+
+    '''\nRuns a lone command with an in-process version of it, with its \
+redirections opened as they would be for a child process. Returns the \
+exit status, or None if the real program has to run instead\n'''
+    try:
+        streams = open_redirects(command.redirects, cwd)
+    except OSError:
+        # the usual path reports it
+        return None
+    # what the shell printed so far comes before the command's output
+    sys.stdout.flush()
+    sys.stderr.flush()
+    io = Streams(
+                 command.argv[0],
+                 streams.get('stdin'),
+                 streams.get('stdout', 1),
+                 streams.get('stderr', 2),
+                 cwd
+                )
+    try:
+        return func(command.argv[1:], io)
+    except Unsupported:
+        return None
+    except BrokenPipeError:
+        # the reader went away, like SIGPIPE
+        return 141
+    finally:
+        close_redirects(streams)
+
+
+def options(args, allowed):
+
+    '''\nSplits args into the set of single letter options and the operands, \
+raising Unsupported for any option not in allowed\n'''
+    flags = set()
+    operands = []
+    args = iter(args)
+    for arg in args:
+        if arg == '--':
+            operands.extend(args)
+        elif arg.startswith('-') and len(arg) > 1:
+            if arg.startswith('--') or not set(arg[1:]) <= set(allowed):
+                raise Unsupported(arg)
+            flags.update(arg[1:])
+            continue
+        else:
+            operands.append(arg)
+    return flags, operands
+
+
+def open_input(io, name):
+
+    '''\nReturns a file descriptor to read an operand from, "-" being \
+the redirected input\n'''
+    if name == '-':
+        return io.stdin
+    return os.open(io.path(name), os.O_RDONLY)
+
+
+def copy(src, dst):
+
+    '''\nCopies everything left in src to dst, in the kernel with sendfile \
+where it can be\n'''
+    try:
+        while os.sendfile(dst, src, None, BLOCK_SIZE):
+            pass
+        return
+    except OSError as e:
+        # pipes, terminals and ">>" files can't always be sent to,
+        # the offset is where sendfile stopped so the rest is copied
+        if e.errno not in (errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP):
+            raise
+    while True:
+        data = os.read(src, BLOCK_SIZE)
+        if not data:
+            break
+        write_all(dst, data)
+
+
+def fast_true(args, io):
+
+    '''\ntrue: does nothing, successfully\n'''
+    if args and args[0] in ('--help', '--version'):
+        raise Unsupported(args[0])
+    return 0
+
+
+def fast_cat(args, io):
+
+    '''\ncat [-u] [file ...]: writes each file in turn\n'''
+    flags, operands = options(args, 'u')
+    operands = operands or ['-']
+    if '-' in operands and io.stdin is None:
+        # only the real cat can read the shell's own input
+        raise Unsupported('-')
+    out = os.fstat(io.stdout)
+    for name in operands:
+        try:
+            fd = open_input(io, name)
+        except OSError as e:
+            io.error(f'{name}: {e.strerror}')
+            continue
+        try:
+            info = os.fstat(fd)
+            # appending a file to itself would never end
+            if stat.S_ISREG(out.st_mode) and stat.S_ISREG(info.st_mode) \
+                    and (info.st_dev, info.st_ino) == (out.st_dev, out.st_ino) \
+                    and os.lseek(fd, 0, os.SEEK_CUR) < info.st_size:
+                io.error(f'{name}: input file is output file')
+                continue
+            copy(fd, io.stdout)
+        except BrokenPipeError:
+            # ends the command rather than being reported for each file
+            raise
+        except OSError as e:
+            io.error(f'{name}: {e.strerror}')
+        finally:
+            if name != '-':
+                os.close(fd)
+    return io.status
+
+
+def fast_head(args, io):
+
+    '''\nhead [-n count|-c bytes|-count] [file ...]: writes the first lines \
+or bytes of each file, under a header when there are several\n'''
+    count, lines = 10, True
+    operands = []
+    args = list(args)
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        i += 1
+        if arg == '--':
+            operands.extend(args[i:])
+            break
+        if not arg.startswith('-') or arg == '-':
+            operands.append(arg)
+            continue
+        if arg[1:].isdigit() and i == 1:
+            # the old "head -5" form
+            value, lines = arg[1:], True
+        elif arg[1:2] in ('n', 'c') and not arg.startswith('--'):
+            value = arg[2:]
+            if not value:
+                if i >= len(args):
+                    raise Unsupported(arg)
+                value = args[i]
+                i += 1
+            lines = arg[1] == 'n'
+        else:
+            raise Unsupported(arg)
+        # sizes like 1K and counts from the end are left to the real head
+        if not value.isdigit():
+            raise Unsupported(value)
+        count = int(value)
+    operands = operands or ['-']
+    if '-' in operands and io.stdin is None:
+        raise Unsupported('-')
+    first = True
+    for name in operands:
+        try:
+            fd = open_input(io, name)
+        except OSError as e:
+            io.error(f"cannot open '{name}' for reading: {e.strerror}")
+            continue
+        try:
+            if len(operands) > 1:
+                shown = 'standard input' if name == '-' else name
+                gap = '' if first else '\n'
+                io.write(os.fsencode(f'{gap}==> {shown} <==\n'))
+                first = False
+            if lines:
+                head_lines(fd, io, count)
+            else:
+                head_bytes(fd, io, count)
+        except BrokenPipeError:
+            # ends the command rather than being reported for each file
+            raise
+        except OSError as e:
+            io.error(f"error reading '{name}': {e.strerror}")
+        finally:
+            if name != '-':
+                os.close(fd)
+    return io.status
+
+
+def head_lines(fd, io, count):
+    # writes up to the count'th newline, reading only as far as that
+    while count > 0:
+        data = os.read(fd, BLOCK_SIZE)
+        if not data:
+            break
+        found = data.count(b'\n')
+        if found < count:
+            io.write(data)
+            count -= found
+            continue
+        end = -1
+        for _ in range(count):
+            end = data.index(b'\n', end + 1)
+        io.write(data[:end + 1])
+        break
+
+
+def head_bytes(fd, io, count):
+    # writes the first count bytes
+    while count > 0:
+        data = os.read(fd, min(count, BLOCK_SIZE))
+        if not data:
+            break
+        io.write(data)
+        count -= len(data)
+
+
+def fast_wc(args, io):
+
+    '''\nwc [-clw] [file ...]: counts the lines, words and bytes of each \
+file, with a total when there are several, in columns as wide as the \
+largest count can be\n'''
+    flags, operands = options(args, 'clw')
+    flags = flags or {'l', 'w', 'c'}
+    names = operands or [None]
+    if (None in names or '-' in names) and io.stdin is None:
+        raise Unsupported('-')
+    locale = os.environ.get('LC_ALL') or os.environ.get('LC_CTYPE') \
+        or os.environ.get('LANG')
+    # words are split on the C locale's spaces, other locales add to them
+    c_locale = not locale or locale in ('C', 'POSIX')
+    inputs = []
+    for name in names:
+        try:
+            fd = open_input(io, name or '-')
+            inputs.append((name, fd, os.fstat(fd)))
+        except OSError as e:
+            inputs.append((name, None, e))
+    try:
+        # every file is counted before anything is written, so a file
+        # the real wc would count differently can still be handed over
+        results = []
+        for name, fd, info in inputs:
+            if fd is None:
+                results.append((name, None, info))
+                continue
+            try:
+                results.append((name, count(fd, info, flags, c_locale), None))
+            except OSError as e:
+                # a file that can't be read, like a directory, still
+                # gets a line of zeros
+                results.append((name, [0, 0, 0], e))
+    finally:
+        for name, fd, info in inputs:
+            if fd is not None and name not in (None, '-'):
+                os.close(fd)
+    width = count_width(inputs, flags)
+    totals = [0, 0, 0]
+    for name, counts, error in results:
+        if error is not None:
+            io.error(f'{name}: {error.strerror}')
+        if counts is None:
+            continue
+        totals = [a + b for a, b in zip(totals, counts)]
+        io.write(count_line(counts, flags, width, name))
+    if len(names) > 1:
+        io.write(count_line(totals, flags, width, 'total'))
+    return io.status
+
+
+def count(fd, info, flags, c_locale):
+    # returns [lines, words, bytes] of what is left to read of fd
+    if flags == {'c'} and stat.S_ISREG(info.st_mode):
+        # the size of a regular file is known without reading it
+        return [0, 0, max(info.st_size - os.lseek(fd, 0, os.SEEK_CUR), 0)]
+    lines = words = size = 0
+    # whether the previous block ended inside a word
+    in_word = False
+    while True:
+        data = os.read(fd, BLOCK_SIZE)
+        if not data:
+            break
+        size += len(data)
+        lines += data.count(b'\n')
+        if 'w' in flags:
+            if not c_locale and not data.isascii():
+                # other locales have spaces outside ASCII
+                raise Unsupported('locale')
+            text = data.translate(None, UNPRINTABLE)
+            if text:
+                words += len(text.split())
+                if in_word and text[0] not in SPACES:
+                    # the word carried on from the last block
+                    words -= 1
+                in_word = text[-1] not in SPACES
+    return [lines, words, size]
+
+
+def count_width(inputs, flags):
+    # the width of each column, which depends on what the real wc
+    # can learn about its inputs before counting them
+    if len(inputs) == 1 and len(flags) == 1:
+        return 1
+    width, minimum, total = 1, 1, 0
+    for name, fd, info in inputs:
+        if fd is None:
+            continue
+        if stat.S_ISREG(info.st_mode):
+            total += info.st_size
+        else:
+            minimum = 7
+    while total >= 10:
+        total //= 10
+        width += 1
+    return max(width, minimum)
+
+
+def count_line(counts, flags, width, name):
+    # one line of output: the chosen counts, then the name if there is one
+    fields = [f'{n:>{width}}' for n, flag in zip(counts, 'lwc')
+              if flag in flags]
+    if name is not None:
+        fields.append(name)
+    return os.fsencode(' '.join(fields) + '\n')
+
+
+def fast_mkdir(args, io):
+
+    '''\nmkdir [-p] dir ...: makes each directory, with -p its parents too \
+and without complaining if it is already there\n'''
+    flags, operands = options(args, 'p')
+    if not operands:
+        # the real mkdir explains its usage
+        raise Unsupported('mkdir')
+    for name in operands:
+        try:
+            if 'p' in flags:
+                os.makedirs(io.path(name), exist_ok=True)
+            else:
+                os.mkdir(io.path(name))
+        except OSError as e:
+            io.error(f"cannot create directory '{name}': {e.strerror}")
+    return io.status
+
+
+def fast_rm(args, io):
+
+    '''\nrm [-f] [-r|-R] file ...: removes each file, and with -r each \
+directory and everything in it. -f ignores files that aren't there\n'''
+    flags, operands = options(args, 'frR')
+    force = 'f' in flags
+    recursive = bool(flags & {'r', 'R'})
+    if not operands:
+        if force:
+            return 0
+        raise Unsupported('rm')
+    for name in operands:
+        if os.path.basename(name.rstrip('/')) in ('.', '..') \
+                or not name.strip('/'):
+            # the real rm refuses these with its own message
+            raise Unsupported(name)
+    stdin = 0 if io.stdin is None else io.stdin
+    if not force and os.isatty(stdin):
+        # the real rm asks before removing write protected files
+        if recursive or not all(os.path.islink(io.path(name))
+                                or os.access(io.path(name), os.W_OK)
+                                or not os.path.lexists(io.path(name))
+                                for name in operands):
+            raise Unsupported('prompt')
+    for name in operands:
+        path = io.path(name)
+        try:
+            info = os.lstat(path)
+        except FileNotFoundError:
+            if not force:
+                io.error(f"cannot remove '{name}': No such file or directory")
+            continue
+        except OSError as e:
+            io.error(f"cannot remove '{name}': {e.strerror}")
+            continue
+        if not stat.S_ISDIR(info.st_mode):
+            try:
+                os.unlink(path)
+            except OSError as e:
+                io.error(f"cannot remove '{name}': {e.strerror}")
+        elif not recursive:
+            io.error(f"cannot remove '{name}': Is a directory")
+        else:
+            # only needed to remove whole directories
+            import shutil
+
+            def failed(function, failed_path, exc_info):
+                io.error(f"cannot remove '{failed_path}': "
+                         f"{exc_info[1].strerror}")
+
+            shutil.rmtree(path, onerror=failed)
+    return io.status
+
+
+# Commands batch mode runs in the shell unless started with -E
+FAST_BUILTINS = {
+                 'cat': fast_cat,
+                 'head': fast_head,
+                 'wc': fast_wc,
+                 'true': fast_true,
+                 'mkdir': fast_mkdir,
+                 'rm': fast_rm,
+                }
@@ -0,0 +1,314 @@
+'''
+Streaming and recursive directory listings for the dir builtin of
+SeaTurtle (myshell.py) and MyShell (myshell2.py)
+'''
+import os
+import stat
+import time
+from fnmatch import fnmatch
+from types import SimpleNamespace
+
+from redirect import Arguments
+
+# Sort orders dir can be asked for, anything else is listed
+# in the order the directory gives its entries
+SORT_OPTIONS = {
+                '-S': 'size',
+                '-t': 'time',
+               }
+
+# Listings older than this show the year instead of the time, like ls
+SIX_MONTHS = 182 * 24 * 60 * 60
+
+# Number of directories dir -R reads at once, slow network file systems
+# spend most of a walk waiting on each directory in turn
+WALK_WORKERS = 8
+
+# Number of directories read ahead of the one being written,
+# which bounds the listings held in memory
+WALK_AHEAD = 64
+
+
+def dir_options(args):
+
+    '''\nReads dir's arguments, returns the directory (None if none was \
+given), long, sort, recursive, summary, depth and exclude. Like cd, only \
+the first line of a "<" file is used. Raises ValueError for an unknown \
+option\n'''
+    if isinstance(args, Arguments):
+        # the rest of the file is never read
+        args = args.head(1)
+    options = SimpleNamespace(
+                              directory=None,
+                              long=False,
+                              sort=None,
+                              recursive=False,
+                              summary=False,
+                              depth=None,
+                              exclude=[]
+                             )
+    args = iter(args)
+    for arg in args:
+        if not arg.startswith('-') or len(arg) == 1:
+            if options.directory is not None:
+                raise ValueError('dir takes only one directory')
+            options.directory = arg
+            continue
+        for i, flag in enumerate(arg[1:], 2):
+            if flag == 'l':
+                options.long = True
+            elif flag == 'R':
+                options.recursive = True
+            elif flag == 's':
+                options.summary = True
+            elif '-' + flag in SORT_OPTIONS:
+                options.sort = SORT_OPTIONS['-' + flag]
+            elif flag in 'dx':
+                # the filters only make sense for a recursive listing,
+                # the value is the rest of the word or the next argument
+                options.recursive = True
+                value = arg[i:] or next(args, None)
+                if value is None:
+                    raise ValueError(f'dir -{flag} needs a value')
+                if flag == 'x':
+                    options.exclude.append(value)
+                elif value.isdigit():
+                    options.depth = int(value)
+                else:
+                    raise ValueError(f'"{value}" is not a depth')
+                break
+            else:
+                raise ValueError(f'dir has no option "-{flag}"')
+    return options
+
+
+def dir_lines(directory, options):
+
+    '''\nYields the lines dir writes for a directory and its options\n'''
+    if options.recursive or options.summary:
+        return walk_dir(directory, options)
+    return list_dir(directory, options.long, options.sort)
+
+
+def list_dir(directory, long=False, sort=None):
+
+    '''\nYields the entries of a directory as they are read, one line each. \
+Unsorted listings hold one entry at a time, sorted ones stat every entry \
+first and keep only what the sort needs\n'''
+    if sort is None:
+        with os.scandir(directory) as it:
+            for entry in it:
+                yield long_line(entry) if long else entry.name
+        return
+    index = 0 if sort == 'size' else 1
+    keys = []
+    with os.scandir(directory) as it:
+        for entry in it:
+            try:
+                info = entry.stat(follow_symlinks=False)
+                key = (info.st_size, info.st_mtime)[index]
+            except OSError:
+                key = 0
+            keys.append((key, entry.name))
+    # largest or newest first, ties in name order
+    keys.sort(key=lambda item: (-item[0], item[1]))
+    for key, name in keys:
+        if long:
+            yield long_line(os.path.join(directory, name))
+        else:
+            yield name
+
+
+def walk_dir(top, options):
+
+    '''\nYields a recursive listing of top, each directory's entries under \
+its path like "ls -R", or with options.summary the number of files and \
+bytes under each directory, after its subdirectories like "du". \
+Directories are read by a pool of threads a little ahead of the one being \
+written, so the output is the same as reading them one at a time\n'''
+    # imported here since only recursive listings need a thread pool
+    from concurrent.futures import ThreadPoolExecutor
+    pool = ThreadPoolExecutor(max_workers=WALK_WORKERS)
+    # directories still to write, the next one last: [path, depth, future],
+    # or in summary mode the path alone once its subdirectories are queued
+    stack = [[top, 0, None]]
+    # [files, bytes] of each directory whose subtree is still being walked
+    totals = []
+    try:
+        while stack:
+            # starts reading the next few directories in the order they
+            # will be written
+            for item in stack[-WALK_AHEAD:]:
+                if isinstance(item, list) and item[2] is None:
+                    item[2] = pool.submit(scan_dir, item[0], options)
+            item = stack.pop()
+            if not isinstance(item, list):
+                # every directory under this one has been counted
+                files, size = totals.pop()
+                if totals:
+                    totals[-1][0] += files
+                    totals[-1][1] += size
+                yield f'{files:>10} {size:>14}  {item}'
+                continue
+            path, depth, future = item
+            try:
+                entries = future.result()
+            except OSError as e:
+                if depth == 0:
+                    raise
+                # an unreadable subdirectory doesn't stop the walk
+                print(f"Error: '{path}' {e.strerror.lower()}")
+                continue
+            if options.summary:
+                totals.append([
+                               sum(not is_dir for name, is_dir, size, line
+                                   in entries),
+                               sum(size for name, is_dir, size, line
+                                   in entries if not is_dir)
+                              ])
+                stack.append(path)
+            else:
+                if depth > 0:
+                    yield ''
+                yield f'{path}:'
+                for name, is_dir, size, line in entries:
+                    yield line
+            if options.depth is not None and depth >= options.depth:
+                # too deep to descend any further
+                continue
+            # the first subdirectory is written next, so it goes on last
+            for name, is_dir, size, line in reversed(entries):
+                if is_dir:
+                    stack.append([os.path.join(path, name), depth + 1, None])
+    finally:
+        # a listing that is stopped early doesn't wait for the read ahead,
+        # shutdown's cancel_futures needs Python 3.9
+        for item in stack:
+            if isinstance(item, list) and item[2] is not None:
+                item[2].cancel()
+        pool.shutdown(wait=False)
+
+
+def scan_dir(path, options):
+
+    '''\nReads one directory for walk_dir on a worker thread, returns \
+(name, is_dir, size, line) for each entry not excluded, in the order \
+they are written\n'''
+    entries = []
+    with os.scandir(path) as it:
+        for entry in it:
+            # excluded entries are neither listed nor descended into
+            if any(fnmatch(entry.name, pattern) for pattern in options.exclude):
+                continue
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                is_dir = False
+            size = mtime = 0
+            if options.summary or options.sort:
+                try:
+                    info = entry.stat(follow_symlinks=False)
+                    size, mtime = info.st_size, info.st_mtime
+                except OSError:
+                    pass
+            if options.summary:
+                line = None
+            elif options.long:
+                line = long_line(entry)
+            else:
+                line = entry.name
+            key = {'size': size, 'time': mtime}.get(options.sort, 0)
+            entries.append((key, entry.name, is_dir, size, line))
+    # name order unless -S or -t, so every walk gives the same output
+    entries.sort(key=lambda item: (-item[0], item[1]))
+    return [entry[1:] for entry in entries]
+
+
+def long_line(entry):
+
+    '''\nFormats a DirEntry or path the way "ls -l" does\n'''
+    if isinstance(entry, os.DirEntry):
+        name = entry.name
+        try:
+            # DirEntry keeps the stat, so it is done at most once
+            info = entry.stat(follow_symlinks=False)
+        except OSError:
+            return f'?????????? {name}'
+        path = entry.path
+    else:
+        path = entry
+        name = os.path.basename(path)
+        try:
+            info = os.lstat(path)
+        except OSError:
+            return f'?????????? {name}'
+    if stat.S_ISLNK(info.st_mode):
+        try:
+            name = f'{name} -> {os.readlink(path)}'
+        except OSError:
+            pass
+    fields = (
+              mode(info.st_mode),
+              info.st_nlink,
+              owner(info.st_uid),
+              group(info.st_gid),
+              info.st_size,
+              modified(info.st_mtime),
+              name,
+             )
+    return '{} {:>3} {:<8} {:<8} {:>10} {} {}'.format(*fields)
+
+
+# uid, gid, mode and minute -> how they are shown, so each is
+# worked out once rather than for every entry
+_owners = {}
+_groups = {}
+_modes = {}
+_minutes = {}
+
+# Number of distinct minutes remembered before starting again
+MINUTES_CACHE_SIZE = 4096
+
+
+def owner(uid):
+    # the user name for a uid, or the number if it has none
+    if uid not in _owners:
+        try:
+            import pwd
+            _owners[uid] = pwd.getpwuid(uid).pw_name
+        except (ImportError, KeyError):
+            _owners[uid] = str(uid)
+    return _owners[uid]
+
+
+def group(gid):
+    # the group name for a gid, or the number if it has none
+    if gid not in _groups:
+        try:
+            import grp
+            _groups[gid] = grp.getgrgid(gid).gr_name
+        except (ImportError, KeyError):
+            _groups[gid] = str(gid)
+    return _groups[gid]
+
+
+def mode(st_mode):
+    # the permissions as "-rwxr-xr-x"
+    if st_mode not in _modes:
+        _modes[st_mode] = stat.filemode(st_mode)
+    return _modes[st_mode]
+
+
+def modified(mtime):
+    # recent files show the time, older ones the year,
+    # only the minute matters so files in the same one share it
+    minute = int(mtime) // 60
+    if minute not in _minutes:
+        if len(_minutes) >= MINUTES_CACHE_SIZE:
+            _minutes.clear()
+        if abs(time.time() - mtime) < SIX_MONTHS:
+            shown = time.strftime('%b %d %H:%M', time.localtime(mtime))
+        else:
+            shown = time.strftime('%b %d  %Y', time.localtime(mtime))
+        _minutes[minute] = shown
+    return _minutes[minute]
@@ -0,0 +1,472 @@
+'''
+Optional asyncio engine for MyShell (myshell2.py), used with --async. The
+prompt, background jobs, their output and "wait -t" timeouts are all served
+by one event loop: a job's exit is seen through a pidfd and its output is
+forwarded by a coroutine, so hundreds of jobs need no thread or poll each
+'''
+import asyncio
+import os
+import signal
+import sys
+
+from cmdparse import ParseError, parse
+from coreutils import run_fast
+from environment import only_assignments
+from history import rerun_line
+from pipeline import FailedStage, not_found, pipefail, prepare_stages
+from redirect import arguments, close_redirects, redirect_builtin
+from timing import Timer, report, split_time
+
+# Bytes of a job's output read at a time
+READ_SIZE = 64 * 1024
+
+# Popen can put a child in an existing process group from Python 3.11
+PROCESS_GROUPS = sys.version_info >= (3, 11)
+
+
+class AsyncPipeline():
+
+    '''\nThe processes of a command line started on the event loop, \
+it looks enough like a Pipeline for the job table\n'''
+
+    def __init__(self, stages, forwarders, groups):
+        self.stages = stages
+        self.pid = stages[-1].pid
+        # process groups of a background job, for signal()
+        self.groups = groups
+        self.returncode = None
+        self.task = asyncio.ensure_future(self.finish(forwarders))
+
+    async def finish(self, forwarders):
+        # the loop's child watcher tells each process when it exits
+        for stage in self.stages:
+            if not isinstance(stage, FailedStage):
+                await stage.wait()
+        # the last of a job's output is shown before it counts as done
+        await asyncio.gather(*forwarders)
+        self.returncode = pipefail(self.stages)
+        return self.returncode
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self):
+        # only called once the task has finished
+        return self.returncode
+
+    def signal(self, signum):
+        # sends a signal to every process of a background job
+        for group in self.groups:
+            try:
+                os.killpg(group, signum)
+            except ProcessLookupError:
+                pass
+
+
+class Engine():
+
+    '''\nRuns MyShell's command lines on an asyncio event loop. Builtins \
+still run in the shell as they do without the engine, while external \
+commands are started with asyncio.create_subprocess_exec\n'''
+
+    def __init__(self, shell):
+        self.shell = shell
+        # the loop's child watcher sees the jobs exit, the job table's
+        # SIGCHLD handler would only cut into the writes of their output,
+        # and jobs started without the loop are reaped at each prompt
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        # builtins that wait on the loop's jobs, so they are coroutines
+        self.builtins = {
+                         'wait': self.do_wait,
+                         'fg': self.do_fg,
+                         'history': self.do_history,
+                        }
+        # True at the terminal, where job output is shown above the prompt
+        self.interactive = False
+        # True while the prompt is waiting for a line
+        self.prompting = False
+        # the builtin waiting on jobs, which Ctrl-C stops
+        self.waiting = None
+        # bytes typed after the last complete line
+        self.typed = b''
+        self.lines = None
+
+    def session(self):
+
+        '''\nRuns an interactive session, returns the last exit status\n'''
+        return run(self.prompt_loop())
+
+    def batch(self, lines):
+
+        '''\nRuns the lines of a batch file, given as (line number, text, \
+Command or ParseError), returns the last exit status\n'''
+        return run(self.batch_loop(lines))
+
+    async def prompt_loop(self):
+        loop = asyncio.get_running_loop()
+        self.interactive = True
+        self.lines = asyncio.Queue()
+        # the terminal hands over a line at a time when Enter is pressed,
+        # with its own editing keys, so reading never blocks the loop
+        loop.add_reader(0, self.read_terminal)
+        loop.add_signal_handler(signal.SIGINT, self.interrupt)
+        # Prints the help prompt when the shell is first opened
+        print('type "help" for a list of commands')
+        status = 0
+        try:
+            while True:
+                # reports background jobs that finished while a command ran
+                self.shell.jobs.report()
+                self.show_prompt()
+                text = await self.lines.get()
+                self.prompting = False
+                if text is None:
+                    # Ctrl-D closes the shell with the last exit status
+                    print()
+                    return status
+                # appends the line to the history file straight away
+                self.shell.history.add(text)
+                status = await self.line(text)
+        finally:
+            # Ctrl-D or quit
+            await self.hang_up()
+
+    async def batch_loop(self, lines):
+        status = 0
+        try:
+            for number, text, command in lines:
+                if isinstance(command, ParseError):
+                    print(f'Error: {command}')
+                    status = 2
+                    continue
+                status = await self.run_line(text, command)
+            # children still running when the loop closes would be killed
+            await self.wait_jobs(self.running())
+        finally:
+            if self.shell.outputs is not None:
+                # the end of the script, or quit
+                self.shell.outputs.close()
+            await self.hang_up()
+        return status
+
+    async def hang_up(self):
+        # the loop's children can't outlive it, so jobs still running
+        # when the shell exits get SIGHUP, as if the terminal had closed,
+        # and SIGKILL if they are still there a second later
+        jobs = [job.process for job in self.running()
+                if isinstance(job.process, AsyncPipeline)
+                and job.process.returncode is None]
+        for signum in (signal.SIGHUP, signal.SIGKILL):
+            if not jobs:
+                return
+            for job in jobs:
+                job.signal(signum)
+            done, pending = await asyncio.wait(
+                                               [job.task for job in jobs],
+                                               timeout=1
+                                              )
+            jobs = [job for job in jobs if job.task in pending]
+
+    def read_terminal(self):
+        # called by the loop whenever standard input has something to read
+        data = os.read(0, READ_SIZE)
+        if not data:
+            # Ctrl-D, after whatever was typed before it
+            if self.typed:
+                self.lines.put_nowait(self.typed.decode(errors='replace'))
+                self.typed = b''
+            self.lines.put_nowait(None)
+            asyncio.get_running_loop().remove_reader(0)
+            return
+        *complete, self.typed = (self.typed + data).split(b'\n')
+        for line in complete:
+            self.lines.put_nowait(line.decode(errors='replace'))
+
+    def interrupt(self):
+        # Ctrl-C: a foreground program gets it from the terminal itself,
+        # background jobs are in process groups of their own
+        if self.waiting is not None:
+            self.waiting.cancel()
+        elif self.prompting:
+            # the terminal has already thrown away the line being typed
+            self.typed = b''
+            print()
+            self.show_prompt()
+
+    def show_prompt(self):
+        sys.stdout.write(self.shell.prompt)
+        sys.stdout.flush()
+        self.prompting = True
+
+    def show(self, data):
+
+        '''\nWrites a job's output to the terminal, above the prompt if \
+the shell is showing one\n'''
+        sys.stdout.flush()
+        if self.prompting:
+            # the line being typed stays with the terminal, only the
+            # prompt is drawn again
+            if not data.endswith(b'\n'):
+                data += b'\n'
+            data = b'\r\033[K' + data + self.shell.prompt.encode()
+        sys.stdout.buffer.write(data)
+        sys.stdout.buffer.flush()
+
+    async def forward(self, stream):
+        # passes a background job's output on a line at a time, so it
+        # never splits a line or the prompt
+        rest = b''
+        while True:
+            data = await stream.read(READ_SIZE)
+            if not data:
+                break
+            data = rest + data
+            end = data.rfind(b'\n') + 1
+            rest = data[end:]
+            if end:
+                self.show(data[:end])
+        if rest:
+            self.show(rest)
+
+    def job_finished(self, task):
+        # a job's task is done, the table is told straight away
+        self.shell.jobs.reap()
+        if self.prompting and self.shell.jobs.finished:
+            sys.stdout.write('\r\033[K')
+            self.shell.jobs.report()
+            self.show_prompt()
+
+    async def line(self, text):
+
+        '''\nRuns a single command line and returns its exit status\n'''
+        try:
+            # Splits the line into arguments and redirections
+            command = parse(text)
+        except ParseError as e:
+            print(f'Error: {e}')
+            return 2
+        if command is None:
+            # Empty lines do nothing
+            return 0
+        return await self.run_line(text, command)
+
+    async def run_line(self, text, command):
+
+        '''\nRuns a parsed command line and returns its exit status\n'''
+        # "time" in front of a command reports what it used
+        command, timed = split_time(command)
+        name = command.argv[0] if command is not None and command.argv \
+            else None
+        with Timer() as timer:
+            if command is None:
+                status = 0
+            elif timed and name not in self.builtins:
+                # run without the loop, so os.wait4 gives its CPU time
+                status = self.shell.dispatch(command) if self.interactive \
+                    else self.shell.batch_command(command, timed)
+            else:
+                status = await self.dispatch(command)
+        self.shell.stats.add(text, timer)
+        if timed:
+            report(timer)
+        return status
+
+    async def dispatch(self, command):
+
+        '''\nRuns a parsed command line and returns its exit status\n'''
+        name = command.argv[0] if command.argv else None
+        lone = command.pipe is None
+        if lone and only_assignments(command.argv):
+            # "NAME=value" on its own sets the variable, like export
+            return self.shell.do_export(command.argv)
+        table = self.shell.dispatcher if self.interactive \
+            else self.shell.disbatcher
+        handler = table.get(name) if lone else None
+        if self.shell.outputs is not None:
+            # writes out what builtins appended to files before anything
+            # that might read them
+            self.shell.outputs.sync(command,
+                                    handler is not None or
+                                    lone and name in self.builtins)
+        if lone and name in self.builtins:
+            return await self.builtin(self.builtins[name], command)
+        elif handler is not None:
+            return self.shell.builtin(handler, command)
+        elif any(stage.argv and stage.argv[0] in self.shell.pipe_builtins
+                 for stage in command.stages()):
+            # builtin stages run on threads, as they do without the loop
+            return self.shell.run(command)
+        fast = self.shell.fast
+        if fast and lone and not command.background and name in fast:
+            status = run_fast(fast[name], command, None)
+            if status is not None:
+                return status
+        # anything printed so far comes before the command's output
+        sys.stdout.flush()
+        if command.background:
+            job = await self.start(command)
+            self.shell.jobs.add(job, command)
+            job.task.add_done_callback(self.job_finished)
+            return 0
+        loop = asyncio.get_running_loop()
+        if self.interactive:
+            # the terminal belongs to the command until it finishes
+            loop.remove_reader(0)
+        try:
+            job = await self.start(command)
+            status = await job.task
+            if self.interactive and status == 128 + signal.SIGINT:
+                # Ctrl-C leaves the terminal after ^C
+                print()
+            return status
+        finally:
+            if self.interactive and self.lines is not None:
+                loop.add_reader(0, self.read_terminal)
+
+    async def builtin(self, handler, command):
+        # runs one of the engine's builtins with its redirections,
+        # Ctrl-C stops it waiting but not the jobs it waits for
+        try:
+            args = arguments(command, 1)
+            with redirect_builtin(command.redirects, self.shell.outputs):
+                self.waiting = asyncio.ensure_future(handler(args))
+                try:
+                    return await self.waiting
+                except asyncio.CancelledError:
+                    print()
+                    return 130
+                finally:
+                    self.waiting = None
+        except OSError as e:
+            # If a redirected file can't be opened
+            print(f"Error: '{e.filename}' {e.strerror.lower()}")
+            return 1
+
+    async def start(self, command):
+
+        '''\nStarts every stage of a parsed command on the loop, \
+connecting each one's stdout to the next one's stdin with os.pipe(). \
+Background jobs get their own process group, /dev/null as stdin and, at \
+the terminal, their output forwarded. Returns the AsyncPipeline\n'''
+        background = command.background
+        stages = []
+        forwarders = []
+        groups = set()
+        # the job's process group, that of its first process
+        group = 0
+        for stage in prepare_stages(command, ()):
+            if isinstance(stage, FailedStage):
+                stages.append(stage)
+                continue
+            argv, executable, env, streams = stage
+            options = dict(streams, env=env)
+            if background:
+                options.setdefault('stdin', asyncio.subprocess.DEVNULL)
+                if self.interactive:
+                    options.setdefault('stdout', asyncio.subprocess.PIPE)
+                # Ctrl-C at the prompt doesn't reach the job
+                if PROCESS_GROUPS:
+                    options['process_group'] = group
+                else:
+                    options['start_new_session'] = True
+            try:
+                process = await asyncio.create_subprocess_exec(
+                                                *argv,
+                                                executable=executable,
+                                                **options
+                                               )
+            except (FileNotFoundError, PermissionError):
+                stages.append(not_found(argv))
+            else:
+                stages.append(process)
+                group = group or process.pid
+                if background:
+                    groups.add(group if PROCESS_GROUPS else process.pid)
+                if process.stdout is not None:
+                    # read from now on, so a full pipe never stops it
+                    forwarders.append(asyncio.ensure_future(
+                        self.forward(process.stdout)))
+            finally:
+                # the child has its own copies of the descriptors
+                close_redirects(streams)
+        return AsyncPipeline(stages, forwarders, groups)
+
+    def running(self):
+        # the jobs in the table, oldest first, with those that finished
+        # but haven't been waited for or reported
+        return [job for number, job
+                in sorted(dict(self.shell.jobs.jobs).items())]
+
+    async def wait_job(self, job):
+        # waits for one job and takes it out of the table
+        if isinstance(job.process, AsyncPipeline):
+            # a timeout or Ctrl-C stops the wait, not the job
+            await asyncio.shield(job.process.task)
+        else:
+            # a pipeline with builtin stages, started without the loop
+            job.process.wait()
+        return self.shell.jobs.wait(job)
+
+    async def wait_jobs(self, jobs):
+        # waits for each job in turn, returns the last one's status
+        status = 0
+        for job in jobs:
+            status = await self.wait_job(job)
+        return status
+
+    async def do_wait(self, args):
+        # waits for the given background job, or all of them, and with
+        # -t SECONDS gives up after that long with status 124
+        args = list(args)
+        timeout = None
+        if args and args[0] == '-t':
+            try:
+                timeout = float(args[1])
+            except (IndexError, ValueError):
+                print('Error: -t needs a number of seconds')
+                return 2
+            args = args[2:]
+        if args:
+            job = self.shell.jobs.get(args)
+            if job is None:
+                print(f'Error: no such job "{args[0]}"')
+                return 127
+            jobs = [job]
+        else:
+            jobs = self.running()
+        try:
+            return await asyncio.wait_for(self.wait_jobs(jobs), timeout)
+        except asyncio.TimeoutError:
+            return 124
+
+    async def do_fg(self, args):
+        # brings the given job, or the most recent one, to the foreground
+        job = self.shell.jobs.get(list(args))
+        if job is None:
+            print('Error: no such job')
+            return 1
+        print(job.command)
+        return await self.wait_job(job)
+
+    async def do_history(self, args):
+        # history -e runs the line on the loop, the rest is the shell's
+        if not args or args[0] != '-e':
+            return self.shell.do_history(args)
+        text, error = rerun_line(self.shell.history, list(args)[1:])
+        if error is not None:
+            print(error)
+            return 1
+        # shows the command and remembers it as the latest one
+        print(text)
+        self.shell.history.add(text)
+        return await self.line(text)
+
+
+def run(coroutine):
+
+    '''\nRuns a coroutine on a new event loop and returns its result\n'''
+    if sys.version_info < (3, 12) and hasattr(os, 'pidfd_open'):
+        # the default child watcher starts a thread for every child,
+        # a pidfd is one more descriptor for the loop (the default in 3.12)
+        asyncio.set_child_watcher(asyncio.PidfdChildWatcher())
+    return asyncio.run(coroutine)
@@ -0,0 +1,158 @@
+'''
+The environment SeaTurtle (myshell.py) and MyShell (myshell2.py) give their
+child processes: encoded once in the form posix_spawn takes, and rebuilt
+only after a variable has changed
+'''
+import os
+from collections.abc import Mapping
+
+
+class Overlay(Mapping):
+
+    '''\nAn environment block with the variables of "NAME=value command" \
+laid over it, read through rather than copied\n'''
+
+    def __init__(self, base, changes):
+        self.base = base
+        self.changes = changes
+
+    def __getitem__(self, key):
+        if key in self.changes:
+            return self.changes[key]
+        return self.base[key]
+
+    def __iter__(self):
+        yield from self.changes
+        for key in self.base:
+            if key not in self.changes:
+                yield key
+
+    def __len__(self):
+        return len(self.base) + sum(key not in self.base
+                                    for key in self.changes)
+
+
+class Environment():
+
+    '''\nThe shell's variables. os.environ is kept in step, for the shell \
+and its builtins, while child processes are given block()\n'''
+
+    def __init__(self):
+        # the encoded variables, None once one of them has changed
+        self.cached = None
+
+    def block(self):
+
+        '''\nReturns the variables as a mapping of bytes for posix_spawn. \
+It is never changed afterwards, so it can be kept as a snapshot\n'''
+        if self.cached is None:
+            # os.environ already holds the variables encoded
+            data = getattr(os.environ, '_data', None)
+            if data is None:
+                data = {os.fsencode(name): os.fsencode(value)
+                        for name, value in os.environ.items()}
+            self.cached = dict(data)
+        return self.cached
+
+    def set(self, name, value):
+
+        '''\nSets a variable, only a new value means a new block\n'''
+        if os.environ.get(name) != value:
+            os.environ[name] = value
+            self.cached = None
+
+    def replace(self, variables):
+
+        '''\nReplaces every variable, with those of a server's client\n'''
+        os.environ.clear()
+        os.environ.update(variables)
+        self.cached = None
+
+    def unset(self, name):
+
+        '''\nRemoves a variable if it is set\n'''
+        if name in os.environ:
+            del os.environ[name]
+            self.cached = None
+
+
+# Shared by every shell, pipeline and batch job in the process
+environment = Environment()
+
+
+def assignment(word):
+
+    '''\nReturns (name, value) if a word is NAME=value, otherwise None\n'''
+    name, equals, value = word.partition('=')
+    if equals and name.isidentifier() and name.isascii():
+        return name, value
+    return None
+
+
+def only_assignments(argv):
+
+    '''\nReturns True if a command is nothing but NAME=value words\n'''
+    return bool(argv) and all(assignment(word) for word in argv)
+
+
+def split_assignments(argv):
+
+    '''\nTakes the NAME=value words off the front of a command, \
+returns them as (name, value) pairs and the rest of the command\n'''
+    assignments = []
+    for i, word in enumerate(argv):
+        pair = assignment(word)
+        if pair is None:
+            return assignments, argv[i:]
+        assignments.append(pair)
+    return assignments, []
+
+
+def child_env(argv, env=None):
+
+    '''\nReturns the environment block for a command and the command \
+without its NAME=value words, env is a snapshot taken when a batch job \
+was queued\n'''
+    if env is None:
+        env = environment.block()
+    assignments, argv = split_assignments(argv)
+    if assignments:
+        env = Overlay(env, {os.fsencode(name): os.fsencode(value)
+                            for name, value in assignments})
+    return env, argv
+
+
+def export_builtin(args):
+
+    '''\nThe export and set builtins: sets each NAME=value, or lists every \
+variable as NAME=value if none is given. Returns the output lines and an \
+exit status\n'''
+    if not args:
+        return [f'{name}={value}'
+                for name, value in sorted(os.environ.items())], 0
+    lines = []
+    status = 0
+    for word in args:
+        pair = assignment(word)
+        if pair is not None:
+            environment.set(*pair)
+        elif not (word.isidentifier() and word.isascii()):
+            lines.append(f'export: "{word}" is not a valid name')
+            status = 1
+        # every variable is exported, so a bare NAME changes nothing
+    return lines, status
+
+
+def unset_builtin(args):
+
+    '''\nThe unset builtin: removes each named variable. Returns the \
+output lines and an exit status\n'''
+    lines = []
+    status = 0
+    for name in args:
+        if name.isidentifier() and name.isascii():
+            environment.unset(name)
+        else:
+            lines.append(f'unset: "{name}" is not a valid name')
+            status = 1
+    return lines, status
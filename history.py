@@ -0,0 +1,322 @@
+'''
+Persistent, bounded command history shared by SeaTurtle (myshell.py)
+and MyShell (myshell2.py)
+'''
+import os
+import sys
+
+# Where the history is kept and how many commands are remembered,
+# $HISTFILE and $HISTSIZE override them like in bash
+HISTORY_FILE = '~/.seaturtle_history'
+HISTORY_SIZE = 1000
+
+# Bytes read at a time when loading the end of the history file
+BLOCK_SIZE = 64 * 1024
+
+# The file is rewritten with only the remembered commands once it grows
+# to this many times their size
+COMPACT_RATIO = 4
+
+
+class History():
+
+    '''\nNumbered command history, appended to its file one command at a \
+time and loaded from the end of the file the first time it is needed\n'''
+
+    def __init__(self, filename=None, size=None):
+        if filename is None:
+            filename = os.environ.get('HISTFILE', HISTORY_FILE)
+        self.filename = os.path.expanduser(filename)
+        # read from $HISTSIZE once the history is loaded, which a batch
+        # file never needs
+        self.size = size
+        # number -> command, oldest first
+        self.entries = None
+        # command -> number, so a repeated command replaces the old one
+        self.numbers = {}
+        # word -> numbers of the commands containing it
+        self.words = {}
+        self.sorted_words = None
+        self.next_number = 1
+        # bytes the remembered commands take up in the file
+        self.bytes = 0
+        self.fd = None
+        # readline's own history, kept in step once hooked up
+        self.readline = None
+
+    def load(self):
+
+        '''\nReads the most recent commands from the history file, \
+returns them oldest first\n'''
+        if self.entries is None:
+            self.entries = {}
+            if self.size is None:
+                self.size = history_size()
+            for line in tail(self.filename, self.size):
+                self.remember(line)
+        return list(self.entries.values())
+
+    def hook_readline(self):
+
+        '''\nGives readline the saved commands for the arrow keys and \
+Ctrl-R, and stops it remembering lines the history leaves out\n'''
+        try:
+            import readline
+        except ImportError:
+            return
+        readline.set_auto_history(False)
+        readline.clear_history()
+        for line in self.load():
+            readline.add_history(line)
+        self.readline = readline
+
+    def add(self, line):
+
+        '''\nRemembers a command and appends it to the history file\n'''
+        self.load()
+        line = line.strip()
+        if not line or self.size <= 0:
+            return
+        self.remember(line)
+        if self.readline is not None:
+            length = self.readline.get_current_history_length()
+            # repeating the last command doesn't add it again
+            if not length or self.readline.get_history_item(length) != line:
+                self.readline.add_history(line)
+        if not self.lock():
+            return
+        try:
+            os.write(self.fd, (line + '\n').encode())
+            size = os.fstat(self.fd).st_size
+            if size > COMPACT_RATIO * self.bytes + BLOCK_SIZE:
+                self.compact()
+        except OSError:
+            pass
+        finally:
+            self.unlock()
+
+    def lock(self):
+
+        '''\nOpens the history file if needed and locks it against other \
+shells, returns False if it can't be opened. A file another shell has \
+compacted in the meantime is opened again\n'''
+        # only a shell that saves commands locks the file
+        import fcntl
+        while True:
+            if self.fd is None:
+                try:
+                    # O_APPEND lets several shells share one history file
+                    self.fd = os.open(
+                                      self.filename,
+                                      os.O_WRONLY | os.O_CREAT | os.O_APPEND,
+                                      0o600
+                                     )
+                except OSError:
+                    return False
+            try:
+                fcntl.flock(self.fd, fcntl.LOCK_EX)
+            except OSError:
+                # a file system without locks, appending still works
+                return True
+            try:
+                if os.stat(self.filename).st_ino == os.fstat(self.fd).st_ino:
+                    return True
+            except OSError:
+                pass
+            # replaced or removed since it was opened
+            os.close(self.fd)
+            self.fd = None
+
+    def unlock(self):
+        # lets other shells write to or compact the file again
+        if self.fd is not None:
+            import fcntl
+            try:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+            except OSError:
+                pass
+
+    def remember(self, line):
+        # a repeated command moves to the end instead of being kept twice
+        if line in self.numbers:
+            self.forget(self.numbers[line])
+        number = self.next_number
+        self.next_number += 1
+        self.entries[number] = line
+        self.numbers[line] = number
+        self.bytes += len(line) + 1
+        for word in set(line.split()):
+            self.words.setdefault(word, set()).add(number)
+        self.sorted_words = None
+        # the oldest command is dropped once the history is full
+        while len(self.entries) > self.size:
+            self.forget(next(iter(self.entries)))
+
+    def forget(self, number):
+        # removes a command from the history and the word index
+        line = self.entries.pop(number)
+        del self.numbers[line]
+        self.bytes -= len(line) + 1
+        for word in set(line.split()):
+            numbers = self.words[word]
+            numbers.discard(number)
+            if not numbers:
+                del self.words[word]
+        self.sorted_words = None
+
+    def compact(self):
+        # rewrites the locked file with only its most recent commands,
+        # read again so those other shells added since this one started
+        # are kept, and replaces it in one step so it is never left half
+        # written. Shells still holding the old file open it again
+        lines = {}
+        for line in tail(self.filename, self.size):
+            # a repeated command is kept once, where it was last run
+            lines.pop(line, None)
+            lines[line] = None
+        temp = f'{self.filename}.{os.getpid()}'
+        try:
+            with open(temp, 'w') as f:
+                f.writelines(line + '\n' for line in lines)
+            os.replace(temp, self.filename)
+        except OSError:
+            try:
+                os.remove(temp)
+            except OSError:
+                pass
+            return
+        # closing the old file releases its lock too
+        os.close(self.fd)
+        self.fd = None
+
+    def get(self, number):
+
+        '''\nReturns the command with the given number, or None\n'''
+        self.load()
+        return self.entries.get(number)
+
+    def search(self, text):
+
+        '''\nReturns (number, command) for each command with a word for \
+every word of text starting with it, newest first\n'''
+        from bisect import bisect_left
+        self.load()
+        if self.sorted_words is None:
+            self.sorted_words = sorted(self.words)
+        found = None
+        for prefix in text.split():
+            # every word starting with the prefix is next to it when sorted
+            numbers = set()
+            i = bisect_left(self.sorted_words, prefix)
+            while i < len(self.sorted_words) \
+                    and self.sorted_words[i].startswith(prefix):
+                numbers |= self.words[self.sorted_words[i]]
+                i += 1
+            found = numbers if found is None else found & numbers
+        if found is None:
+            found = self.entries
+        return [(number, self.entries[number])
+                for number in sorted(found, reverse=True)]
+
+    def listing(self, count=None):
+
+        '''\nReturns (number, command) for the last count commands\n'''
+        self.load()
+        items = list(self.entries.items())
+        if count is not None:
+            items = items[-count:] if count > 0 else []
+        return items
+
+    def clear(self):
+
+        '''\nForgets every command and empties the history file\n'''
+        self.entries = {}
+        self.numbers.clear()
+        self.words.clear()
+        self.sorted_words = None
+        self.bytes = 0
+        try:
+            open(self.filename, 'w').close()
+        except OSError:
+            pass
+
+
+def history_size():
+
+    '''\nReturns how many commands $HISTSIZE says to remember. As in bash, \
+0 remembers none, a negative number every one, and a value that isn't a \
+number is ignored\n'''
+    try:
+        size = int(os.environ.get('HISTSIZE', HISTORY_SIZE))
+    except ValueError:
+        return HISTORY_SIZE
+    return sys.maxsize if size < 0 else size
+
+
+def tail(filename, count):
+
+    '''\nReturns the last count lines of a file, reading it backwards \
+so only the end of a large file is read\n'''
+    if count <= 0:
+        return []
+    try:
+        f = open(filename, 'rb')
+    except OSError:
+        return []
+    with f:
+        position = f.seek(0, os.SEEK_END)
+        blocks = []
+        newlines = 0
+        # one extra line, since the first one read may be partial
+        while position > 0 and newlines <= count:
+            step = min(BLOCK_SIZE, position)
+            position -= step
+            f.seek(position)
+            block = f.read(step)
+            newlines += block.count(b'\n')
+            blocks.append(block)
+    lines = b''.join(reversed(blocks)).decode(errors='replace').split('\n')
+    if position > 0:
+        # the first line started before the blocks that were read
+        lines = lines[1:]
+    return [line for line in lines[-count-1:] if line.strip()][-count:]
+
+
+def history_builtin(history, args):
+
+    '''\nLists the last N commands, searches them with -s or forgets them \
+with -c, returns the lines to print and the exit status\n'''
+    if args and args[0] == '-c':
+        history.clear()
+        return [], 0
+    if args and args[0] == '-s':
+        if len(args) < 2:
+            return ['Error: history -s needs something to search for'], 2
+        items = history.search(' '.join(args[1:]))
+    elif args:
+        try:
+            items = history.listing(int(args[0]))
+        except ValueError:
+            return [f'Error: "{args[0]}" is not a number'], 2
+    else:
+        items = history.listing()
+    return [f'{number:5}  {line}' for number, line in items], 0
+
+
+def rerun_line(history, args):
+
+    '''\nReturns the command "history -e N" runs again and an error \
+message, one of which is None\n'''
+    if not args:
+        # with no number the last command other than this one is run
+        items = history.listing(2)
+        if len(items) < 2:
+            return None, 'Error: no command to run again'
+        return items[0][1], None
+    try:
+        line = history.get(int(args[0]))
+    except ValueError:
+        return None, f'Error: "{args[0]}" is not a number'
+    if line is None:
+        return None, f'Error: no command number {args[0]} in the history'
+    return line, None
@@ -0,0 +1,141 @@
+'''
+Background job table shared by SeaTurtle (myshell.py) and MyShell (myshell2.py)
+'''
+import signal
+
+# Finished jobs kept for wait when nothing reports them, as in a batch
+# file, the oldest are forgotten first like bash forgets old statuses
+FINISHED_SIZE = 1000
+
+
+class Job():
+
+    '''\nA background process started with "&"\n'''
+
+    def __init__(self, number, process, command):
+        self.number = number
+        self.process = process
+        self.command = command
+
+    def state(self):
+        # describes the job the same way bash's jobs builtin does
+        status = self.process.returncode
+        if status is None:
+            return 'Running'
+        elif status == 0:
+            return 'Done'
+        elif status < 0:
+            return f'Killed ({signal.Signals(-status).name})'
+        return f'Exit {status}'
+
+    def __str__(self):
+        return f'[{self.number}] {self.state():<24}{self.command}'
+
+
+class JobTable():
+
+    '''\nTracks every background process until it has been waited for or \
+reported as finished\n'''
+
+    def __init__(self):
+        # jobs by job number, oldest first, with those that finished but
+        # haven't been waited for or reported yet
+        self.jobs = {}
+        # finished jobs waiting to be reported at the next prompt
+        self.finished = []
+        # batch mode has no prompt to report finished jobs at
+        self.notify = True
+
+    def watch(self):
+
+        '''\nReaps finished children as soon as they exit\n'''
+        # only the main thread may install signal handlers
+        signal.signal(signal.SIGCHLD, self.reap)
+
+    def add(self, process, command):
+
+        '''\nAdds a newly started background process to the table\n'''
+        # makes room once a batch file has left too many finished jobs
+        finished = [job for job in list(self.jobs.values())
+                    if job.process.returncode is not None]
+        for job in finished[:max(len(finished) - FINISHED_SIZE, 0)]:
+            self.forget(job)
+        # reuses the lowest free job number, like bash
+        number = 1
+        while number in self.jobs:
+            number += 1
+        job = Job(number, process, str(command))
+        self.jobs[number] = job
+        print(f'[{number}] {process.pid}')
+        return job
+
+    def reap(self, signum=None, frame=None):
+
+        '''\nCollects the exit status of every finished process so none of \
+them are left as zombies. The jobs stay in the table, so wait can still \
+give their status, until they are waited for or reported\n'''
+        for job in list(self.jobs.values()):
+            # poll() collects the exit status without blocking
+            if job.process.poll() is not None and self.notify \
+                    and job not in self.finished:
+                self.finished.append(job)
+
+    def report(self):
+
+        '''\nPrints the jobs that finished since the last prompt and takes \
+them out of the table\n'''
+        self.reap()
+        finished, self.finished = self.finished, []
+        for job in finished:
+            self.forget(job)
+            print(job)
+
+    def listing(self):
+
+        '''\nReturns every job, oldest first, for the jobs builtin. Those \
+that finished are taken out of the table, since this reports them\n'''
+        self.reap()
+        # a copy, since SIGCHLD can reap a job that ends while listing
+        jobs = [job for number, job in sorted(dict(self.jobs).items())]
+        for job in jobs:
+            if job.process.returncode is not None:
+                self.forget(job)
+        return jobs
+
+    def forget(self, job):
+        # takes a job out of the table, it no longer needs reporting
+        if self.jobs.get(job.number) is job:
+            del self.jobs[job.number]
+        if job in self.finished:
+            self.finished.remove(job)
+
+    def get(self, args):
+
+        '''\nReturns the job named by args, or the most recent one\n'''
+        if not args:
+            if not self.jobs:
+                return None
+            return self.jobs[max(self.jobs)]
+        # accepts both "2" and "%2"
+        number = args[0].lstrip('%')
+        if not number.isdigit():
+            return None
+        return self.jobs.get(int(number))
+
+    def wait(self, job):
+
+        '''\nBlocks until the given job finishes and returns its exit status\n'''
+        # a job that has already finished gives the status it was reaped with
+        status = job.process.wait()
+        # a job that was waited for doesn't need reporting
+        self.forget(job)
+        # killed processes use the shell's 128 + signal convention
+        return 128 - status if status < 0 else status
+
+    def wait_all(self):
+
+        '''\nBlocks until every job finishes, returns the last job's status\n'''
+        status = 0
+        while self.jobs:
+            status = self.wait(self.jobs[min(self.jobs)])
+        return status
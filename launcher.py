@@ -0,0 +1,109 @@
+'''
+Starts the external commands of SeaTurtle (myshell.py) and MyShell
+(myshell2.py) with os.posix_spawn, whose cost doesn't grow with the size of
+the shell the way fork does. subprocess is only used for what posix_spawn
+can't do here
+'''
+import os
+import signal
+
+from environment import environment
+
+# Signals Python ignores or handles itself that a program expects to find
+# at their defaults, as subprocess's restore_signals does
+DEFAULT_SIGNALS = tuple(
+                        getattr(signal, name) for name in
+                        ('SIGPIPE', 'SIGXFSZ')
+                        if hasattr(signal, name)
+                       )
+
+# Standard file descriptor of each stream keyword
+FDS = {
+       'stdin': 0,
+       'stdout': 1,
+       'stderr': 2,
+      }
+
+
+# Children dropped before they were waited for, e.g. after Ctrl-C,
+# reaped at the next spawn so they don't stay zombies, like subprocess does
+_unwaited = []
+
+
+class Process():
+
+    '''\nA child started with posix_spawn, which can be polled, waited on \
+and put in the job table like a Popen\n'''
+
+    def __init__(self, pid, args):
+        self.pid = pid
+        self.args = args
+        self.returncode = None
+
+    def poll(self):
+        if self.returncode is None:
+            try:
+                pid, status = os.waitpid(self.pid, os.WNOHANG)
+            except ChildProcessError:
+                # reaped elsewhere, its status is lost, as with Popen
+                self.returncode = 0
+                return self.returncode
+            if pid:
+                self.returncode = exit_code(status)
+        return self.returncode
+
+    def wait(self):
+        if self.returncode is None:
+            try:
+                pid, status = os.waitpid(self.pid, 0)
+            except ChildProcessError:
+                # the SIGCHLD handler's poll() got there first
+                return self.poll()
+            self.returncode = exit_code(status)
+        return self.returncode
+
+    def __del__(self):
+        if self.returncode is None:
+            _unwaited.append(self)
+
+
+def exit_code(status):
+
+    '''\nReturns the exit status of a child from its wait status as \
+Popen.returncode does, -N if signal N stopped it\n'''
+    # os.waitstatus_to_exitcode needs Python 3.9
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def spawn(argv, executable, cwd=None, env=None, **streams):
+
+    '''\nStarts a program with the file descriptors given as stdin, stdout \
+and stderr in place of the shell's and env as its environment block, the \
+shell's if None. Returns a Process, or a Popen when posix_spawn can't be \
+used. Raises OSError if it can't be started\n'''
+    for process in _unwaited[:]:
+        if process.poll() is not None:
+            _unwaited.remove(process)
+    if cwd is not None or not hasattr(os, 'posix_spawn'):
+        # posix_spawn can't change directory before Python 3.13,
+        # which only -j N jobs ask for
+        import subprocess
+        return subprocess.Popen(argv, executable=executable, cwd=cwd,
+                                env=env, **streams)
+    # the child gets its standard streams and nothing else, every other
+    # descriptor the shell opens is close-on-exec
+    actions = [(os.POSIX_SPAWN_DUP2, fd, FDS[name])
+               for name, fd in streams.items()]
+    if env is None:
+        # already encoded, where os.environ would encode every variable
+        env = environment.block()
+    pid = os.posix_spawn(
+                         executable,
+                         argv,
+                         env,
+                         file_actions=actions,
+                         setsigdef=DEFAULT_SIGNALS
+                        )
+    return Process(pid, argv)
@@ -1,165 +1,284 @@
 #!/usr/bin/env python3.7
 from cmd import Cmd
-import subprocess
 import os
 import sys
 
+import cmdparse
+from batchfile import open_batch, quick_options, read_files
+from batchplan import check, parse_lines, read_plan
+from coreutils import FAST_BUILTINS
+from dirlist import dir_lines, dir_options
+from environment import environment, export_builtin, only_assignments, \
+    unset_builtin
+from history import History, history_builtin, rerun_line
+from jobs import JobTable
+from pager import more
+from pathcache import hash_builtin
+from pipeline import start_pipeline
+from redirect import OutputCache, arguments, redirect_builtin
+from scheduler import Scheduler
+from timing import Stats, Timer, report, split_time, stats_builtin
+
+# The manual shown by "help more", kept next to the shell
+README = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'readme')
+
 
 class SeaTurtle(Cmd):
     '''\nWaits for a command line input,\
  then executes the input when it is recieved\n'''
     # Promt that comes up when the shell is launched
     intro = 'Type "help" to bring up a list of commands.\n'
-    # Sets $SHELL to "(LaunchDirectory)/MyShell"
-    os.environ['SHELL'] = os.getcwd()+'/MyShell'
-    if os.environ['HOME'] == os.getcwd()[0:len(os.environ['HOME'])]:
-        # If CWD is in $HOME(/home/user/) display $HOME as "~/"
-        prompt = '{}@{} ~{} $ '.format(
-                                       os.environ['USER'],
-                                       os.uname()[1],
-                                       os.getcwd()[len(os.environ['HOME']):]
-                                      )
-    else:
-        # otherwise display true directory
-        prompt = '{}@{} {} $ '.format(
-                                      os.environ['USER'],
-                                      os.uname()[1],
-                                      os.getcwd()
-                                     )
+    # Runs batch commands concurrently when using -j N
+    scheduler = None
+    # Files batch builtins append to, kept open between lines
+    outputs = None
+    # Commands like cat and rm that batch mode runs in the shell
+    fast = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Sets $SHELL to "(LaunchDirectory)/MyShell"
+        environment.set('SHELL', os.getcwd()+'/MyShell')
+        # Background processes started with &
+        self.jobs = JobTable()
+        self.jobs.watch()
+        # Indexes built in commands for tab completion, once a session starts
+        self.completer = None
+        # Commands typed at the prompt, the file is only read when needed
+        self.history = History()
+        # Only lines typed at the prompt are saved, not batch files
+        self.recording = False
+        # What each command line used, for the stats builtin
+        self.stats = Stats()
+        # Exit status of the last command line, that of a batch file
+        self.status = 0
+
+    def cmdloop(self, intro=None):
+
+        '''\nReads commands from the terminal, with the history of earlier \
+sessions on the up arrow and Ctrl-R\n'''
+        # The interactive modules and the prompt are only set up here,
+        # so batch runs reach their first command sooner
+        from completion import DELIMS, Completer
+        self.completer = Completer(
+            name[3:] for name in self.get_names() if name.startswith('do_')
+        )
+        try:
+            import readline
+            # Tab completes whole paths rather than stopping at "/"
+            readline.set_completer_delims(DELIMS)
+        except ImportError:
+            pass
+        SeaTurtle.prompt = get_prompt()
+        self.history.hook_readline()
+        self.recording = True
+        return super().cmdloop(intro)
+
+    def precmd(self, line):
+        # Appends each typed line to the history file straight away
+        if self.recording:
+            self.history.add(line)
+        return line
+
+    def completenames(self, text, *ignored):
+        # Completes the first word from the built in commands
+        # and the executables on $PATH
+        return self.completer.commands(text)
+
+    def completedefault(self, text, line, begidx, endidx):
+        # Completes any other word as a filename
+        return self.completer.filenames(text)
+
+    def postcmd(self, stop, line):
+        # Reports background jobs that finished before the next prompt
+        self.jobs.report()
+        return stop
+
+    def batch(self, commands):
+
+        '''\nRuns each command from an iterable of (line number, text, \
+Command or ParseError) as it is read, returns the exit status of the last \
+one, or of a -j N command that failed\n'''
+        self.preloop()
+        stop = None
+        try:
+            for number, line, command in commands:
+                line = self.precmd(line)
+                if isinstance(command, cmdparse.ParseError):
+                    print('Error: {}'.format(command))
+                    self.status = 2
+                    stop = None
+                else:
+                    stop = self.run_line(line, command)
+                stop = self.postcmd(stop, line)
+                if stop:
+                    break
+        finally:
+            if self.outputs is not None:
+                # The end of the script, or quit
+                self.outputs.close()
+        self.postloop()
+        if self.scheduler is not None:
+            # Waits for the commands still running at the end of the file
+            self.status = self.scheduler.shutdown() or self.status
+        return self.status
 
     def emptyline(self, arg=None):
         print('',end='')
 
+    def onecmd(self, line):
+        try:
+            # Splits the line into arguments and redirections
+            command = cmdparse.parse(line)
+        except cmdparse.ParseError as e:
+            print('Error: {}'.format(e))
+            return None
+        return self.run_line(line, command)
+
+    def run_line(self, line, command):
+
+        '''\nRuns a parsed command line\n'''
+        if command is None:
+            return self.emptyline()
+        # "time" in front of a command reports what it used
+        command, timed = split_time(command)
+        with Timer() as timer:
+            stop = self.dispatch(command, line, timed)
+        self.stats.add(line, timer)
+        if timed:
+            report(timer)
+        return stop
+
+    def dispatch(self, command, line, timed):
+
+        '''\nRuns a parsed command line, timed ones are never queued\n'''
+        # Builtins succeed unless they say otherwise
+        self.status = 0
+        if command is None:
+            # "time" on its own
+            return None
+        if timed:
+            # The builtin is given the line without "time"
+            line = line.split(None, 1)[1]
+        if command.pipe is None and only_assignments(command.argv):
+            # "NAME=value" on its own sets the variable, like export
+            self.export(command.argv)
+            return None
+        builtin = command.pipe is None and command.argv \
+            and hasattr(self, 'do_' + command.argv[0])
+        if self.outputs is not None:
+            # Writes out what builtins appended to files before anything
+            # that might read them, or a cd
+            self.outputs.sync(command, builtin)
+        if builtin:
+            try:
+                # Built in commands print to the redirected files
+                with redirect_builtin(command.redirects, self.outputs):
+                    return super().onecmd(line)
+            except OSError as e:
+                # If a redirected file can't be opened
+                print('Error: File "{}" {}'.format(e.filename,
+                                                   e.strerror.lower()))
+                self.status = 1
+                return None
+        # Processes and pipelines
+        if timed:
+            self.status = run(command, jobs=self.jobs, fast=self.fast)
+        else:
+            self.launch(run, command)
+        return None
+
     def default(self, arg):
 
         '''\nRuns as a subprocess if the command is not built in\n'''
+        self.launch(run, cmdparse.parse(arg))
+
+    def launch(self, func, command):
+
+        '''\nRuns a process or pipeline and keeps its exit status, or queues \
+it when using -j N\n'''
+        if self.scheduler is not None and not command.background:
+            # Queues the command with a snapshot of the current directory
+            # and environment, so a later cd can't affect it, the
+            # environment block is replaced rather than changed so it
+            # needs no copy
+            self.scheduler.submit(func, command, os.getcwd(),
+                                  environment.block(), None, self.fast)
+        else:
+            self.status = func(command, jobs=self.jobs, fast=self.fast)
+
+    def do_jobs(self, arg):
+
+        '''\nLists the background jobs, with those that finished since they \
+were last reported\n'''
+        for job in self.jobs.listing():
+            print(job)
+
+    def do_wait(self, arg):
+
+        '''\nWaits for the given background job, or for every background job \
+and queued batch command if none is given\n'''
         args = parse(arg)
-        try:
-            if args[-1] == '&':
-                # Runs program as a background process
-                for i in range(0, len(args[:-1])):
-                    if args[i] == '>':
-                        # Using overwrite output
-                        try:
-                            overwrite(subprocess.Popen(args[:i]), args[i+1:])
-                        except IndexError:
-                            # If no filename given
-                            print('Error: No filename given')
-                    elif args[i] == '>>':
-                        # Using append overwrite
-                        try:
-                            append(subprocess.Popen(args[:i], args[i+1]))
-                        except IndexError:
-                            # If no filename given
-                            print('Error: No filename given')
-                    else:
-                        try:
-                            subprocess.Popen(args[:-1])
-                        except FileNotFoundError:
-                            # If the command doesn't exist
-                            print('Error: No such command')
-            else:
-                try:
-                    subprocess.run(args)
-                except FileNotFoundError:
-                    # If the command doesn't exist
-                    print('Error: No such command')
-        except IndexError:
-            # If command with no arguments given
-            try:
-                subprocess.run(args)
-            except FileNotFoundError:
-                # If the command doesn't exist
-                print('Error: No such command')
+        status = 0
+        if self.scheduler is not None:
+            status = self.scheduler.wait()
+        if not args:
+            self.status = self.jobs.wait_all() or status
+            return
+        job = self.jobs.get(args)
+        if job is None:
+            print('Error: No such job "{}"'.format(args[0]))
+            self.status = 127
+        else:
+            self.status = self.jobs.wait(job)
+
+    def do_fg(self, arg):
+
+        '''\nWaits in the foreground for the given background job, \
+or the most recent one if none is given\n'''
+        job = self.jobs.get(parse(arg))
+        if job is None:
+            print('Error: No such job')
+            self.status = 1
+        else:
+            print(job.command)
+            self.status = self.jobs.wait(job)
 
     def do_dir(self, arg):
         '''\nlists the contents of a directory, \
-or prints the current directory if no arguemts are given\n'''
+or prints the current directory if no arguemts are given. \
+-l gives details, -S sorts by size and -t by modification time. \
+-R lists subdirectories too and -s counts the files and bytes under each, \
+-d N stops N levels down and -x PATTERN leaves out matching names\n'''
         # Gets list of command line arguments
-        args = parse(arg)
         try:
-            # if using standard input
-            if args[0] == '<':
-                try:
-                    # Use contents of input file as directory
-                    data = from_input(args[1])
-                    try:
-                        # If using output to append data
-                        if args[2] == '>>':
-                            try:
-                                # append contents to the file
-                                append(ls_dir(data[0]), args[3:])
-                            except IndexError:
-                                # If no filename specified
-                                print('Error: No filename given')
-                                string = 'Usage: dir < {} >> <filename>'
-                                string = string.format(data[0])
-                                print(string)
-
-                        elif args[2] == '>':
-                            try:
-                                # overwrite the data in the file
-                                overwrite(ls_dir(data[0]), args[3:])
-                            except IndexError:
-                                # If no filename specified
-                                print('Error: No filename given')
-                                string = 'Usage: dir < {} >> <filename>'
-                                string = string.format(data[0])
-                                print(string)
-                        else:
-                            # If standard output not being used
-                            # Prints content
-                            print(ls_dir(data[0]))
-                    except IndexError:
-                        # If standard output not being used
-                        # Prints content
-                        print(ls_dir(data[0]))
-                except IndexError:
-                    # shows this error message if no filename was specified
-                    print('Error: No filename given')
-                    print('Usage: dir < <filename>')
-            elif args[1] == '>>':
-                # If using append output with a specific directory
-                try:
-                    # Appends to the filename specified
-                    append(ls_dir(args[0]), args[2:])
-                except IndexError:
-                    # Shows this error if no filename is specified
-                    print('Error: No filename given')
-                    print('Usage: dir {} >> <filename>'.format(args[0]))
-            elif args[1] == '>':
-                # If using overwrite output with a specific directory
-                try:
-                    # Overwrites the contents of the listed directory
-                    overwrite(ls_dir(args[0]), args[2:])
-                except IndexError:
-                    # Shows this error if no filename is specified
-                    print('Error: No filename given')
-                    print('Usage: dir {} > <filename>'.format(args[0]))
-                # If using append output without a specified directory
-            elif args[0] == '>>':
-                try:
-                    # Append to the specified file
-                    append([ls_dir()], args[1:])
-                except IndexError:
-                    # If no filename is specified
-                    print('Error: No filename given')
-                    print('Usage: dir >> <filename>')
-            elif args[0] == '>':
-                # If using overwrite without a specified directory
-                try:
-                    # Overwrites file's contents
-                    overwrite([ls_dir()], args[1:])
-                except IndexError:
-                    # If no filename is specified
-                    print('Error: No filename given')
-                    print('Usage: dir > <filename>')
-            else:
-                # prints the content of the specified directory
-                print(ls_dir(args[0]))
-        except IndexError:
-            # Prints the content of the current directory
-            print(ls_dir())
+            options = dir_options(parse(arg))
+        except ValueError as e:
+            print('Error: {}'.format(e))
+            self.status = 2
+            return
+        # Writes each entry of the given directory, or the current one,
+        # as soon as it is read
+        sys.stdout.writelines(
+            line + '\n' for line in self.ls_dir(options.directory, options)
+        )
+
+    def ls_dir(self, directory, options):
+
+        '''\nYields the contents of a directory one entry at a time, an \
+error sets the exit status to 1\n'''
+        try:
+            # The given directory, or the current one if none is specified
+            yield from dir_lines(directory or os.getcwd(), options)
+        except FileNotFoundError:
+            # Shows this error message if the directory does not exist
+            print('Error: Directory "{}" not found'.format(directory))
+            self.status = 1
+        except OSError as e:
+            # If it isn't a directory or can't be read
+            print('Error: Directory "{}" {}'.format(directory,
+                                                    e.strerror.lower()))
+            self.status = 1
 
     def do_clr(self, arg):
 
@@ -169,44 +288,8 @@ or prints the current directory if no arguemts are given\n'''
     def do_echo(self, arg):
 
         '''\nPrints the arguments to the terminal\n'''
-        args = parse(arg)
-        comment = []
-        count = 0
-        for i in range(0, len(args)):
-            # If using overwrite
-            if args[i] == '>':
-                # concatenate preceding arguments to a string
-                echoed = get_echo(comment)
-                try:
-                    # outputs the string to the given file
-                    overwrite([echoed], args[i+1:])
-                    break
-                except IndexError:
-                    # prints this error message if no filename is given
-                    print('Error: No filename given')
-                    print('Usage: echo <comment> > <filename>')
-                    break
-            # If using append
-            elif args[i] == '>>':
-                # concatenate preceding arguments to a string
-                echoed = get_echo(comment)
-                try:
-                    # outputs the string to the given file
-                    append([echoed], args[i+1:])
-                    break
-                except IndexError:
-                    # shows this error if no filename is given
-                    print('Error: No filename given')
-                    print('Usage: echo <comment> >> <filename>')
-                    break
-            else:
-                # appends arguments that are not output commands to a list
-                comment.append(args[i])
-                count += 1
-        # If the loop did not break early
-        if count == len(args):
-            # Print the concatenated list of arguments as a string
-            print(get_echo(comment))
+        # Print the concatenated list of arguments as a string
+        print(get_echo(parse(arg)))
 
     def do_cd(self, arg):
 
@@ -216,23 +299,13 @@ display current directory if no directroy is given\n'''
         try:
             # changes directory to given directory
             os.chdir(args[0])
-            os.environ['PWD'] = os.getcwd()
-            curr_dir = os.getcwd()[0:len(os.environ['HOME'])]
-            if os.environ['HOME'] == curr_dir:
-                # If CWD is in $HOME(/home/user/) display $HOME as "~/"
-                ndir = os.getcwd()[len(os.environ['HOME']):]
-                user = os.environ['USER']
-                host = os.uname()[1]
-                SeaTurtle.prompt = '{}@{} ~{} $ '.format(user, host, ndir)
-            else:
-                # otherwise display true directory
-                ndir = os.getcwd()
-                user = os.environ['USER']
-                host = os.uname()[1]
-                SeaTurtle.prompt = '{}@{} {} $ '.format(user, host, ndir)
+            environment.set('PWD', os.getcwd())
+            # Shows the new directory in the prompt
+            SeaTurtle.prompt = get_prompt()
         except FileNotFoundError:
             # displays this error message if the given file does not exist
             print('Error: No such directory')
+            self.status = 1
         except IndexError:
             print(os.getcwd())
             # if no directory is given, change directory to $HOME
@@ -245,29 +318,87 @@ display current directory if no directroy is given\n'''
     def do_environ(self, arg):
 
         '''\nprints all environment variables, separated by a newline\n'''
-        # converts arg to a list
+        print("\n".join(get_environ()))
+
+    def do_export(self, arg):
+
+        '''\nSets each NAME=value given, or lists every environment variable \
+if none is given. "NAME=value command" sets it for that command only\n'''
+        self.export(parse(arg))
+
+    def do_set(self, arg):
+
+        '''\nThe same as export, every variable is an environment variable\n'''
+        self.export(parse(arg))
+
+    def export(self, args):
+        # Sets or lists the variables, for export, set and NAME=value
+        lines, self.status = export_builtin(args)
+        for line in lines:
+            print(line)
+
+    def do_unset(self, arg):
+
+        '''\nRemoves the given environment variables\n'''
+        lines, self.status = unset_builtin(parse(arg))
+        for line in lines:
+            print(line)
+
+    def do_hash(self, arg):
+
+        '''\nLists the remembered paths of commands, "hash -r" forgets them\n'''
+        lines, self.status = hash_builtin(parse(arg))
+        for line in lines:
+            print(line)
+
+    def do_history(self, arg):
+
+        '''\nLists the commands typed at the prompt, or the last N, \
+"history -s TEXT" searches them, "history -e N" runs number N again \
+and "history -c" forgets them\n'''
         args = parse(arg)
-        try:
-            # If using overwrite
-            if args[0] == '>':
-                try:
-                    # Output environment strings to the specified file
-                    overwrite(get_environ(), args[1:])
-                except IndexError:
-                    # Print this Error message if no filename is given
-                    print('Error: No filename given')
-                    print('Usage: environ > <filename>')
-            # If using append
-            elif args[0] == '>>':
-                try:
-                    # Appends output to the given file
-                    append(get_environ(), args[1:])
-                except IndexError:
-                    # Print this Error message if no filename is given
-                    print('Error: No filename given')
-                    print('Usage: environ >> <filename>')
-        except IndexError:
-            print("\n".join(get_environ()))
+        if args and args[0] == '-e':
+            line, error = rerun_line(self.history, args[1:])
+            if error is not None:
+                print(error)
+                self.status = 1
+                return
+            # Shows the command and remembers it as the latest one
+            print(line)
+            self.precmd(line)
+            self.onecmd(line)
+            return
+        lines, self.status = history_builtin(self.history, args)
+        for line in lines:
+            print(line)
+
+    def do_more(self, arg):
+
+        '''\nPages through a file. Space and b move forward and back a page, \
+Enter and k a line, a number followed by g goes to that line, \
+G to the end and q quits\n'''
+        args = parse(arg)
+        if not args:
+            print('Error: No file given')
+        else:
+            page_file(args[0])
+
+    def help_more(self):
+        # "help more" pages through the manual
+        page_file(README)
+
+    def help_time(self):
+        # "time" is taken off the line before it is run, so it has no do_time
+        print('\nRuns the command after it and reports its real, user and sys \
+time and peak memory, in the format given by $TIMEFORMAT\n')
+
+    def do_stats(self, arg):
+
+        '''\nLists the N command lines that took longest this session, \
+10 by default, with the totals of every command, "stats -c" forgets them\n'''
+        lines, self.status = stats_builtin(self.stats, parse(arg))
+        for line in lines:
+            print(line)
 
     def do_pause(self, arg):
 
@@ -280,6 +411,57 @@ display current directory if no directroy is given\n'''
         exit()
 
 
+def run(command, cwd=None, env=None, jobs=None, fast=None):
+
+    '''\nRuns a command or pipeline that isn't built in and returns \
+its exit status, background processes are added to jobs and the \
+commands in fast are run in the shell\n'''
+    pipeline = start_pipeline(command, PIPE_BUILTINS, cwd, env, fast)
+    if command.background:
+        if jobs is not None:
+            # Keeps track of the process so it can be reaped
+            jobs.add(pipeline, command)
+        return 0
+    return pipeline.wait()
+
+
+def pipe_dir(args, cwd):
+
+    '''\nLists a directory one entry per line for the next command\n'''
+    options = dir_options(args)
+    directory = options.directory or cwd or os.getcwd()
+    if cwd is not None:
+        directory = os.path.join(cwd, directory)
+    return dir_lines(directory, options)
+
+
+def pipe_echo(args, cwd):
+
+    '''\nPasses the comment on to the next command\n'''
+    return [get_echo(args)]
+
+
+def pipe_environ(args, cwd):
+
+    '''\nPasses the environment strings on to the next command\n'''
+    return get_environ()
+
+
+def pipe_history(args, cwd):
+
+    '''\nPasses the numbered history on to the next command, e.g. grep\n'''
+    return history_builtin(History(), args)[0]
+
+
+# Built in commands that can be a stage of a pipeline
+PIPE_BUILTINS = {
+                 'dir': pipe_dir,
+                 'echo': pipe_echo,
+                 'environ': pipe_environ,
+                 'history': pipe_history,
+                }
+
+
 def get_environ():
 
     '''\nreturns a list containing all the environment \
@@ -290,91 +472,165 @@ variables and their values as strings\n'''
     return env_list
 
 
-def get_echo(comment):
+def page_file(filename):
 
-    '''\nConcatenates a list to a single string\n'''
-    return " ".join(comment)
-
-
-def ls_dir(directory=None):
-
-    '''\nReturns the contents of a directory as a string\n'''
+    '''\nPages through a file, printing an error if it can't be opened\n'''
     try:
-        # If a directory is specified
-        if directory is not None:
-            # Return a string containing all the contents
-            return "\n".join([f for f in os.listdir(directory)])
-        # If no directory is specified
-        else:
-            # Return a string containing the contents of the current directory
-            return '\n'.join([f for f in os.listdir(os.getcwd())])
+        more(filename)
     except FileNotFoundError:
-        # Shows this error message if the directory does not exist
-        print('Error: Directory "{}" not found'.format(directory))
+        print('Error: File "{}" not found'.format(filename))
+    except (OSError, ValueError):
+        # Directories and files that can't be mapped
+        print('Error: File "{}" can\'t be paged'.format(filename))
 
 
-def from_input(filename):
+def get_prompt():
 
-    '''\ngets content from the specified file and returns it as a list\n'''
-    try:
-        with open(filename, 'r') as f:
-            # returns a list of all the lines contained in the file
-            return [args.strip() for args in f.readlines()]
-    except FileNotFoundError:
-        # Shows this error message if the file does not exist
-        print('Error: File "{}" not found'.format(filename))
+    '''\nReturns the prompt for the current user, host and directory\n'''
+    if os.environ['HOME'] == os.getcwd()[0:len(os.environ['HOME'])]:
+        # If CWD is in $HOME(/home/user/) display $HOME as "~/"
+        return '{}@{} ~{} $ '.format(
+                                     os.environ['USER'],
+                                     os.uname()[1],
+                                     os.getcwd()[len(os.environ['HOME']):]
+                                    )
+    # otherwise display true directory
+    return '{}@{} {} $ '.format(
+                                os.environ['USER'],
+                                os.uname()[1],
+                                os.getcwd()
+                               )
 
 
-def overwrite(data, args):
+def get_echo(comment):
 
-    '''\noverwrites any data within a file with new data, \
-or creates a new file containing the new data if one doesn't exist\n'''
-    try:
-        # Opens the file, or creates one with that name if it doesn't exist
-        with open(args[0], 'w+') as f:
-            for a in data:
-                # Writes the data to the file
-                f.write(a)
-                # Adds a newline character to the end of the file
-                f.write('\n')
-    except IndexError:
-        # Shows this error message if no file was specified
-        print('Usage: <command> > <filename>')
-
-
-def append(data, args):
-
-    '''\nappends new data to a file, or creates a file containing the new data if \
-one does not exist\n'''
-    try:
-        # Opens the file, or creates one with that name if it doesn't exist
-        with open(args[0], 'a+') as f:
-            for a in data:
-                # Writes the data to the file
-                f.write(a)
-                # Adds a newline charater to the end of the file
-                f.write('\n')
-    except IndexError:
-        # Shows this error message if no filename was specified
-        print('Usage: <command> >> <filename>')
+    '''\nConcatenates a list to a single string\n'''
+    return " ".join(comment)
 
 
 def parse(arg):
 
     '''\nGets the command line arguments and returns them as list without the \
 original command\n'''
-    return arg.split()
+    # Redirections are left out, except "<" whose file's lines are
+    # added to the arguments
+    command = cmdparse.parse(arg)
+    if command is None:
+        return []
+    return arguments(command)
+
+
+def read_options(argv):
+
+    '''\nReads the command line options, argparse is only loaded for the \
+unusual ones\n'''
+    # The usual options are read without loading argparse
+    options = quick_options(argv)
+    if options is None:
+        import argparse
+        parser = argparse.ArgumentParser(description='SeaTurtle shell')
+        parser.add_argument('files', nargs='*', metavar='file',
+                            help='batch file to run, or "-" for standard input')
+        parser.add_argument('-P', '--parallel', type=int, metavar='N',
+                            help='run several batch files, up to N at once')
+        parser.add_argument('-c', dest='command', metavar='COMMAND',
+                            help='run the command line given instead of a '
+                                 'batch file')
+        parser.add_argument('-j', '--jobs', type=int, default=1, metavar='N',
+                            help='run up to N batch commands at once')
+        parser.add_argument('-E', '--external', action='store_true',
+                            help='run cat, head, wc, true, mkdir and rm as '
+                                 'programs rather than in the shell')
+        parser.add_argument('--check', action='store_true',
+                            help='report the lines of the batch file that '
+                                 "can't run, without running it")
+        parser.add_argument('--serve', metavar='PATH',
+                            help='run the batch files and commands client.py '
+                                 'sends to the Unix socket PATH')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            metavar='N',
+                            help='with --serve, run up to N requests at once')
+        options = parser.parse_args(argv)
+        read_files(parser, options)
+        if options.command is not None and options.file is not None:
+            parser.error('-c runs a command instead of a batch file')
+    return options
+
+
+def main(options):
+
+    '''\nRuns the shell the options ask for, returns its exit status\n'''
+    if options.serve is not None:
+        # Runs each request in a copy of this shell, already loaded
+        from server import serve
+        return serve(options.serve, max(options.workers, 1), serve_request)
+    if options.parallel is not None:
+        # Each file runs in its own copy of this shell
+        from runner import run_scripts
+        return run_scripts(options.files, options.parallel,
+                           lambda name: run_file(options, name))
+    if options.check and options.file is None:
+        print('Error: --check needs a batch file')
+        return 2
+    if options.file is None and options.command is None:
+        SeaTurtle().cmdloop()
+        return 0
+    st = SeaTurtle()
+    st.intro = None
+    if options.command is not None:
+        # "-c" runs its lines as a batch file would
+        lines = parse_lines(options.command.splitlines())
+    else:
+        try:
+            # If using batch file, "-" streams commands from standard input
+            f = open_batch(options.file)
+        except OSError as e:
+            # The batch file doesn't exist or can't be read
+            print('Error: Batch file "{}" {}'.format(options.file,
+                                                     e.strerror.lower()))
+            return 1
+        if options.check:
+            # Parses the whole file and looks the commands up, running nothing
+            builtins = {name[3:] for name in st.get_names()
+                        if name.startswith('do_')}
+            return check(f, builtins | set(PIPE_BUILTINS))
+        # An unchanged file's lines come already parsed from its plan
+        lines = read_plan(f)
+    # There is no prompt to report finished background jobs at
+    st.jobs.notify = False
+    # ">>" files stay open from one line to the next
+    st.outputs = OutputCache()
+    if not options.external:
+        # The commonest small commands don't start a process
+        st.fast = FAST_BUILTINS
+    if options.jobs > 1:
+        st.scheduler = Scheduler(options.jobs)
+    # Runs the commands one line at a time, then exits the shell with the
+    # status of the last one
+    return st.batch(lines)
+
+
+def run_file(options, name):
+
+    '''\nRuns one of the files given to -P, in the process forked for it, \
+which has its own copy of the options\n'''
+    options.file = name
+    options.parallel = None
+    return main(options)
+
+
+def serve_request(argv):
+
+    '''\nRuns a request sent by client.py, in a worker of the server that \
+has the client's directory, environment and standard streams\n'''
+    options = read_options(argv)
+    if options.serve is not None or \
+            (options.file is None and options.command is None):
+        # The worker has no terminal of its own to prompt at
+        print('Error: the server only runs batch files and -c commands')
+        return 2
+    return main(options)
 
 
 if __name__ == "__main__":
-    try:
-        # If using batch file
-        with open(sys.argv[1], 'r') as f:
-            st = SeaTurtle()
-            queue = f.readlines()
-            queue.append('quit')
-            st.cmdqueue = queue
-            st.intro = None
-            st.cmdloop()
-    except IndexError:
-        SeaTurtle().cmdloop()
+    sys.exit(main(read_options(sys.argv[1:])))
@@ -1,32 +1,27 @@
 #!/usr/bin/env python3
 
 import os
-import readline
-import subprocess
 import sys
-import termios
-import tty
-from getpass import getpass
-
-def getch():
-    # Parses keypresses without having to press Enter
-    fd = sys.stdin.fileno()
-    old = termios.tcgetattr(fd)
-    try:
-        tty.setraw(sys.stdin.fileno())
-        ch = sys.stdin.read(1)
-    finally:
-        termios.tcsetattr(fd, termios.TCSADRAIN, old)
-    return ch
-    
-# tab key calls the complete function
-readline.parse_and_bind("tab: complete")
-def complete(text, state):
-    volcab = ['dir','echo','quit','cd','environ','clr','pause','help']
-    results = [x for x in volcab if x.startswith(text)] + [None]
-    # returns the completed function name
-    return results[state]
-readline.set_completer(complete)
+
+from batchfile import open_batch, quick_options, read_files
+from batchplan import check, read_plan
+from cmdparse import ParseError, parse
+from coreutils import FAST_BUILTINS
+from dirlist import dir_lines, dir_options
+from environment import environment, export_builtin, only_assignments, \
+    unset_builtin
+from history import History, history_builtin, rerun_line
+from jobs import JobTable
+from pager import more
+from pathcache import hash_builtin
+from pipeline import start_pipeline
+from redirect import OutputCache, arguments, redirect_builtin
+from scheduler import Scheduler
+from timing import Stats, Timer, report, split_time, stats_builtin
+
+# the manual shown by "help more", kept next to the shell
+README = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'readme')
+
 
 class MyShell():
 
@@ -36,7 +31,7 @@ class MyShell():
         user = os.environ['USER']
         cwd = os.environ['PWD']
         # makes $SHELL point to myshell.py
-        os.environ['SHELL'] = os.getcwd()+'/MyShell'
+        environment.set('SHELL', os.getcwd()+'/MyShell')
         env_len = len(os.environ['HOME'])
         if os.environ['HOME'] in os.getcwd():
             self.prompt = f"{user}@{host} ~{cwd[env_len:]}$ "
@@ -53,92 +48,240 @@ class MyShell():
                            'clr': self.do_clr,
                            'pause': self.do_pause,
                            'help': self.do_help,
+                           'jobs': self.do_jobs,
+                           'wait': self.do_wait,
+                           'fg': self.do_fg,
+                           'hash': self.do_hash,
+                           'history': self.do_history,
+                           'more': self.do_more,
+                           'stats': self.do_stats,
+                           'export': self.do_export,
+                           'set': self.do_export,
+                           'unset': self.do_unset,
                           }
-        # set of functions specific to batch files
+        # set of functions that can be called from batch files
         self.disbatcher = {
-                           'dir': self.b_dir,
-                           'echo': self.b_echo,
+                           'dir': self.do_dir,
+                           'echo': self.do_echo,
                            'quit': self.do_quit,
-                           'cd': self.b_cd,
-                           'environ': self.b_env,
+                           'cd': self.do_cd,
+                           'environ': self.do_env,
+                           'wait': self.b_wait,
+                           'jobs': self.do_jobs,
+                           'fg': self.do_fg,
+                           'hash': self.do_hash,
+                           'more': self.do_more,
+                           'stats': self.do_stats,
+                           'export': self.do_export,
+                           'set': self.do_export,
+                           'unset': self.do_unset,
                           }
+        # builtins that can be a stage of a pipeline
+        self.pipe_builtins = {
+                              'dir': self.p_dir,
+                              'echo': self.p_echo,
+                              'environ': self.p_env,
+                              'history': self.p_history,
+                             }
+        # runs batch commands concurrently when using -j N
+        self.scheduler = None
+        # files batch builtins append to, kept open between lines
+        self.outputs = None
+        # commands like cat and rm that batch mode runs in the shell
+        self.fast = None
+        # background processes started with &
+        self.jobs = JobTable()
+        self.jobs.watch()
+        # commands typed at the prompt, the file is only read when needed
+        self.history = History()
+        # what each command line used, for the stats builtin
+        self.stats = Stats()
 
     def pre(self):
+        # the interactive modules are only loaded when a session starts,
+        # so batch runs reach their first command sooner
+        import readline
+        from completion import DELIMS, Completer
+        # tab key completes builtins, commands on $PATH and filenames
+        readline.parse_and_bind("tab: complete")
+        readline.set_completer_delims(DELIMS)
+        readline.set_completer(Completer(self.dispatcher).complete)
+        # up arrow and Ctrl-R search the commands of earlier sessions
+        self.history.hook_readline()
         # Prints the help prompt when the shell is first opened
         print('type "help" for a list of commands')
-        self.line()
+        return self.loop()
 
-    def line(self):
+    def loop(self):
 
         ''' Main loop of the shell program '''
 
-        commands = []
-        # Takes user input as a list of arguments
-        args = input(self.prompt).split(" ")
-        commands.append(args)
-        invalid = f'Error: "{args[0]}" is not a valid command'
+        status = 0
+        while True:
+            # reports background jobs that finished since the last prompt
+            self.jobs.report()
+            try:
+                # Takes user input as a single line
+                text = input(self.prompt)
+            except EOFError:
+                # Ctrl-D closes the shell with the last exit status
+                print()
+                return status
+            except KeyboardInterrupt:
+                # Ctrl-C discards the current line
+                print()
+                continue
+            # appends the line to the history file straight away
+            self.history.add(text)
+            try:
+                status = self.line(text)
+            except KeyboardInterrupt:
+                # Ctrl-C stops the command and returns to the prompt
+                print()
+                status = 130
+
+    def line(self, text):
+
+        ''' Runs a single command line and returns its exit status '''
+
         try:
+            # Splits the line into arguments and redirections
+            command = parse(text)
+        except ParseError as e:
+            print(f'Error: {e}')
+            return 2
+        if command is None:
+            # Empty lines do nothing
+            return 0
+        # "time" in front of a command reports what it used
+        command, timed = split_time(command)
+        with Timer() as timer:
+            status = self.dispatch(command)
+        self.stats.add(text, timer)
+        if timed:
+            report(timer)
+        return status
+
+    def dispatch(self, command):
+
+        ''' Runs a parsed command line and returns its exit status '''
+
+        if command is None:
+            # "time" on its own
+            return 0
+        if command.pipe is None and only_assignments(command.argv):
+            # "NAME=value" on its own sets the variable, like export
+            return self.do_export(command.argv)
+        handler = self.dispatcher.get(command.argv[0]) if command.argv else None
+        if handler is not None and command.pipe is None:
             # If the command is a shell command
-            self.dispatcher[args[0]](args[1:])
-            self.line()
-        except KeyError:
-            # If the command is not a shell command
-            try:
-                # If forking to background
-                if args[-1] == '&':
-                    for i in range(1, len(args[:-1])):
-                        # If forking and overwriting
-                        if args[i] == '>':
-                            try:
-                                self.overwrite(
-                                    args[i+1],
-                                    subprocess.Popen(args[:i])
-                                )
-                                self.line()
-                            except IndexError:
-                                # If no filename is provided
-                                print('Error: No filename given')
-                                self.line()
-                            except FileNotFoundError:
-                                # If the command is invalid
-                                print(invalid)
-                                self.line()
-                        # If forking and using append
-                        elif args[i] == '>>':
-                            try:
-                                self.append(
-                                            args[i+1],
-                                            subprocess.Popen(args[:i])
-                                           )
-                                self.line()
-                            except IndexError:
-                                # If no filename is given
-                                print('Error: No filename given')
-                                self.line()
-                            except FileNotFoundError:
-                                # I fthe command is invalid
-                                print(invalid)
-                                self.line()
-                        else:
-                            try:
-                                # If not using IO redirection
-                                subprocess.Popen(args[:-1])
-                                self.line()
-                            except FileNotFoundError:
-                                # If the command is invalid
-                                print(invalid)
-                                self.line()
-                else:
-                    # If not forking to background
-                    try:
-                        subprocess.run(args)
-                        self.line()
-                    except FileNotFoundError:
-                        # If the command is invalid
-                        print(invalid)
-                        self.line()
-            except PermissionError:
-                self.line()
+            return self.builtin(handler, command)
+        # If the command is not a shell command
+        return self.run(command)
+
+    def builtin(self, handler, command):
+
+        ''' Runs a built in command with its redirections
+        and returns its exit status '''
+
+        try:
+            args = arguments(command, 1)
+            with redirect_builtin(command.redirects, self.outputs):
+                status = handler(args)
+        except OSError as e:
+            # If a redirected file can't be opened
+            print(f"Error: '{e.filename}' {e.strerror.lower()}")
+            return 1
+        # builtins that don't report a status succeeded
+        return 0 if status is None else status
+
+    def run(self, command, cwd=None, env=None):
+
+        ''' Runs a command or pipeline that isn't a lone shell command and
+        returns its exit status, cwd and env are snapshots taken when a
+        batch job was queued '''
+
+        pipeline = start_pipeline(
+                                  command,
+                                  self.pipe_builtins,
+                                  cwd,
+                                  env,
+                                  self.fast
+                                 )
+        if command.background:
+            # keeps track of the process so it can be reaped
+            self.jobs.add(pipeline, command)
+            return 0
+        return pipeline.wait()
+
+    def do_hash(self, args):
+
+        # lists or resets the table of remembered command paths
+        lines, status = hash_builtin(args)
+        for line in lines:
+            print(line)
+        return status
+
+    def do_history(self, args):
+
+        # lists, searches or re-runs the commands typed at the prompt
+        if args and args[0] == '-e':
+            text, error = rerun_line(self.history, args[1:])
+            if error is not None:
+                print(error)
+                return 1
+            # shows the command and remembers it as the latest one
+            print(text)
+            self.history.add(text)
+            return self.line(text)
+        lines, status = history_builtin(self.history, args)
+        for line in lines:
+            print(line)
+        return status
+
+    def do_export(self, args):
+
+        # sets environment variables, or lists them all
+        lines, status = export_builtin(args)
+        for line in lines:
+            print(line)
+        return status
+
+    def do_unset(self, args):
+
+        # removes environment variables
+        lines, status = unset_builtin(args)
+        for line in lines:
+            print(line)
+        return status
+
+    def do_stats(self, args):
+
+        # lists the command lines that took longest this session
+        lines, status = stats_builtin(self.stats, args)
+        for line in lines:
+            print(line)
+        return status
+
+    def p_dir(self, args, cwd):
+        # lists the given directory one entry per line for the next command
+        options = dir_options(args)
+        directory = options.directory or cwd or os.getcwd()
+        if cwd is not None:
+            directory = os.path.join(cwd, directory)
+        return dir_lines(directory, options)
+
+    def p_echo(self, args, cwd):
+        # passes the comment on to the next command
+        return [' '.join(args)]
+
+    def p_env(self, args, cwd):
+        # passes the environment strings on to the next command
+        return (f"{a}:{os.environ[a]}" for a in os.environ)
+
+    def p_history(self, args, cwd):
+        # passes the numbered history on, e.g. to grep
+        return history_builtin(self.history, args)[0]
 
     def do_help(self, args):
 
@@ -146,7 +289,10 @@ class MyShell():
 
         h_dir = "\
 lists the contents of the given directory \
-or the current directory if none is given"
+or the current directory if none is given, \
+-l gives details, -S sorts by size and -t by time, \
+-R lists subdirectories too and -s counts the files and bytes under each, \
+-d N stops N levels down and -x PATTERN leaves out matching names"
         h_echo = "\
 returns a concatenated string of the arguments given"
         h_quit = "quits the shell"
@@ -158,6 +304,36 @@ Prints all the environment variables \
 and their corresponding values"
         h_clr = "clears the terminal"
         h_pause = "pauses the shell until the enter key is pressed"
+        h_jobs = "lists the background jobs that are still running"
+        h_wait = "\
+waits for the given background job to finish, \
+or all of them if none is given, with --async wait -t SECONDS gives up \
+after that long"
+        h_hash = "\
+lists the remembered paths of commands, \
+hash -r forgets them"
+        h_history = "\
+lists the commands typed at the prompt, or the last N, \
+history -s TEXT searches them, history -e N runs number N again \
+and history -c forgets them"
+        h_fg = "\
+waits in the foreground for the given background job, \
+or the most recent one if none is given"
+        h_more = "\
+pages through the given file, space and b move forward and back a page, \
+Enter and k a line, a number followed by g goes to that line, \
+G to the end and q quits"
+        h_time = "\
+time COMMAND runs the command and reports its real, user and sys time \
+and peak memory, in the format given by $TIMEFORMAT"
+        h_export = "\
+export NAME=value sets an environment variable, \
+with no arguments it lists them all, set does the same \
+and NAME=value COMMAND sets it for that command only"
+        h_unset = "removes the given environment variables"
+        h_stats = "\
+lists the N command lines that took longest this session, 10 by default, \
+with the totals of every command, stats -c forgets them"
         h_help = "\
 lists the built in commands or if \
 given a specific command, gives the usage of that command"
@@ -169,43 +345,35 @@ given a specific command, gives the usage of that command"
                      'environ': h_environ,
                      'clr': h_clr,
                      'pause': h_pause,
-                     'help': h_help
+                     'help': h_help,
+                     'jobs': h_jobs,
+                     'wait': h_wait,
+                     'fg': h_fg,
+                     'hash': h_hash,
+                     'history': h_history,
+                     'more': h_more,
+                     'time': h_time,
+                     'stats': h_stats,
+                     'export': h_export,
+                     'set': h_export,
+                     'unset': h_unset,
                     }
         try:
             if args[0] == 'more':
             # If using 'help more' command
-                # Gets list of all lines from 'readme'
-                lines = open('readme', 'r').readlines()
-                def more(lines):
-                    if len(lines) <= 20:
-                        for i in range(0, len(lines)):
-                            # prints the rest of the lines if there are 20 or less left
-                            print(lines.pop(0).strip())
-                    for i in range(0,20):
-                        # pops and prints the next line from readme 20 times
-                        print(lines.pop(0).strip())
-                more(lines)
-                while len(lines) != 0:
-                    # checks keypresses until all the lines are printed
-                    char = getch()
-                    if char == ' ':
-                        # if the spacebar is pressed, print the next block of text
-                        more(lines)
-                    elif char == 'q':
-                        # if q is pressed, return to the prompt
-                        self.line() 
-                self.line()
+                # pages through the readme next to the shell
+                return self.do_more([README])
             else:
                 # When using help followed by a command
                 print(f'{help_list[args[0]]}')
-                self.line()
+                return 0
         except IndexError:
             # When help is typed with no arguments
             print('Type "help" followed by one of the \
 following commands for more information')
             print('='*len("   ".join(a for a in help_list)))
             print(f"{'   '.join([a for a in help_list])}")
-            self.line()
+            return 0
         except KeyError:
             # If the command is not a built in command
             print('\
@@ -213,53 +381,74 @@ Type "help" followed by one of the \
 following commands or "more" for more information')
             print('='*len("   ".join(a for a in help_list)))
             print(f"{'   '.join([a for a in help_list])}")
-            self.line()
+            return 0
+
+    def do_more(self, args):
+
+        # pages through a file, space and b move a page at a time
+        if not args:
+            print('Error: No file given')
+            return 2
+        try:
+            more(args[0])
+            return 0
+        except FileNotFoundError:
+            print(f"Error: '{args[0]}' no such file")
+            return 1
+        except (OSError, ValueError):
+            # directories and files that can't be mapped
+            print(f"Error: '{args[0]}' can't be paged")
+            return 1
+
+    def do_jobs(self, args):
+
+        # lists the background jobs, with those that finished since they
+        # were last reported
+        for job in self.jobs.listing():
+            print(job)
+        return 0
+
+    def do_wait(self, args):
+
+        # waits for the given background job, or all of them
+        if not args:
+            return self.jobs.wait_all()
+        job = self.jobs.get(args)
+        if job is None:
+            print(f'Error: no such job "{args[0]}"')
+            return 127
+        return self.jobs.wait(job)
+
+    def do_fg(self, args):
+
+        # brings the given job, or the most recent one, to the foreground
+        job = self.jobs.get(args)
+        if job is None:
+            print('Error: no such job')
+            return 1
+        print(job.command)
+        return self.jobs.wait(job)
 
     def do_pause(self, args):
 
         # Pauses the shell until enter is pressed
+        from getpass import getpass
         getpass(prompt='press "Enter" to resume shell function')
-        self.line()
+        return 0
 
     def do_clr(self, args):
 
         # Clears the terminal and returns the prompt
         # to the top of the terminal
         sys.stdout.write('\033[2J\033[H')
-        self.line()
+        return 0
 
     def do_env(self, args):
 
-        try:
-            # if using overwrite
-            if args[0] == '>':
-                try:
-                    data = os.environ
-                    # outputs environment strings to the given file
-                    self.overwrite(args[1], data)
-                    self.line()
-                except IndexError:
-                    # if no filename is given
-                    print('Error: No filename given')
-                    self.line()
-            # if using append
-            elif args[0] == '>>':
-                try:
-                    data = os.environ
-                    # outputs environment strings to the given file
-                    self.append(args[1], data)
-                    self.line()
-                except IndexError:
-                    # if no filename is given
-                    print('Error: No filename given')
-                    self.line()
-        except IndexError:
-            # if no output is used
-            data = os.environ
-            # prints environment strings to the terminal
-            for a in data:
-                print(f"{a}:{data[a]}")
-            self.line()
+        # prints environment strings to the terminal
+        for a in os.environ:
+            print(f"{a}:{os.environ[a]}")
+        return 0
 
     def do_cd(self, args):
 
@@ -267,7 +456,7 @@ following commands or "more" for more information')
             # changes directory to the given directory
             os.chdir(args[0])
             # $CWD points to current directory
-            os.environ['PWD'] = os.getcwd()
+            environment.set('PWD', os.getcwd())
             curr_dir = os.getcwd()
             # changes the promtp to the current directory
             if os.environ['HOME'] in curr_dir:
@@ -277,16 +466,16 @@ following commands or "more" for more information')
             host = os.uname()[1]
             # update prompt
             self.prompt = f"{user}@{host} {curr_dir}$ "
-            self.line()
+            return 0
         except FileNotFoundError:
             # If the directory doesn't exist
             print("Error: no such directory")
-            self.line()
+            return 1
         except IndexError:
             # if using cd without and argument
             # prints the current directory
             print(os.getcwd())
-            self.line()
+            return 0
 
     def do_quit(self, args):
 
@@ -295,426 +484,199 @@ following commands or "more" for more information')
 
     def do_echo(self, args):
 
-        comment = []
-        for i in range(0, len(args)):
-            # if using overwrite
-            if args[i] == '>':
-                try:
-                    # outputs the comment to the given file
-                    self.overwrite(args[i+1], [" ".join(comment)])
-                    self.line()
-                except IndexError:
-                    # if no filename is given
-                    print('Error: no filename given')
-                    self.line()
-            # if using append
-            elif args[i] == '>>':
-                try:
-                    # outputs the comment to the given file
-                    self.append(args[i+1], [' '.join(comment)])
-                    self.line()
-                except IndexError:
-                    # if no filename is given
-                    print('Error: no filename given')
-                    self.line()
-            else:
-                # appends the argument to the list of other args
-                comment.append(args[i])
-        # if not using output
         # prints the list of arguments joined by a space
-        print(' '.join(comment))
-        self.line()
+        print(' '.join(args))
+        return 0
 
     def do_dir(self, args):
 
         try:
-            # if using input from a file
-            if args[0] == '<':
-                try:
-                    # gets the contents of the given directory
-                    data = os.listdir(self.from_file(args[1]))
-                    data = '  '.join(data)
-                    try:
-                        # if using input from file and overwrite
-                        if args[2] == '>':
-                            try:
-                                # outputs contents of the directory to the given file
-                                self.overwrite(args[3], data)
-                                self.line()
-                            except IndexError:
-                                # if no filename is given
-                                print("Error: No filename given")
-                                self.line()
-                        # if using input from file and append
-                        elif args[2] == '>>':
-                            try:
-                                # outputs contents of the directory to the given file
-                                self.append(args[3], data)
-                                self.line()
-                            except IndexError:
-                                # If no filename is given
-                                print("Error: No filename given")
-                                self.line()
-                    # if using input from file and no output
-                    except IndexError:
-                        # print contents of directory joined by 3 spaces
-                        print(data)
-                        self.line()
-                except FileNotFoundError:
-                    # if the directory doesn't exist
-                    print(f"Error: '{args[1]}' no such file")
-                    self.line()
-                except IndexError:
-                    # if no file given for input
-                    print("Error: No file given")
-                    self.line()
-            # if using overwrite with no directory listed
-            elif args[0] == '>':
-                # gets the contents of the current directory
-                data = os.listdir(self.cwd)
-                data = '    '.join(data)
-                try:
-                    # outputs contents of current dir to file
-                    self.overwrite(args[1], data)
-                    self.line()
-                except IndexError:
-                    # if no filename given
-                    print("Error: No filename given")
-                    self.line()
-            # if using append with no directory listed
-            elif args[0] == '>>':
-                # gets the contents of the current directory
-                data = os.listdir(self.cwd)
-                data = '    '.join(data)
-                try:
-                    # outputs content is current dir to file
-                    self.append(args[1], data)
-                    self.line()
-                except IndexError:
-                    # if no filename given
-                    print("Error: No filename given")
-            # if using overwrite with a given directory
-            elif args[1] == '>':
-                try:
-                    # gets contents of given directory
-                    data = os.listdir(args[0])
-                    data = '    '.join(data)
-                    try:
-                        # outputs content of given dir to file
-                        self.overwrite(args[2], data)
-                        self.line()
-                    except IndexError:
-                        # if no filename given
-                        print('Error: No filename given')
-                except FileNotFoundError:
-                    # if the directory doesn't exist
-                    print(f"Error: '{args[0]}' no such directory")
-                    self.line()
-            # if using append with a given directory
-            elif args[1] == '>>':
-                try:
-                    # gets contents of given directory
-                    data = os.list(args[0])
-                    data = '    '.join(data)
-                    try:
-                        # outputs contents of given dir to file
-                        self.append(args[2], data)
-                        self.line()
-                    except IndexError:
-                        # if no filename given
-                        print("Error: No filename given")
-                        self.line()
-                except FileNotFoundError:
-                    # if the directory doesn't exist
-                    print(f"Error: '{args[0]}' no such directory")
-                    self.line()
-        except IndexError:
-            try:
-                # If using dir from a given directory without output
-                data = os.listdir(args[0])
-                data = '    '.join(data)
-                # prints contents of the given directory separated by 3 spaces
-                print(data)
-                self.line()
-            except IndexError:
-                # if using dir with no arguments
-                data = os.listdir(os.getcwd())
-                # prints the contents of the current directory separated by 3 spaces
-                print('    '.join(data))
-                self.line()
-            except FileNotFoundError:
-                # if the given file doesn't exist
-                print('Error: No such directory')
-                self.line()
-
-    def from_file(self, filename):
-        # returns a string with the contents of a specified file
-        with open(filename, 'r') as f:
-            return '\n'.join([args.strip() for args in f.readlines()])
-
-    def overwrite(self, filename, data):
-        # overwrites content of the specified file with the given data
-        with open(filename, 'w+') as f:
-            for a in data:
-                f.write(a + '\n')
-
-    def append(self, filename, data):
-        # appedns the given data to the end of the file
-        with open(filename, 'a+') as f:
-            for a in data:
-                f.write(a + '\n')
-
-    def batch(self, args):
-        # if using a batch file
-        for command in args:
-            # splits the command into seperate arguments
-            command = command.split()
-            try:
-                # run the command as a built-in command
-                self.disbatcher[command[0]](command[1:])
-            except KeyError:
-                # if the command isn't a built-in
-                try:
-                    # if forking to background
-                    if args[-1] == '&':
-                        for i in range(1, len(args[:-1])):
-                            # if forking and overwriting
-                            if args[i] == '>':
-                                try:
-                                    # outputs result of forked command to the given file
-                                    self.overwrite(
-                                              args[i+1],
-                                              subprocess.Popen(args[:i])
-                                             )
-                                except IndexError:
-                                    # if no filename is given
-                                    print("Error: No filename given")
-                                except FileNotFoundError:
-                                    # if the command doesn't exist
-                                    print('Error: No such command')
-                            # if forking and appending
-                            elif args[i] == '>>':
-                                try:
-                                    # outputs result of forked command to the given file
-                                    self.append(
-                                           args[i+1],
-                                           subprocess.Popen(args[:i])
-                                          )
-                                except IndexError:
-                                    # if no filename is given
-                                    print("Error: No filename given")
-                                except FileNotFoundError:
-                                    # if the command doesn't exist
-                                    print('Error: No such command')
-                            else:
-                                # not using IO redirection
-                                try:
-                                    # runs the command as a background process
-                                    subprocess.Popen(args[:-1])
-                                except FileNotFoundError:
-                                    # if the command doesn't exist
-                                    print('Error: No such command')
-                    else:
-                        try:
-                            # runs the command as a background process
-                            subprocess.run(args)
-                        except FileNotFoundError:
-                            # if the command doesn't exist
-                            print('Error: No such command')
-                except PermissionError:
-                    pass
-
-    def b_dir(self, args):
-        try:
-            # if using input from a file
-            if args[0] == '<':
-                try:
-                    # gets the contents of the given directory
-                    data = self.from_file(args[1])
-                    data = "   ".join(os.listdir(data))
-                    # if using input from file and append
-                    if args[2] == '>>':
-                        try:
-                            # outputs contents of the directory to the given file
-                            self.append(args[3], [data])
-                        except IndexError:
-                            # if no filename is given
-                            print("Error: No filename given")
-                    # if using input from file and overwrite
-                    elif args[2] == '>':
-                        try:
-                            # outputs contents of the directory to the given file
-                            self.overwrite(args[3], [data])
-                        except IndexError:
-                            # if no filename is given
-                            print("Error: No filename given")
-                except FileNotFoundError:
-                    # if the input file doesn't exist
-                    print("Error: No such file")
-            elif args[0] == '>':
-                # if using overwrite without a given directory
-                try:
-                    data = "   ".join(os.listdir(os.getcwd()))
-                    # outputs contents of the current directory to the given file
-                    self.overwrite(args[1], [data])
-                except IndexError:
-                    # if no filename is given
-                    print("Error: No filename given")
-            # if using append without a given directory
-            elif args[0] == '>>':
-                try:
-                    data = '   '.join(os.listdir(os.getcwd()))
-                    # outputs contents of the current directory to the given file
-                    self.append(args[1], [data])
-                except IndexError:
-                    # if no filename is given
-                    print("Error: No filename given")
-            # if using overwrite with a specified directory
-            elif args[1] == '>':
-                try:
-                    data = '   '.join(os.listdir(args[0]))
-                    # outputs the contents of the specified directory to the file
-                    self.overwrite(args[2], [data])
-                except FileNotFoundError:
-                    # if the given directory doesn't exist
-                    print("Error: No such directory")
-                except IndexError:
-                    # if no filename is given
-                    print("Error: No filename given")
-            # if using append with a specified directory
-            elif args[1] == '>>':
-                try:
-                    data = '   '.join(os.listdir(args[0]))
-                    # outputs the contents of the specified directory to the file
-                    self.append(args[2], [data])
-                except FileNotFoundError:
-                    # if the given directory doesn't exist
-                    print("Error: No such directory")
-                except IndexError:
-                    # if no filename is given
-                    print("Error: No filename given")
-        except IndexError:
-            # if not using output or input
-            try:
-                data = '   '.join(os.listdir(args[1]))
-                # prints the contents of the specified directory separated by 3 spaces
-                print(data)
-            except IndexError:
-                # if no arguments are provided
-                data = '   '.join(os.listdir(os.getcwd()))
-                # prints the contents of the current directory separated by 3 spaces
-                print(data)
-
-    def b_echo(self, args):
-        comment = []
-        for i in range(1, len(args)):
-            # if using overwrite
-            if args[i] == '>':
-                try:
-                    # outputs the comment to the given file
-                    comment = " ".join(comment)
-                    self.overwrite(args[i+1], comment)
-                    return
-                except IndexError:
-                    # if no filename is given
-                    print("Error: No filename given")
-                    return
-            # if using append
-            elif args[i] == '>>':
-                try:
-                    # outputs the comment to the given file
-                    comment = " ".join(comment)
-                    self.append(args[i+1], comment)
-                    return
-                except IndexError:
-                    # if no filename is given
-                    print("Error: No filename given")
-                    return
-            else:
-                # appends the argument to the list of other args
-                comment.append(args[i])
-        # if not using output
-        # prints the list of arguments joined by a space
-        comment = " ".join(comment)
-        print(comment)
-
-    def b_cd(self, args):
+            # the options, and the given directory or the current one
+            options = dir_options(args)
+        except ValueError as e:
+            print(f'Error: {e}')
+            return 2
+        directory = options.directory or os.getcwd()
         try:
-            # changes directory to the given directory
-            os.chdir(args[0])
-            # $CWD points to current directory
-            os.environ['PWD'] = os.getcwd()
-            curr_dir = os.getcwd()
-            # changes the promtp to the current directory
-            if os.environ['HOME'] in curr_dir:
-                # if $HOME in the directory, shorten to ~/
-                curr_dir = '~' + curr_dir[len(os.environ['HOME']):]
-            user = os.environ['USER']
-            host = os.uname()[1]
-            # update prompt
-            self.prompt = f"{user}@{host} {curr_dir}$ "
+            # entries are written as they are read, not built up first
+            lines = dir_lines(directory, options)
+            if options.long or options.recursive or options.summary:
+                # one entry per line
+                sys.stdout.writelines(line + '\n' for line in lines)
+                return 0
+            # the contents of the directory separated by 4 spaces
+            first = next(lines, None)
+            if first is not None:
+                sys.stdout.write(first)
+                sys.stdout.writelines('    ' + name for name in lines)
+            print()
+            return 0
         except FileNotFoundError:
-            # If the directory doesn't exist
-            print("Error: no such directory")
-        except IndexError:
-            # if using cd without and argument
-            # prints the current directory
-            print(os.getcwd())
-
-    def b_quit(self, args):
-        # exits the shell
-        exit()
-
-    def b_env(self, args):
-
+            # if the directory doesn't exist
+            print(f"Error: '{directory}' no such directory")
+            return 1
+        except OSError as e:
+            # if it isn't a directory or can't be read
+            print(f"Error: '{directory}' {e.strerror.lower()}")
+            return 1
+
+    def batch(self, lines):
+        # runs each command of a batch file as it is read, lines gives
+        # (line number, text, Command or ParseError) from read_plan
+        status = 0
         try:
-            # if using output
-            if args[0] == '>':
-                try:
-                    data = os.environ
-                    data_list = []
-                    for a in data:
-                        # outputs environment strings to the given file
-                        data_list.append(f"{a}:{data[a]}")
-                    self.overwrite(args[1], data_list)
-                except IndexError:
-                    # if no filename is given
-                    print('Error: No filename given')
-            # if using append
-            elif args[0] == '>>':
-                try:
-                    data = os.environ
-                    data_list = []
-                    for a in data:
-                        # outputs environment strings to the given file
-                        data_list.append(f"{a}:{data[a]}")
-                    self.append(args[1], data_list)
-                except IndexError:
-                    # if no filename is given
-                    print('Error: No filename given')
-        except IndexError:
-            # if no output is used
-            data = os.environ
-            for a in data:
-                # prints environment strings to the terminal
-                print(f"{a}:{data[a]}")
-
-
-if __name__ == "__main__":
+            for number, text, command in lines:
+                if isinstance(command, ParseError):
+                    print(f'Error: {command}')
+                    status = 2
+                    continue
+                # "time" in front of a command reports what it used
+                command, timed = split_time(command)
+                with Timer() as timer:
+                    status = self.batch_command(command, timed)
+                self.stats.add(text, timer)
+                if timed:
+                    report(timer)
+        finally:
+            if self.outputs is not None:
+                # the end of the script, or quit
+                self.outputs.close()
+        if self.scheduler is not None:
+            # waits for the jobs still running at the end of the file
+            status = self.scheduler.shutdown() or status
+        return status
+
+    def batch_command(self, command, timed):
+        # runs one parsed line of a batch file, returns its exit status
+        if command is None:
+            return 0
+        if command.pipe is None and only_assignments(command.argv):
+            # "NAME=value" on its own sets the variable, like export
+            return self.do_export(command.argv)
+        handler = None
+        if command.argv and command.pipe is None:
+            handler = self.disbatcher.get(command.argv[0])
+        if self.outputs is not None:
+            # writes out what builtins appended to files before
+            # anything that might read them, or a cd
+            self.outputs.sync(command, handler is not None)
+        if handler is not None:
+            # run the command as a built-in command
+            return self.builtin(handler, command)
+        elif self.scheduler is not None and not command.background \
+                and not timed:
+            # queues the command with a snapshot of the current
+            # directory and environment, so a later cd can't affect it,
+            # the environment block is replaced rather than changed so
+            # it needs no copy
+            self.scheduler.submit(
+                                  self.run,
+                                  command,
+                                  os.getcwd(),
+                                  environment.block()
+                                 )
+            return 0
+        # if the command isn't a built-in, or is timed
+        return self.run(command)
+
+    def b_wait(self, args):
+        # waits for every queued job to finish before running the next line
+        status = 0
+        if self.scheduler is not None:
+            status = self.scheduler.wait()
+        if args:
+            # waits for a single background job
+            return self.do_wait(args) or status
+        return self.jobs.wait_all() or status
+
+
+def read_options(argv):
+    ''' Reads the command line options, argparse is only loaded for the
+    unusual ones '''
+    # the usual options are read without loading argparse
+    options = quick_options(argv)
+    if options is None:
+        import argparse
+        parser = argparse.ArgumentParser(description='MyShell')
+        parser.add_argument('files', nargs='*', metavar='file',
+                            help='batch file to run, or "-" for standard input')
+        parser.add_argument('-P', '--parallel', type=int, metavar='N',
+                            help='run several batch files, up to N at once')
+        parser.add_argument('-j', '--jobs', type=int, default=1, metavar='N',
+                            help='run up to N batch commands at once')
+        parser.add_argument('-E', '--external', action='store_true',
+                            help='run cat, head, wc, true, mkdir and rm as '
+                                 'programs rather than in the shell')
+        parser.add_argument('--check', action='store_true',
+                            help='report the lines of the batch file that '
+                                 "can't run, without running it")
+        parser.add_argument('--async', action='store_true',
+                            dest='asynchronous',
+                            help='run commands on an asyncio event loop, '
+                                 'showing background jobs as they finish')
+        options = parser.parse_args(argv)
+        read_files(parser, options)
+        if options.asynchronous and options.jobs > 1:
+            parser.error('--async runs batch jobs with "&" rather than -j')
+    return options
+
+
+def main(options):
+    ''' Runs the shell the options ask for and returns its exit status '''
+    if options.parallel is not None:
+        # each file runs in its own copy of this shell
+        from runner import run_scripts
+        return run_scripts(options.files, options.parallel,
+                           lambda name: run_file(options, name))
+    if options.check and options.file is None:
+        print('Error: --check needs a batch file')
+        return 2
+    if options.asynchronous:
+        # the event loop is only loaded when asked for
+        from engine import Engine
+    if options.file is None and options.asynchronous:
+        # the prompt is read by the event loop, without readline
+        return Engine(MyShell()).session()
+    elif options.file is None:
+        # open the shell as normal
+        return MyShell().pre()
     try:
-        with open(sys.argv[1], 'r') as f:
-            # takes the lines from the input as a list
-            commands = f.readlines()
-            # appends quit to the end of the commands to close the shell after the batch is complete
-            commands.append('quit' + '\n')
-            # initialises the shell
-            shell = MyShell()
-            # runs the batch file
-            shell.batch(commands)
+        # "-" streams the commands from standard input
+        f = open_batch(options.file)
     except FileNotFoundError:
         # if the batch file given doesn't exist
         print('No such file')
-    except IndexError:
-        # otherwise open the shell as normal
-        MyShell().pre()
+        return 1
+    # initialises the shell
+    shell = MyShell()
+    if options.check:
+        # parses the whole file and looks the commands up, running nothing
+        return check(f, set(shell.disbatcher) | set(shell.pipe_builtins))
+    # there is no prompt to report finished background jobs at
+    shell.jobs.notify = False
+    # ">>" files stay open from one line to the next
+    shell.outputs = OutputCache()
+    if not options.external:
+        # the commonest small commands don't start a process
+        shell.fast = FAST_BUILTINS
+    if options.jobs > 1:
+        shell.scheduler = Scheduler(options.jobs)
+    if options.asynchronous:
+        # runs the batch file on the event loop, waiting for its jobs
+        return Engine(shell).batch(read_plan(f))
+    # runs the batch file one line at a time, then closes the shell,
+    # an unchanged file's lines come already parsed from its plan
+    return shell.batch(read_plan(f))
+
+
+def run_file(options, name):
+    ''' Runs one of the files given to -P, in the process forked for it,
+    which has its own copy of the options '''
+    options.file = name
+    options.parallel = None
+    return main(options)
+
+
+if __name__ == "__main__":
+    sys.exit(main(read_options(sys.argv[1:])))
 # Sean Moloney 17477122
@@ -0,0 +1,212 @@
+'''
+Pager for the more builtin and "help more", shared by SeaTurtle (myshell.py)
+and MyShell (myshell2.py)
+'''
+import mmap
+import os
+import sys
+from array import array
+from bisect import bisect_left
+from itertools import accumulate
+
+# Bytes whose newlines are counted at a time, a line is found by
+# looking through the one block it is in
+BLOCK_SIZE = 64 * 1024
+
+# Number of blocks whose newline offsets are kept
+BLOCKS_CACHED = 16
+
+# Keys the pager understands, shown on its status line
+KEYS = 'space/b page, enter/k line, Ng go to line N, G end, q quit'
+
+
+class LineIndex():
+
+    '''\nA memory-mapped file with the number of lines in each block of it \
+counted as far as it has been read, so opening a file costs nothing and \
+finding a line only looks through the block it is in\n'''
+
+    def __init__(self, filename):
+        with open(filename, 'rb') as f:
+            if os.fstat(f.fileno()).st_size:
+                # the mapping stays valid after the file is closed
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                # an empty file can't be mapped
+                self.data = b''
+        self.size = len(self.data)
+        # newlines before the start of each block, 8 bytes a block
+        self.counts = array('q', [0])
+        self.complete = not self.size
+        # block number -> offsets of the newlines in it,
+        # for the few blocks that were looked at last
+        self.blocks = {}
+
+    def count(self):
+
+        '''\nReturns the number of lines, once the whole file has been read\n'''
+        lines = self.counts[-1]
+        if self.size and self.data[-1:] != b'\n':
+            # the last line has no newline
+            lines += 1
+        return lines
+
+    def scan(self, lines):
+
+        '''\nCounts the newlines of one block after another until \
+the given number of lines or the end of the file are reached\n'''
+        while self.counts[-1] < lines and not self.complete:
+            start = (len(self.counts) - 1) * BLOCK_SIZE
+            found = self.data[start:start + BLOCK_SIZE].count(b'\n')
+            self.counts.append(self.counts[-1] + found)
+            if start + BLOCK_SIZE >= self.size:
+                self.complete = True
+
+    def start(self, i):
+        # the offset line number i starts at, which is just after
+        # newline number i, or None past the end of the file
+        if i == 0:
+            return 0 if self.size else None
+        self.scan(i)
+        if self.counts[-1] < i:
+            return None
+        # the block the newline is in, then where it is in the block
+        block = bisect_left(self.counts, i) - 1
+        offset = self.newlines(block)[i - self.counts[block] - 1] + 1
+        return offset if offset < self.size else None
+
+    def newlines(self, block):
+        # offsets of the newlines in a block, worked out when first needed
+        if block not in self.blocks:
+            if len(self.blocks) >= BLOCKS_CACHED:
+                del self.blocks[next(iter(self.blocks))]
+            start = block * BLOCK_SIZE
+            parts = self.data[start:start + BLOCK_SIZE].split(b'\n')[:-1]
+            self.blocks[block] = array(
+                'q', (start + end - 1 for end in
+                      accumulate(len(part) + 1 for part in parts))
+            )
+        return self.blocks[block]
+
+    def lines(self, first, count):
+
+        '''\nReturns up to count lines starting at line number first\n'''
+        lines = []
+        start = self.start(first)
+        while start is not None and len(lines) < count:
+            end = self.data.find(b'\n', start)
+            if end < 0:
+                end = self.size
+            lines.append(
+                self.data[start:end].decode(errors='replace').rstrip('\r')
+            )
+            start = end + 1 if end + 1 < self.size else None
+        return lines
+
+    def total(self):
+
+        '''\nReturns the number of lines, reading to the end of the file\n'''
+        self.scan(sys.maxsize)
+        return self.count()
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+
+def more(filename):
+
+    '''\nPages through a file on a terminal, or writes all of it \
+when the output isn't a terminal\n'''
+    index = LineIndex(filename)
+    try:
+        if sys.stdin.isatty() and sys.stdout.isatty():
+            page(index)
+        else:
+            # read a block of lines at a time, never the whole file
+            first = 0
+            while True:
+                lines = index.lines(first, 1024)
+                if not lines:
+                    break
+                sys.stdout.writelines(line + '\n' for line in lines)
+                first += len(lines)
+    finally:
+        index.close()
+
+
+def page(index):
+
+    '''\nShows a screen of the file at a time and moves through it \
+with the keys in KEYS\n'''
+    columns, rows = terminal_size()
+    height = max(rows - 1, 1)
+    top = 0
+    # digits typed before "g"
+    number = ''
+    while True:
+        lines = index.lines(top, height)
+        # lines longer than the screen are cut, so a page fits it
+        screen = ''.join(line.expandtabs()[:columns] + '\n' for line in lines)
+        shown = f'{top + 1}-{top + len(lines)}'
+        if index.complete:
+            shown += f' of {index.count()}'
+        sys.stdout.write(f'\033[2J\033[H{screen}'
+                         f'\033[7m--More-- lines {shown} ({KEYS})\033[0m')
+        sys.stdout.flush()
+        at_end = index.complete and top + height >= index.count()
+        key = getch()
+        while key.isdigit():
+            number += key
+            key = getch()
+        if key in 'q\x03\x04':
+            break
+        elif key in ' f' or key in '\r\nj':
+            if at_end:
+                # moving on from the last page closes the pager, like more
+                break
+            top += height if key in ' f' else 1
+        elif key == 'b':
+            top -= height
+        elif key == 'k':
+            top -= 1
+        elif key == 'g':
+            top = int(number) - 1 if number else 0
+        elif key == 'G':
+            top = index.total() - height
+        number = ''
+        # the first line shown is never before the start of the file
+        # or so far down that the last page isn't full
+        index.scan(top + height)
+        if index.complete:
+            top = min(top, index.count() - height)
+        top = max(top, 0)
+    # clears the status line before the prompt comes back
+    sys.stdout.write('\r\033[K')
+    sys.stdout.flush()
+
+
+def terminal_size():
+
+    '''\nReturns the terminal's (columns, rows), or 80x24 if unknown\n'''
+    try:
+        size = os.get_terminal_size(sys.stdout.fileno())
+        return size.columns, size.lines
+    except OSError:
+        return 80, 24
+
+
+def getch():
+
+    '''\nReads one keypress without waiting for Enter\n'''
+    # the terminal modules are only needed once someone is paging
+    import termios
+    import tty
+    fd = sys.stdin.fileno()
+    old = termios.tcgetattr(fd)
+    try:
+        tty.setraw(fd)
+        ch = sys.stdin.read(1)
+    finally:
+        termios.tcsetattr(fd, termios.TCSADRAIN, old)
+    return ch
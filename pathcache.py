@@ -0,0 +1,130 @@
+'''
+Cache of resolved command paths, like bash's hash table
+'''
+import os
+import threading
+
+from environment import environment
+
+# $PATH when it isn't set, as the environment block holds it
+DEFAULT_PATH = os.fsencode(os.defpath)
+
+
+class PathHash():
+
+    '''\nRemembers where each command was found on $PATH, \
+an entry is dropped as soon as $PATH changes or any directory \
+searched to find it is modified\n'''
+
+    def __init__(self):
+        # command name -> (absolute path, index of its directory in $PATH)
+        self.table = {}
+        # command name -> number of times the cached path was used
+        self.hits = {}
+        # modification time of each directory when it was searched
+        self.mtimes = {}
+        # the $PATH the table was built from
+        self.path = None
+        self.dirs = []
+        # batch jobs run with -j look commands up from several threads
+        self.lock = threading.Lock()
+
+    def reset(self):
+
+        '''\nForgets every remembered command\n'''
+        with self.lock:
+            self.table.clear()
+            self.hits.clear()
+            self.mtimes.clear()
+
+    def lookup(self, name, env=None):
+
+        '''\nReturns the absolute path of a command, or None if it isn't \
+on the $PATH of env, an environment block, or of the shell\n'''
+        if '/' in name:
+            # paths are run as given, relative to the command's directory
+            return name
+        if env is None:
+            env = environment.block()
+        path = env.get(b'PATH', DEFAULT_PATH)
+        with self.lock:
+            if path != self.path:
+                # a new $PATH invalidates everything
+                self.table.clear()
+                self.hits.clear()
+                self.mtimes.clear()
+                self.path = path
+                # an empty entry means the current directory
+                self.dirs = [d or '.'
+                             for d in os.fsdecode(path).split(os.pathsep)]
+            entry = self.table.get(name)
+            if entry is not None and self.fresh(entry[1]):
+                self.hits[name] += 1
+                return entry[0]
+            return self.search(name)
+
+    def fresh(self, index):
+        # checks that no directory up to the one the command was found in
+        # has changed, since a new file there could shadow the cached one
+        for directory in self.dirs[:index+1]:
+            if mtime(directory) != self.mtimes.get(directory):
+                self.table.clear()
+                self.hits.clear()
+                self.mtimes.clear()
+                return False
+        return True
+
+    def search(self, name):
+        # looks through each $PATH directory in order, like execvp
+        for i, directory in enumerate(self.dirs):
+            if directory not in self.mtimes:
+                self.mtimes[directory] = mtime(directory)
+            candidate = os.path.join(directory, name)
+            if os.path.isfile(candidate) and os.access(candidate, os.X_OK):
+                self.table[name] = (os.path.abspath(candidate), i)
+                self.hits[name] = 1
+                return self.table[name][0]
+        return None
+
+    def entries(self):
+
+        '''\nReturns (hits, path) for every remembered command\n'''
+        with self.lock:
+            return [(self.hits[name], self.table[name][0])
+                    for name in sorted(self.table)]
+
+
+def mtime(directory):
+
+    '''\nReturns a directory's modification time, or None if it is missing\n'''
+    try:
+        return os.stat(directory).st_mtime_ns
+    except OSError:
+        return None
+
+
+# Shared by every shell, pipeline and batch job in the process
+command_hash = PathHash()
+
+
+def hash_builtin(args):
+
+    '''\nThe hash builtin: lists the remembered commands, \
+"-r" forgets them, and names look commands up ahead of time. \
+Returns the output lines and an exit status\n'''
+    if not args:
+        entries = command_hash.entries()
+        if not entries:
+            return ['hash: hash table empty'], 0
+        return ['hits\tcommand'] + [f'{hits:4}\t{path}'
+                                    for hits, path in entries], 0
+    if args[0] == '-r':
+        command_hash.reset()
+        return [], 0
+    lines = []
+    status = 0
+    for name in args:
+        if command_hash.lookup(name) is None:
+            lines.append(f'hash: {name}: not found')
+            status = 1
+    return lines, status
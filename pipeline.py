@@ -0,0 +1,237 @@
+'''
+Native "|" pipelines, wired with OS pipes between child processes
+'''
+import os
+import sys
+import threading
+
+from coreutils import run_fast
+from environment import child_env
+from launcher import exit_code, spawn
+from pathcache import command_hash
+from redirect import close_redirects, open_redirects
+from timing import child_exited
+
+
+class BuiltinStage():
+
+    '''\nA builtin running inside the shell as one stage of a pipeline, \
+it looks enough like a Popen for the pipeline and the job table\n'''
+
+    def __init__(self, func, args, cwd, fd):
+        self.pid = os.getpid()
+        self.returncode = None
+        self.thread = threading.Thread(
+                                       target=self.run,
+                                       args=(func, args, cwd, fd),
+                                       daemon=True
+                                      )
+        self.thread.start()
+
+    def run(self, func, args, cwd, fd):
+        # writes each line the builtin produces as soon as it is produced
+        status = 0
+        f = sys.stdout if fd is None else open(fd, 'w')
+        try:
+            for line in func(args, cwd):
+                f.write(line + '\n')
+            f.flush()
+        except BrokenPipeError:
+            # the next stage stopped reading, like SIGPIPE
+            status = 141
+        except OSError as e:
+            print(f'Error: {e.strerror}')
+            status = 1
+        except ValueError as e:
+            # bad arguments to the builtin
+            print(f'Error: {e}')
+            status = 2
+        finally:
+            if f is not sys.stdout:
+                try:
+                    f.close()
+                except BrokenPipeError:
+                    pass
+        self.returncode = status
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self):
+        self.thread.join()
+        return self.returncode
+
+
+class FailedStage():
+
+    '''\nA stage that couldn't be started\n'''
+
+    def __init__(self, status):
+        self.pid = 0
+        self.returncode = status
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self):
+        return self.returncode
+
+
+class FinishedStage(FailedStage):
+
+    '''\nA command that was run in the shell before start_pipeline returned\n'''
+
+
+class Pipeline():
+
+    '''\nEvery stage of a running pipeline, \
+it can be waited on or added to the job table like a single Popen\n'''
+
+    def __init__(self, stages):
+        self.stages = stages
+        self.pid = stages[-1].pid
+        self.returncode = None
+
+    def poll(self):
+        if any(stage.poll() is None for stage in self.stages):
+            return None
+        self.returncode = pipefail(self.stages)
+        return self.returncode
+
+    def wait(self):
+        for stage in self.stages:
+            if isinstance(stage, (BuiltinStage, FailedStage)):
+                stage.wait()
+            else:
+                wait_child(stage)
+        self.returncode = pipefail(self.stages)
+        return self.returncode
+
+
+def wait_child(process):
+
+    '''\nWaits for a child process with os.wait4, which also gives what \
+it used for the timers running on this thread, returns its status\n'''
+    if process.returncode is None:
+        try:
+            pid, status, usage = os.wait4(process.pid, 0)
+        except ChildProcessError:
+            # the SIGCHLD handler reaped it first, e.g. a job under fg
+            return process.wait()
+        process.returncode = exit_code(status)
+        child_exited(usage)
+    return process.returncode
+
+
+def pipefail(stages):
+
+    '''\nReturns the status of the last stage that failed, or 0\n'''
+    status = 0
+    for stage in stages:
+        code = stage.returncode
+        if code:
+            # killed processes use the shell's 128 + signal convention
+            status = 128 - code if code < 0 else code
+    return status
+
+
+def start_pipeline(command, builtins, cwd=None, env=None, fast=None):
+
+    '''\nStarts every stage of a parsed command, connecting each one's \
+stdout to the next one's stdin with os.pipe(). Stages found in builtins \
+run in the shell, anything else runs as a child process. A lone command \
+found in fast is run in the shell too, unless it needs the real program. \
+env is an environment block, the shell's own if None, and the NAME=value \
+words in front of a stage are laid over it. Returns the running Pipeline\n'''
+    if fast and command.pipe is None and not command.background \
+            and command.argv and command.argv[0] in fast:
+        status = run_fast(fast[command.argv[0]], command, cwd)
+        if status is not None:
+            return Pipeline([FinishedStage(status)])
+    stages = []
+    for stage in prepare_stages(command, builtins, cwd, env):
+        if isinstance(stage, FailedStage):
+            stages.append(stage)
+            continue
+        argv, executable, stage_env, streams = stage
+        if executable is None:
+            # the builtin's thread closes its output when it finishes
+            stages.append(BuiltinStage(
+                                       builtins[argv[0]],
+                                       argv[1:],
+                                       cwd,
+                                       streams.get('stdout')
+                                      ))
+            continue
+        try:
+            stages.append(spawn(argv, executable, cwd, stage_env, **streams))
+        except (FileNotFoundError, PermissionError):
+            stages.append(not_found(argv))
+        finally:
+            # the child has its own copies of the descriptors
+            close_redirects(streams)
+    return Pipeline(stages)
+
+
+def prepare_stages(command, builtins, cwd=None, env=None):
+
+    '''\nOpens the pipes and redirections of each stage of a parsed \
+command in turn and finds its program, for start_pipeline and the asyncio \
+engine to start it. Yields (argv, executable, env, streams) for a stage \
+to start, with executable None for one found in builtins, or a \
+FailedStage once the reason has been printed. The caller closes the \
+streams once the stage has them\n'''
+    # read end of the previous stage's pipe
+    stdin = None
+    for stage in command.stages():
+        if stage.pipe is None:
+            read, write = None, None
+        else:
+            read, write = os.pipe()
+        # "NAME=value command" sets the variable for that command only
+        stage_env, argv = child_env(stage.argv, env)
+        try:
+            streams = open_redirects(stage.redirects, cwd)
+        except OSError as e:
+            print(f"Error: '{e.filename}' {e.strerror.lower()}")
+            argv, streams = None, {}
+        executable = None
+        if argv and argv[0] not in builtins:
+            # finds the command through the hash table
+            executable = command_hash.lookup(argv[0], stage_env)
+        # a redirection takes the place of the pipe
+        if stdin is not None and 'stdin' not in streams:
+            streams['stdin'] = stdin
+        elif stdin is not None:
+            os.close(stdin)
+        if write is not None and 'stdout' not in streams:
+            streams['stdout'] = write
+        elif write is not None:
+            os.close(write)
+        stdin = read
+        if not argv:
+            if argv is not None:
+                # only redirections were given
+                print('Error: No command given')
+            close_redirects(streams)
+            yield FailedStage(1)
+        elif argv[0] in builtins:
+            # builtins don't read their input, so the previous stage
+            # sees a closed pipe as soon as it writes
+            if 'stdin' in streams:
+                os.close(streams.pop('stdin'))
+            if 'stderr' in streams:
+                os.close(streams.pop('stderr'))
+            yield argv, None, stage_env, streams
+        elif executable is None:
+            close_redirects(streams)
+            yield not_found(argv)
+        else:
+            yield argv, executable, stage_env, streams
+
+
+def not_found(argv):
+
+    '''\nReports a command that can't be run, returns its FailedStage\n'''
+    print(f'Error: "{argv[0]}" is not a valid command')
+    return FailedStage(127)
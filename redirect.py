@@ -0,0 +1,250 @@
+'''
+I/O redirection for external commands and builtins
+'''
+import os
+import sys
+from collections.abc import Sequence
+from contextlib import contextmanager
+
+# The file descriptor each redirection operator replaces
+# and the flags its file is opened with
+OPERATORS = {
+             '<': (0, os.O_RDONLY),
+             '>': (1, os.O_WRONLY | os.O_CREAT | os.O_TRUNC),
+             '>>': (1, os.O_WRONLY | os.O_CREAT | os.O_APPEND),
+             '2>': (2, os.O_WRONLY | os.O_CREAT | os.O_TRUNC),
+             '2>>': (2, os.O_WRONLY | os.O_CREAT | os.O_APPEND),
+            }
+
+# Popen keyword for each standard file descriptor
+STREAMS = ('stdin', 'stdout', 'stderr')
+
+# Bytes of a builtin's redirected output collected before each write
+BUFFER_SIZE = 64 * 1024
+
+# Number of files batch mode keeps open for ">>"
+HANDLE_CACHE_SIZE = 16
+
+# Builtins that never read a file, so what earlier lines appended to files
+# can stay buffered while their output is redirected
+WRITE_ONLY_BUILTINS = frozenset((
+                                 'clr',
+                                 'echo',
+                                 'environ',
+                                 'export',
+                                 'hash',
+                                 'jobs',
+                                 'set',
+                                 'stats',
+                                 'unset',
+                                ))
+
+
+def open_redirects(redirects, cwd=None):
+
+    '''\nOpens each redirection target once and returns the file descriptors \
+as Popen keyword arguments, relative names are resolved against cwd\n'''
+    streams = {}
+    try:
+        for fd, flags, filename in redirects:
+            if cwd is not None:
+                filename = os.path.join(cwd, filename)
+            # a later redirection of the same descriptor wins, like sh
+            if STREAMS[fd] in streams:
+                os.close(streams.pop(STREAMS[fd]))
+            # O_APPEND lets many background jobs share one log file safely
+            streams[STREAMS[fd]] = os.open(filename, flags, 0o666)
+    except OSError:
+        close_redirects(streams)
+        raise
+    return streams
+
+
+def close_redirects(streams):
+
+    '''\nCloses the shell's copies of the descriptors once the child has them\n'''
+    for fd in streams.values():
+        os.close(fd)
+
+
+class Arguments(Sequence):
+
+    '''\nA builtin's arguments followed by the lines of the files given \
+with "<", read only as far as the builtin looks at them, so "cd < file" \
+reads one line however large the file is\n'''
+
+    def __init__(self, words, files, skip=0):
+        self.items = list(words)
+        self.lines = read_lines(files)
+        self.skip = skip
+        # items from here on are lines of the files
+        self.words = len(self.items)
+
+    def fill(self, count):
+        # reads input lines until there are count arguments or no more
+        while len(self.items) < self.skip + count:
+            line = next(self.lines, None)
+            if line is None:
+                break
+            self.items.append(line)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            if i.step is None and i.stop is None and (i.start or 0) >= 0:
+                # the rest of the arguments, still read lazily
+                rest = Arguments((), (), self.skip + (i.start or 0))
+                rest.items, rest.lines = self.items, self.lines
+                rest.words = self.words
+                return rest
+            return list(self)[i]
+        if i < 0:
+            return list(self)[i]
+        self.fill(i + 1)
+        if self.skip + i >= len(self.items):
+            raise IndexError('argument index out of range')
+        return self.items[self.skip + i]
+
+    def __len__(self):
+        self.fill(sys.maxsize)
+        return max(len(self.items) - self.skip, 0)
+
+    def __bool__(self):
+        self.fill(1)
+        return len(self.items) > self.skip
+
+    def __iter__(self):
+        i = 0
+        while True:
+            self.fill(i + 1)
+            if self.skip + i >= len(self.items):
+                return
+            yield self.items[self.skip + i]
+            i += 1
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def head(self, count):
+
+        '''\nReturns the arguments given on the command line followed by no \
+more than count lines of the files, as a list\n'''
+        end = max(self.words, self.skip) + count
+        self.fill(end - self.skip)
+        return self.items[self.skip:end]
+
+
+def read_lines(files):
+
+    '''\nYields the stripped, non-blank lines of each open file in turn, \
+reading a buffer at a time and closing each file when it is done\n'''
+    for f in files:
+        with f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield line
+
+
+def arguments(command, skip=0):
+
+    '''\nReturns a builtin's arguments, after the first skip, followed by \
+the lines of the files given with "<" since builtins take their input as \
+arguments. The files are opened now, so a missing one is reported before \
+the builtin runs, but only read as the arguments are used\n'''
+    files = []
+    try:
+        for fd, flags, filename in command.redirects:
+            if fd == 0:
+                files.append(open(filename, 'r'))
+    except OSError:
+        for f in files:
+            f.close()
+        raise
+    return Arguments(command.argv, files, skip)
+
+
+class OutputCache():
+
+    '''\nThe files a batch script's builtins append to with ">>", kept open \
+between lines so a script that logs every line doesn't reopen the log \
+every time, and its buffered lines go out in a few large writes\n'''
+
+    def __init__(self, size=HANDLE_CACHE_SIZE):
+        self.size = size
+        # absolute path -> open file, least recently used first
+        self.files = {}
+
+    def open(self, filename, flags):
+
+        '''\nReturns the open file for a ">>" redirection\n'''
+        # a later cd doesn't change which file a name meant
+        path = os.path.abspath(filename)
+        f = self.files.pop(path, None)
+        if f is None:
+            f = open_output(path, flags)
+            if len(self.files) >= self.size:
+                # the least recently used file makes room
+                self.files.pop(next(iter(self.files))).close()
+        self.files[path] = f
+        return f
+
+    def sync(self, command, builtin):
+
+        '''\nWrites out the buffered output before a command that could read \
+the files, which is anything but a builtin that reads no files writing \
+to files\n'''
+        fds = [fd for fd, flags, filename in command.redirects]
+        if builtin and command.pipe is None and fds and 0 not in fds \
+                and command.argv[0] in WRITE_ONLY_BUILTINS:
+            return
+        self.flush()
+
+    def flush(self):
+
+        '''\nWrites out everything still buffered\n'''
+        for f in self.files.values():
+            f.flush()
+
+    def close(self):
+
+        '''\nWrites out and closes every file, at the end of the script\n'''
+        while self.files:
+            self.files.popitem()[1].close()
+
+
+def open_output(filename, flags):
+
+    '''\nOpens a file a builtin's output is redirected to, with a buffer \
+large enough that most builtins write it in one go\n'''
+    return open(os.open(filename, flags, 0o666), 'w', buffering=BUFFER_SIZE)
+
+
+@contextmanager
+def redirect_builtin(redirects, cache=None):
+
+    '''\nPoints sys.stdout and sys.stderr at the files a builtin's output \
+is redirected to for as long as the builtin runs. In batch mode cache \
+keeps the files appended to with ">>" open for the next lines\n'''
+    saved = sys.stdout, sys.stderr
+    files = []
+    try:
+        for fd, flags, filename in redirects:
+            if fd == 0:
+                continue
+            if cache is not None and flags & os.O_APPEND:
+                f = cache.open(filename, flags)
+            else:
+                if cache is not None:
+                    # ">" empties the file, after what was appended to it
+                    cache.flush()
+                f = open_output(filename, flags)
+                files.append(f)
+            if fd == 1:
+                sys.stdout = f
+            else:
+                sys.stderr = f
+        yield
+    finally:
+        sys.stdout, sys.stderr = saved
+        for f in files:
+            f.close()
@@ -0,0 +1,163 @@
+'''
+Runs several batch files at once for "-P N", shared by SeaTurtle
+(myshell.py) and MyShell (myshell2.py). Each file runs in its own copy of
+the shell, so a cd or export in one can't affect another, and its output is
+kept apart and written out in one piece when it finishes. A table of what
+each file used and its exit status follows
+'''
+import os
+import signal
+import sys
+import time
+
+from launcher import exit_code
+from timing import Timer
+
+# Bytes of a file's output written at a time
+BLOCK_SIZE = 64 * 1024
+
+
+class Script():
+
+    '''\nA batch file given to -P, with its output and what it used once \
+it has run\n'''
+
+    def __init__(self, name):
+        self.name = name
+        self.output = None
+        self.start = None
+        self.status = None
+        self.timer = Timer()
+
+    def state(self):
+        # the exit status, or how it ended without one
+        if self.status is None:
+            return 'not run'
+        elif self.status < 0:
+            return signal.Signals(-self.status).name
+        return str(self.status)
+
+    def exit_code(self):
+        # the status a shell would give for it, as 128 + N for a signal
+        if self.status is None:
+            # stopped by Ctrl-C before it started
+            return 130
+        elif self.status < 0:
+            return 128 - self.status
+        return self.status
+
+
+def run_scripts(names, workers, run):
+
+    '''\nRuns run(name) for each batch file in a process forked from the \
+shell, up to workers at once, writing out each file's output as it \
+finishes and then the table. Returns the highest exit status\n'''
+    # only -P needs somewhere to keep the output
+    import tempfile
+    scripts = [Script(name) for name in names]
+    waiting = list(reversed(scripts))
+    # scripts still running by process id
+    running = {}
+    interrupted = False
+    first = True
+    while running or (waiting and not interrupted):
+        while waiting and not interrupted and len(running) < workers:
+            script = waiting.pop()
+            script.output = tempfile.TemporaryFile()
+            script.start = time.perf_counter()
+            running[fork_script(script, run)] = script
+        try:
+            pid, status, usage = os.wait4(-1, 0)
+        except KeyboardInterrupt:
+            # Ctrl-C reached the running files too, the rest aren't started
+            interrupted = True
+            continue
+        except ChildProcessError:
+            break
+        script = running.pop(pid, None)
+        if script is None:
+            # a child the shell started itself
+            continue
+        script.timer.real = time.perf_counter() - script.start
+        script.timer.child(usage)
+        script.status = exit_code(status)
+        show(script, first)
+        first = False
+    for line in summary(scripts):
+        print(line, file=sys.stderr)
+    return max(script.exit_code() for script in scripts)
+
+
+def fork_script(script, run):
+
+    '''\nStarts a process that runs a batch file with its standard output \
+and error going to the file's output, returns its process id\n'''
+    # anything still buffered would be written again by the child
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid:
+        return pid
+    status = 1
+    try:
+        # files run at the same time can't share standard input
+        null = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(null, 0)
+        os.dup2(script.output.fileno(), 1)
+        os.dup2(script.output.fileno(), 2)
+        # the shell's own lines are written in order with those of the
+        # processes it starts, as they are on a terminal
+        sys.stdout.reconfigure(line_buffering=True)
+        status = run(script.name)
+    except SystemExit as e:
+        # quit, or a batch file that can't be opened
+        status = exit_status(e.code)
+    except KeyboardInterrupt:
+        status = 130
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            # the rest of the files are the parent's to run
+            os._exit(0 if status is None else status & 0xFF)
+
+
+def show(script, first):
+    # writes out a finished file's output under its name, the way head
+    # does for several files
+    gap = '' if first else '\n'
+    print(f'{gap}==> {script.name} <==', flush=True)
+    with script.output as output:
+        output.seek(0)
+        for block in iter(lambda: output.read(BLOCK_SIZE), b''):
+            sys.stdout.buffer.write(block)
+    sys.stdout.buffer.flush()
+
+
+def summary(scripts):
+
+    '''\nReturns the lines of the table of what each file used, in the \
+order they were given\n'''
+    lines = [f'{"real":>9} {"user":>9} {"sys":>9} {"maxrss":>9} '
+             f'{"status":>8}  batch file']
+    for script in scripts:
+        timer = script.timer
+        lines.append(f'{timer.real:9.3f} {timer.user:9.3f} {timer.sys:9.3f} '
+                     f'{timer.maxrss:>8}K {script.state():>8}  {script.name}')
+    failed = sum(script.exit_code() != 0 for script in scripts)
+    lines.append(f'{len(scripts)} batch files, {failed} failed')
+    return lines
+
+
+def exit_status(code):
+    # the status sys.exit(code) gives a process
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    print(code, file=sys.stderr)
+    return 1
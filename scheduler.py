@@ -0,0 +1,64 @@
+'''
+Concurrent job scheduler used by batch mode when running with -j N
+'''
+import threading
+
+
+class Scheduler():
+
+    '''\nRuns independent commands on a pool of workers, \
+with at most a fixed number of them running at once\n'''
+
+    def __init__(self, workers):
+        # imported here since it pulls in logging, which most runs never need
+        from concurrent.futures import ThreadPoolExecutor
+        self.workers = workers
+        # one slot per worker, taken while a job is queued or running
+        self.slots = threading.BoundedSemaphore(workers)
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.lock = threading.Lock()
+        # exit status of the last job that failed since the previous barrier
+        self.status = 0
+
+    def submit(self, func, *args):
+
+        '''\nRuns func(*args) on a worker, blocking while all workers are busy\n'''
+        # waiting for a free slot keeps the number of queued jobs bounded,
+        # so a huge batch file is never read far ahead of what is running
+        self.slots.acquire()
+        future = self.pool.submit(func, *args)
+        future.add_done_callback(self.done)
+
+    def done(self, future):
+        # records the status of a finished job and frees its slot
+        error = future.exception()
+        if error is not None:
+            # a job that raised counts as a failure
+            print(f'Error: {error}')
+            status = 1
+        else:
+            status = future.result()
+        if status:
+            with self.lock:
+                self.status = status
+        self.slots.release()
+
+    def wait(self):
+
+        '''\nBlocks until every submitted job has finished, \
+returns the status of the last one that failed or 0\n'''
+        # holding every slot at once means no job is left running
+        for _ in range(self.workers):
+            self.slots.acquire()
+        for _ in range(self.workers):
+            self.slots.release()
+        with self.lock:
+            status, self.status = self.status, 0
+        return status
+
+    def shutdown(self):
+
+        '''\nWaits for the remaining jobs and stops the workers\n'''
+        status = self.wait()
+        self.pool.shutdown()
+        return status
@@ -0,0 +1,297 @@
+'''
+Server mode of SeaTurtle (myshell.py): "--serve PATH" keeps one shell loaded
+and runs the batch files and commands client.py sends it over a Unix
+socket. Each request runs in a worker forked from the server, with the
+client's directory, environment and standard streams, so it behaves as
+"python3 myshell.py" would without starting the interpreter again
+'''
+import marshal
+import os
+import signal
+import socket
+import struct
+import sys
+
+from client import FD_SIZE, INTERRUPT, LENGTH_SIZE, STREAMS
+from environment import environment
+from runner import exit_status
+
+# Connections waiting for a worker before more are refused
+BACKLOG = 128
+
+# Seconds a client has to send its request after connecting
+REQUEST_TIMEOUT = 10
+
+
+def receive_request(conn):
+
+    '''\nReads a request sent by client.send_request, returns it with the \
+descriptors of the client's standard streams. Raises EOFError if the \
+client hung up first\n'''
+    # socket.recv_fds needs Python 3.9
+    data, ancillary, flags, address = conn.recvmsg(
+                                        64 * 1024,
+                                        socket.CMSG_LEN(len(STREAMS) * FD_SIZE)
+                                       )
+    fds = []
+    for level, kind, fd_data in ancillary:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds += [int.from_bytes(fd_data[i:i + FD_SIZE], sys.byteorder)
+                    for i in range(0, len(fd_data) - FD_SIZE + 1, FD_SIZE)]
+    try:
+        if len(fds) != len(STREAMS):
+            raise ValueError('standard streams missing')
+        while len(data) < LENGTH_SIZE:
+            data += receive(conn)
+        length = int.from_bytes(data[:LENGTH_SIZE], 'little')
+        while len(data) < LENGTH_SIZE + length:
+            data += receive(conn)
+        request = marshal.loads(data[LENGTH_SIZE:LENGTH_SIZE + length])
+        return request['argv'], request['cwd'], request['env'], fds
+    except BaseException:
+        for fd in fds:
+            os.close(fd)
+        raise
+
+
+def receive(conn):
+    # the next bytes of a request
+    data = conn.recv(64 * 1024)
+    if not data:
+        raise EOFError('request cut short')
+    return data
+
+
+def listen(path):
+
+    '''\nReturns a socket listening at path that only its owner can use. \
+A socket left behind by a server that stopped is replaced, raises OSError \
+if another server is using it\n'''
+    import errno
+    import stat
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        mode = None
+    if mode is not None and stat.S_ISSOCK(mode):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except ConnectionRefusedError:
+            # nothing is listening on it any more
+            os.remove(path)
+        else:
+            raise OSError(errno.EADDRINUSE, 'Already being served', path)
+        finally:
+            probe.close()
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # other users can't connect, and so can't run commands as its owner
+    mask = os.umask(0o177)
+    try:
+        listener.bind(path)
+    except OSError:
+        listener.close()
+        raise
+    finally:
+        os.umask(mask)
+    listener.listen(BACKLOG)
+    return listener
+
+
+def same_user(conn):
+
+    '''\nReturns True if the client runs as the same user as the server\n'''
+    if not hasattr(socket, 'SO_PEERCRED'):
+        # the socket's permissions already keep other users out
+        return True
+    credentials = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                                  struct.calcsize('3i'))
+    pid, uid, gid = struct.unpack('3i', credentials)
+    return uid == os.getuid()
+
+
+def serve(path, workers, handle):
+
+    '''\nRuns requests sent to the Unix socket at path until the server is \
+interrupted or terminated, up to workers at once. handle(argv) runs the \
+shell with a request's options in its worker and returns the exit status. \
+Returns the server's own exit status\n'''
+    # only the server loads what waiting on several sockets needs
+    import selectors
+    try:
+        listener = listen(path)
+    except OSError as e:
+        print(f'Error: "{path}" {e.strerror.lower()}')
+        return 1
+    # a finished worker wakes the server through this pair
+    wake, wakeup = socket.socketpair()
+    wake.setblocking(False)
+    wakeup.setblocking(False)
+    signal.set_wakeup_fd(wakeup.fileno())
+    signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+    # removes the socket on kill as well as on Ctrl-C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    selector = selectors.DefaultSelector()
+    selector.register(wake, selectors.EVENT_READ)
+    # process ids of the workers still running
+    running = set()
+    accepting = False
+    print(f'Serving on {path}, Ctrl-C stops the server')
+    try:
+        while True:
+            # connections wait in the backlog while every worker is busy
+            if accepting != (len(running) < workers):
+                accepting = not accepting
+                if accepting:
+                    selector.register(listener, selectors.EVENT_READ)
+                else:
+                    selector.unregister(listener)
+            for key, events in selector.select():
+                if key.fileobj is wake:
+                    reap(wake, running)
+                    continue
+                try:
+                    conn, address = listener.accept()
+                except OSError:
+                    # the client gave up before it was accepted
+                    continue
+                with conn:
+                    if same_user(conn):
+                        running.add(fork_worker(conn, handle,
+                                                (listener, wake, wakeup)))
+    except KeyboardInterrupt:
+        print()
+    finally:
+        signal.set_wakeup_fd(-1)
+        selector.close()
+        listener.close()
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    return 0
+
+
+def reap(wake, running):
+    # collects every worker that has finished
+    try:
+        while wake.recv(4096):
+            pass
+    except BlockingIOError:
+        pass
+    while running:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            running.clear()
+            break
+        if not pid:
+            break
+        running.discard(pid)
+
+
+def fork_worker(conn, handle, sockets):
+
+    '''\nStarts a worker process for a new connection, returns its process \
+id. The worker never returns\n'''
+    # anything still buffered would be written again by the worker
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid:
+        return pid
+    status = 1
+    try:
+        for sock in sockets:
+            sock.close()
+        status = work(conn, handle)
+    finally:
+        # the server's own clean up mustn't run in the worker
+        os._exit(status & 0xFF)
+
+
+def work(conn, handle):
+
+    '''\nRuns a request in a worker, sends its exit status to the client \
+and returns it\n'''
+    # Ctrl-C from the client reaches the worker and everything it started,
+    # but not the server or other requests
+    os.setpgid(0, 0)
+    signal.set_wakeup_fd(-1)
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    conn.settimeout(REQUEST_TIMEOUT)
+    try:
+        argv, cwd, env, fds = receive_request(conn)
+    except (OSError, EOFError, ValueError, TypeError, KeyError):
+        # a client that hung up or isn't client.py
+        return 1
+    conn.settimeout(None)
+    for target, fd in zip(STREAMS, fds):
+        os.dup2(fd, target)
+        os.close(fd)
+    # the output is buffered as it would be for "python3 myshell.py"
+    sys.stdout.reconfigure(line_buffering=sys.stdout.isatty())
+    finished = watch(conn)
+    try:
+        os.chdir(cwd)
+    except OSError as e:
+        print(f'Error: "{cwd}" {e.strerror.lower()}')
+        return finish(conn, finished, 1)
+    environment.replace(env)
+    status = 1
+    try:
+        status = handle(argv)
+    except SystemExit as e:
+        # quit, or an argument error
+        status = exit_status(e.code)
+    except KeyboardInterrupt:
+        status = 130
+    except Exception:
+        import traceback
+        traceback.print_exc()
+    return finish(conn, finished, status)
+
+
+def finish(conn, finished, status):
+    # sends the exit status of a request, once its output is written
+    status = 0 if status is None else status & 0xFF
+    try:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    except OSError:
+        pass
+    # hanging up after the status has been sent leaves background jobs
+    # running, as they are when a batch file ends
+    finished.append(True)
+    try:
+        conn.sendall(status.to_bytes(LENGTH_SIZE, 'little'))
+    except OSError:
+        pass
+    return status
+
+
+def watch(conn):
+
+    '''\nPasses each Ctrl-C sent by the client on to the worker's process \
+group, and hangs the group up if the client goes away before the request \
+finishes. Returns a list that stops this once something is added to it\n'''
+    import threading
+    finished = []
+
+    def read():
+        while True:
+            try:
+                data = conn.recv(64)
+            except OSError:
+                data = b''
+            if finished:
+                return
+            if not data:
+                os.killpg(0, signal.SIGHUP)
+                return
+            if INTERRUPT in data:
+                os.killpg(0, signal.SIGINT)
+
+    threading.Thread(target=read, daemon=True).start()
+    return finished
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+'''
+Start-up budget check for batch runs: starts each shell on an empty batch
+file under "python -X importtime", reports what the imports cost on top
+of the bare interpreter and fails if they go over budget or if a module
+only needed by interactive sessions was loaded. Also times the same batch
+file sent by client.py to a SeaTurtle server
+'''
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# The shells checked, relative to this file
+SHELLS = ('myshell.py', 'myshell2.py')
+
+# Milliseconds the shell's own imports may add to the interpreter's
+BUDGET_MS = 30
+
+# Modules a batch run must not import, they are loaded when a
+# terminal session starts or an option asks for them
+INTERACTIVE = (
+               'argparse',
+               'asyncio',
+               'completion',
+               'concurrent.futures',
+               'engine',
+               'getpass',
+               'readline',
+               'subprocess',
+               'termios',
+               'tty',
+              )
+
+# Number of timed start-ups per shell
+RUNS = 20
+
+
+def import_times(argv):
+
+    '''\nRuns a command under -X importtime, returns \
+{module: (self us, cumulative us, True if imported by the script itself)}\n'''
+    result = subprocess.run(
+                            [sys.executable, '-X', 'importtime'] + argv,
+                            stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE,
+                            text=True
+                           )
+    times = {}
+    for line in result.stderr.splitlines():
+        # import time:   self [us] |  cumulative | imported package
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        try:
+            own, cumulative = int(fields[0]), int(fields[1])
+        except ValueError:
+            # the header line
+            continue
+        # nested imports are indented below the one that caused them
+        name = fields[2][1:]
+        times[name.strip()] = (own, cumulative, not name.startswith(' '))
+    return times
+
+
+def wall_time(argv, env=None):
+
+    '''\nReturns the median time in ms to run a command start to finish\n'''
+    samples = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + argv, env=env,
+                       stdout=subprocess.DEVNULL)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def check(shell, batch, bare):
+
+    '''\nReports one shell's start-up, returns True if it is within budget\n'''
+    times = import_times([shell, batch])
+    # modules the interpreter imports anyway aren't the shell's cost
+    extra = {name: t for name, t in times.items() if name not in bare}
+    cost = sum(t[0] for t in extra.values()) / 1000
+    loaded = [name for name in INTERACTIVE if name in times]
+    print(f'{os.path.basename(shell)}: {cost:.1f} ms of imports '
+          f'(budget {BUDGET_MS} ms), '
+          f'{wall_time([shell, batch]):.1f} ms to run an empty batch file')
+    # the top level imports that cost the most, with what they import
+    top = sorted(
+                 (name for name in extra if extra[name][2]),
+                 key=lambda name: extra[name][1],
+                 reverse=True
+                )
+    for name in top[:8]:
+        print(f'    {extra[name][1] / 1000:6.1f} ms  {name}')
+    for name in loaded:
+        print(f'    Error: {name} was imported by a batch run')
+    return cost <= BUDGET_MS and not loaded
+
+
+def served(shell, batch):
+
+    '''\nReports how long a batch file takes through client.py, with the \
+shell already running as a server\n'''
+    client = os.path.join(os.path.dirname(shell), 'client.py')
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'shell.sock')
+        server = subprocess.Popen([sys.executable, shell, '--serve', path],
+                                  stdout=subprocess.PIPE)
+        try:
+            # the server says when it is listening
+            server.stdout.readline()
+            cost = wall_time([client, path, batch])
+        finally:
+            server.terminate()
+            server.wait()
+    print(f'{os.path.basename(shell)} --serve: {cost:.1f} ms to run an empty '
+          f'batch file with client.py')
+
+
+def main():
+    here = os.path.dirname(os.path.abspath(__file__))
+    bare = import_times(['-c', 'pass'])
+    print(f'python: {wall_time(["-c", "pass"]):.1f} ms to start')
+    ok = True
+    with tempfile.NamedTemporaryFile('w', suffix='.txt') as batch:
+        for shell in SHELLS:
+            ok = check(os.path.join(here, shell), batch.name, bare) and ok
+        served(os.path.join(here, 'myshell.py'), batch.name)
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
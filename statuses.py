@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+'''
+Exit status check for batch runs: runs each shell on batch files whose exit
+status is known, one at a time, together with -P, and for SeaTurtle with -c
+and through client.py and --serve, and fails if any status or -P's table
+differs from what is expected
+'''
+import os
+import subprocess
+import sys
+import tempfile
+
+# The shells checked, relative to this file
+SHELLS = ('myshell.py', 'myshell2.py')
+
+# Batch files and the status each should exit with
+CASES = (
+         ('true', 0),
+         ('false', 1),
+         ('nosuchcommand', 127),
+         ('echo "unterminated', 2),
+         ('false\ntrue', 0),
+         ('true\nfalse', 1),
+         ('sh -c "exit 3"', 3),
+         # a job that finished before wait keeps its status
+         ('sh -c "exit 3" &\nsleep 0.3\nwait', 3),
+         ('sh -c "exit 3" &\nsleep 0.3\nwait 1', 3),
+         ('sh -c "exit 3" &\nwait', 3),
+         ('sh -c "exit 3" &\nsleep 0.3\njobs\nwait 1', 127),
+         ('time false', 1),
+         ('cd missing-directory', 1),
+         ('dir missing-directory', 1),
+         ('quit\nfalse', 0),
+         # more reads what the lines before it appended
+         ('rm -f log copy\necho a >> log\necho b >> log\nmore log >> copy\n'
+          'grep -qx b copy', 0),
+        )
+
+
+def run(argv, directory):
+
+    '''\nRuns a Python script in directory, returns its status and standard \
+error\n'''
+    result = subprocess.run(
+                            [sys.executable] + argv,
+                            cwd=directory,
+                            stdin=subprocess.DEVNULL,
+                            stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE,
+                            text=True
+                           )
+    return result.returncode, result.stderr
+
+
+def check_parallel(shell, names, directory):
+
+    '''\nRuns every case at once with -P, returns a list of the differences\n'''
+    status, table = run([shell, '-P', '3'] + names, directory)
+    errors = []
+    worst = max(expected for text, expected in CASES)
+    if status != worst:
+        errors.append(f'-P exited {status}, not {worst}')
+    # the table's rows end with the status and the name of each file
+    rows = {}
+    for line in table.splitlines():
+        fields = line.split()
+        if len(fields) == 6:
+            rows[fields[5]] = fields[4]
+    for name, (text, expected) in zip(names, CASES):
+        if rows.get(name) != str(expected):
+            errors.append(f'-P listed {name} as {rows.get(name)}, '
+                          f'not {expected}')
+    failed = sum(expected != 0 for text, expected in CASES)
+    if f'{len(CASES)} batch files, {failed} failed' not in table:
+        errors.append(f'-P did not count {failed} failed files')
+    return errors
+
+
+def check_missing(shell, directory):
+
+    '''\nRuns -P on a batch file that doesn't exist, returns a list of the \
+differences\n'''
+    result = subprocess.run(
+                            [sys.executable, shell, '-P', '2', 'case1.txt',
+                             'missing.txt'],
+                            cwd=directory,
+                            stdin=subprocess.DEVNULL,
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT,
+                            text=True
+                           )
+    errors = []
+    if result.returncode != 1:
+        errors.append(f'-P with a missing file exited {result.returncode}, '
+                      f'not 1')
+    if 'Traceback' in result.stdout:
+        errors.append('-P with a missing file wrote a traceback')
+    return errors
+
+
+def check_served(shell, directory):
+
+    '''\nRuns every case through client.py, returns a list of the \
+differences\n'''
+    client = os.path.join(os.path.dirname(shell), 'client.py')
+    path = os.path.join(directory, 'shell.sock')
+    server = subprocess.Popen([sys.executable, shell, '--serve', path],
+                              stdout=subprocess.PIPE)
+    errors = []
+    try:
+        # the server says when it is listening
+        server.stdout.readline()
+        for text, expected in CASES:
+            status, stderr = run([client, path, '-c', text], directory)
+            if status != expected:
+                errors.append(f'client.py -c {text!r} exited {status}, '
+                              f'not {expected}')
+    finally:
+        server.terminate()
+        server.wait()
+    return errors
+
+
+def check(shell, directory):
+
+    '''\nRuns the cases with one shell, returns a list of the differences\n'''
+    names = []
+    errors = []
+    for number, (text, expected) in enumerate(CASES, 1):
+        name = f'case{number}.txt'
+        with open(os.path.join(directory, name), 'w') as f:
+            f.write(text + '\n')
+        names.append(name)
+        status, stderr = run([shell, name], directory)
+        if status != expected:
+            errors.append(f'{text!r} exited {status}, not {expected}')
+        if shell.endswith('myshell.py'):
+            status, stderr = run([shell, '-c', text], directory)
+            if status != expected:
+                errors.append(f'-c {text!r} exited {status}, not {expected}')
+    errors += check_parallel(shell, names, directory)
+    errors += check_missing(shell, directory)
+    if shell.endswith('myshell.py'):
+        errors += check_served(shell, directory)
+    return errors
+
+
+def main():
+    here = os.path.dirname(os.path.abspath(__file__))
+    failed = 0
+    for shell in SHELLS:
+        with tempfile.TemporaryDirectory() as directory:
+            errors = check(os.path.join(here, shell), directory)
+        for error in errors:
+            print(f'{shell}: Error: {error}')
+        failed += len(errors)
+        print(f'{shell}: {len(errors)} of the exit statuses differ')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
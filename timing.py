@@ -0,0 +1,190 @@
+'''
+The "time" prefix and the stats builtin shared by SeaTurtle (myshell.py) and
+MyShell (myshell2.py): the wall time, CPU time and peak memory of each command
+'''
+import heapq
+import os
+import resource
+import sys
+import threading
+import time
+
+from cmdparse import Command
+
+# What "time" prints when $TIMEFORMAT isn't set, like bash's with the
+# peak memory added
+DEFAULT_FORMAT = '\nreal\t%3lR\nuser\t%3lU\nsys\t%3lS\nmaxrss\t%MK'
+
+# Number of the most expensive commands stats remembers
+STATS_SIZE = 100
+
+# The timers running on each thread, innermost last, which are told
+# about each child process a pipeline on that thread waits for
+_local = threading.local()
+
+
+class Timer():
+
+    '''\nMeasures a command from entering to leaving a with block: real \
+time, user and sys CPU time of the shell and of the child processes it \
+waited for, and the peak RSS in KB of the largest of those children, \
+or of the shell itself if the command started none\n'''
+
+    def __init__(self):
+        self.real = self.user = self.sys = 0.0
+        self.maxrss = 0
+        self.children = 0
+
+    def __enter__(self):
+        if not hasattr(_local, 'timers'):
+            _local.timers = []
+        _local.timers.append(self)
+        self.own = resource.getrusage(resource.RUSAGE_SELF)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.real = time.perf_counter() - self.start
+        own = resource.getrusage(resource.RUSAGE_SELF)
+        _local.timers.remove(self)
+        # builtins run in the shell, so its own time counts too
+        self.user += own.ru_utime - self.own.ru_utime
+        self.sys += own.ru_stime - self.own.ru_stime
+        if not self.children:
+            self.maxrss = own.ru_maxrss
+        return False
+
+    def child(self, usage):
+        # adds what a child process used, as returned by os.wait4. Linux
+        # keeps the peak RSS a child had before exec, which for one started
+        # by posix_spawn is the shell's, so it is never below the shell's
+        self.children += 1
+        self.user += usage.ru_utime
+        self.sys += usage.ru_stime
+        self.maxrss = max(self.maxrss, usage.ru_maxrss)
+
+
+def child_exited(usage):
+
+    '''\nAdds a finished child's resource usage to every timer running \
+on this thread\n'''
+    for timer in getattr(_local, 'timers', ()):
+        timer.child(usage)
+
+
+def split_time(command):
+
+    '''\nTakes a "time" prefix off a parsed command, returns the command \
+to run (None if "time" was all there was) and whether it is timed\n'''
+    if not command.argv or command.argv[0] != 'time':
+        return command, False
+    if len(command.argv) == 1 and not command.redirects \
+            and command.pipe is None:
+        return None, True
+    # parsed commands are cached, so the prefix is left out of a copy
+    return Command(
+                   command.argv[1:],
+                   command.redirects,
+                   command.background,
+                   command.pipe
+                  ), True
+
+
+def format_time(timer, fmt=None):
+
+    '''\nFormats a Timer with $TIMEFORMAT, or fmt if given. %R, %U and %S \
+are the real, user and sys seconds, with an optional number of decimals \
+(0 to 3) and l for minutes and seconds, %P is the CPU percentage, %M the \
+peak RSS in KB and %% a percent sign\n'''
+    # only needed once a command has been timed
+    import re
+    if fmt is None:
+        fmt = os.environ.get('TIMEFORMAT', DEFAULT_FORMAT)
+
+    def field(match):
+        digits, long, key = match.groups()
+        if key == '%':
+            return '%'
+        elif key == 'M':
+            return str(timer.maxrss)
+        elif key == 'P':
+            cpu = timer.user + timer.sys
+            return f'{100 * cpu / timer.real if timer.real else 0:.2f}'
+        seconds = {'R': timer.real, 'U': timer.user, 'S': timer.sys}[key]
+        decimals = min(int(digits), 3) if digits else 3
+        if long:
+            minutes, seconds = divmod(seconds, 60)
+            return f'{int(minutes)}m{seconds:.{decimals}f}s'
+        return f'{seconds:.{decimals}f}'
+
+    return re.sub(r'%(\d?)(l?)([RUSPM%])', field, fmt)
+
+
+def report(timer):
+
+    '''\nWrites a timed command's usage to stderr, so it isn't mixed into \
+a redirected output. An empty $TIMEFORMAT writes nothing\n'''
+    text = format_time(timer)
+    if text:
+        sys.stderr.write(text + '\n')
+        sys.stderr.flush()
+
+
+class Stats():
+
+    '''\nTotals of every command the session has run, and the ones \
+that took longest\n'''
+
+    def __init__(self):
+        self.clear()
+
+    def add(self, text, timer):
+
+        '''\nRecords a finished command line and its Timer\n'''
+        self.count += 1
+        self.real += timer.real
+        self.user += timer.user
+        self.sys += timer.sys
+        # a heap of the slowest, the quickest of them first, so a faster
+        # command is turned away in O(log STATS_SIZE)
+        item = (timer.real, self.count, text, timer)
+        if len(self.slowest) < STATS_SIZE:
+            heapq.heappush(self.slowest, item)
+        elif item > self.slowest[0]:
+            heapq.heapreplace(self.slowest, item)
+
+    def top(self, count):
+
+        '''\nReturns (real, number, text, timer) for the count commands \
+that took longest, slowest first\n'''
+        return heapq.nlargest(count, self.slowest)
+
+    def clear(self):
+
+        '''\nForgets every command recorded so far\n'''
+        self.count = 0
+        self.real = self.user = self.sys = 0.0
+        self.slowest = []
+
+
+def stats_builtin(stats, args):
+
+    '''\nLists the N commands that took longest (10 by default) with the \
+session's totals, or forgets them with -c, returns the lines to print \
+and the exit status\n'''
+    if args and args[0] == '-c':
+        stats.clear()
+        return [], 0
+    count = 10
+    if args:
+        try:
+            count = int(args[0])
+        except ValueError:
+            return [f'Error: "{args[0]}" is not a number'], 2
+    lines = [f'{"real":>9} {"user":>9} {"sys":>9} {"maxrss":>9}  command']
+    for real, number, text, timer in stats.top(count):
+        lines.append(f'{real:9.3f} {timer.user:9.3f} {timer.sys:9.3f} '
+                     f'{timer.maxrss:>8}K  {text}')
+    lines.append(f'{stats.real:9.3f} {stats.user:9.3f} {stats.sys:9.3f} '
+                 f'{"":9}  {stats.count} commands in total')
+    return lines, 0